@@ -1,5 +1,9 @@
 from django.contrib import admin
-from core.super.models import Brand, Category, PaymentMethod, Customer, Seller, Product, Sale, SaleDetail
+from core.super.models import (
+    Brand, Category, PaymentMethod, Customer, Seller, Product, Sale, SaleDetail, SaleEvent, InventoryMovement, InventorySnapshot,
+    SalesRollupState, DailyPaymentRollup, DailySellerRollup, DailyCustomerRollup, DailyProductRollup, DailyCategoryRollup,
+    ReportExportJob,
+)
 
 admin.site.register(Brand)
 admin.site.register(Category)
@@ -9,11 +13,13 @@ admin.site.register(Seller)
 admin.site.register(Product)
 admin.site.register(Sale)
 admin.site.register(SaleDetail)
-
-
-
-
-
-
-
-
+admin.site.register(SaleEvent)
+admin.site.register(InventoryMovement)
+admin.site.register(InventorySnapshot)
+admin.site.register(SalesRollupState)
+admin.site.register(DailyPaymentRollup)
+admin.site.register(DailySellerRollup)
+admin.site.register(DailyCustomerRollup)
+admin.site.register(DailyProductRollup)
+admin.site.register(DailyCategoryRollup)
+admin.site.register(ReportExportJob)
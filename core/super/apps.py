@@ -5,5 +5,9 @@ class SuperConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core.super'
 
+    def ready(self):
+        # Registra los receivers de invalidación de caché.
+        from core.super import signals  # noqa: F401
+
 
 
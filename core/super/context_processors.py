@@ -1,11 +1,6 @@
-from core.super.models import Cart
+from core.super.services.cart_count_service import CartCountService
 
 def cart_count_processor(request):
-    if request.user.is_authenticated:
-        try:
-            cart = Cart.objects.get(user=request.user)
-            # Retornamos el conteo de items (productos únicos)
-            return {'cart_count': cart.get_item_count()}
-        except Cart.DoesNotExist:
-            return {'cart_count': 0}
-    return {'cart_count': 0}
\ No newline at end of file
+    # Retornamos el conteo de items (productos únicos) desde la caché:
+    # ninguna query a las tablas del carrito en un render normal.
+    return {'cart_count': CartCountService().get(request.user)}
@@ -0,0 +1,83 @@
+import random
+import time
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from core.super.models import PaymentMethod, Product, ProductAffinity, Sale, SaleDetail
+from core.super.services.market_basket_service import MarketBasketService, ENGINES, ENGINE_SQL
+
+BENCH_MARKER = 'BENCH-BASKET'
+LINES_PER_SALE = 4
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara la reconstrucción de afinidad de productos con el motor SQL '
+        '(auto-join dentro de la base) y con el recorrido en Python. Con --seed '
+        'crea líneas de venta temporales antes de medir (por ejemplo --seed 1000000) '
+        'y las borra al terminar.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help='Líneas de venta temporales a crear (0 = usar las existentes).')
+        parser.add_argument('--products', type=int, default=500, help='Catálogo sobre el que se reparten las líneas sembradas.')
+        parser.add_argument('--runs', type=int, default=3)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            self.stdout.write(self.style.WARNING('  ! Sin PostgreSQL: los tiempos no son representativos.'))
+
+        if options['seed']:
+            self._seed(options['seed'], options['products'])
+        service = MarketBasketService()
+        try:
+            self.stdout.write(f'  Líneas de venta: {SaleDetail.objects.count():,}')
+            self.stdout.write(f"{'motor':>10} {'mejor (ms)':>12} {'promedio (ms)':>14} {'afinidades':>11}")
+            results = {}
+            for engine in ENGINES:
+                times = []
+                for _ in range(options['runs']):
+                    started = time.perf_counter()
+                    count = service.recalculate_all(engine=engine)
+                    times.append((time.perf_counter() - started) * 1000)
+                results[engine] = set(ProductAffinity.objects.values_list('product_a_id', 'product_b_id', 'co_occurrence_count'))
+                self.stdout.write(f'{engine:>10} {min(times):>12.1f} {sum(times) / len(times):>14.1f} {count:>11,}')
+
+            if len(set(map(frozenset, results.values()))) == 1:
+                self.stdout.write(self.style.SUCCESS('  ✓ Los dos motores producen las mismas afinidades.'))
+            else:
+                self.stdout.write(self.style.ERROR('  ✗ Los motores producen afinidades distintas.'))
+        finally:
+            if options['seed']:
+                Sale.objects.filter(card_number_masked=BENCH_MARKER).delete()
+                # Las tablas quedaron con los datos sembrados: se reconstruyen sobre el historial real.
+                service.recalculate_all(engine=ENGINE_SQL)
+        self.stdout.write(self.style.SUCCESS('  ✓ Benchmark terminado.'))
+
+    def _seed(self, lines, product_count):
+        """bulk_create: no pasa por el outbox, así que los conteos incrementales no cambian."""
+        payment = PaymentMethod.objects.first() or PaymentMethod.objects.create(name='Efectivo')
+        products = list(Product.objects.all()[:product_count])
+        products += [
+            Product.objects.create(name=f'Producto {i}', price=Decimal('1.50'), stock=0)
+            for i in range(len(products), product_count)
+        ]
+        # Pocos productos muy vendidos y una cola larga, como en un súper real.
+        weights = [1 / (rank + 1) for rank in range(len(products))]
+        now = timezone.now()
+
+        sales_total = lines // LINES_PER_SALE
+        for start in range(0, sales_total, 5000):
+            sales = Sale.objects.bulk_create([
+                Sale(payment=payment, sale_date=now, total=Decimal('6.00'), card_number_masked=BENCH_MARKER)
+                for _ in range(min(5000, sales_total - start))
+            ])
+            details = []
+            for sale in sales:
+                for product in set(random.choices(products, weights=weights, k=LINES_PER_SALE)):
+                    details.append(SaleDetail(sale=sale, product=product, quantity=1, price=product.price, subtotal=product.price))
+            SaleDetail.objects.bulk_create(details)
+        self.stdout.write(self.style.SUCCESS(f'  ✓ {sales_total:,} ventas temporales creadas.'))
@@ -0,0 +1,105 @@
+import random
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.utils import timezone
+
+from core.super.models import Customer, PaymentMethod, Product, Sale, SaleDetail, Seller
+from core.super.services.report_service import SalesReport
+from core.super.services.sale_filter import SaleFilter
+
+BENCH_MARKER = 'BENCH-REPORTS'
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara el tiempo de las secciones del reporte calculadas en serie y en '
+        'paralelo (ReportEngine) sobre las tablas crudas. Con --seed crea ventas '
+        'temporales antes de medir y las borra al terminar. Requiere PostgreSQL '
+        'para que el paralelismo y GROUPING SETS muestren diferencia.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help='Ventas temporales a crear (0 = usar las existentes).')
+        parser.add_argument('--days', type=int, default=30)
+        parser.add_argument('--runs', type=int, default=5)
+
+    def handle(self, *args, **options):
+        if connection.vendor != 'postgresql':
+            self.stdout.write(self.style.WARNING('  ! Sin PostgreSQL: el paralelo no es representativo.'))
+
+        today = timezone.localdate()
+        created = []
+        try:
+            if options['seed']:
+                self._seed(options['seed'], options['days'], created)
+            report = SalesReport(SaleFilter(today - timedelta(days=options['days']), today))
+            # Se mide el peor caso: todas las secciones contra Sale / SaleDetail.
+            report.use_rollups = False
+            self.stdout.write(f'  Ventas en el período: {report.sales.count():,}')
+            self.stdout.write(f"{'modo':>10} {'mejor (ms)':>12} {'promedio (ms)':>14}")
+            for label, parallel in (('serie', False), ('paralelo', True)):
+                times = self._measure(report, parallel, options['runs'])
+                self.stdout.write(f'{label:>10} {min(times):>12.1f} {sum(times) / len(times):>14.1f}')
+        finally:
+            if options['seed']:
+                self._cleanup(created)
+        self.stdout.write(self.style.SUCCESS('  ✓ Benchmark terminado.'))
+
+    def _measure(self, report, parallel, runs):
+        times = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            report.collect(top_products=15, top_categories=10, top_sellers=5, top_customers=5, parallel=parallel)
+            times.append((time.perf_counter() - started) * 1000)
+        return times
+
+    def _seed(self, count, days, created):
+        """
+        bulk_create: no pasa por el outbox, así que los rollups no cambian.
+        Las formas de pago y productos que tenga que crear se agregan a
+        `created` para que _cleanup los borre.
+        """
+        payments = list(PaymentMethod.objects.all())
+        if not payments:
+            payments = [PaymentMethod.objects.create(name='Efectivo')]
+            created.extend(payments)
+        products = list(Product.objects.all()[:200])
+        if not products:
+            for i in range(20):
+                products.append(Product.objects.create(name=f'Producto {i}', price=Decimal('1.50'), stock=0))
+                created.append(products[-1])
+        sellers = list(Seller.objects.all()) + [None]
+        customers = list(Customer.objects.all()[:500]) + [None]
+        now = timezone.now()
+
+        for start in range(0, count, 5000):
+            batch = []
+            for _ in range(min(5000, count - start)):
+                batch.append(Sale(
+                    payment=random.choice(payments),
+                    seller=random.choice(sellers),
+                    customer=random.choice(customers),
+                    sale_date=now - timedelta(days=random.random() * days),
+                    total=Decimal(random.randint(100, 10000)) / 100,
+                    card_number_masked=BENCH_MARKER,
+                ))
+            sales = Sale.objects.bulk_create(batch)
+            lines = []
+            for sale in sales:
+                for product in random.sample(products, min(3, len(products))):
+                    lines.append(SaleDetail(
+                        sale=sale, product=product, quantity=random.randint(1, 5),
+                        price=product.price, subtotal=product.price,
+                    ))
+            SaleDetail.objects.bulk_create(lines)
+        self.stdout.write(self.style.SUCCESS(f'  ✓ {count:,} ventas temporales creadas.'))
+
+    def _cleanup(self, created):
+        """Borra las ventas temporales y después lo que _seed creó para ellas."""
+        Sale.objects.filter(card_number_masked=BENCH_MARKER).delete()
+        for model in (Product, PaymentMethod):
+            model.objects.filter(pk__in=[obj.pk for obj in created if isinstance(obj, model)]).delete()
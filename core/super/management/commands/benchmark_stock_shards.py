@@ -0,0 +1,61 @@
+import threading
+import time
+from decimal import Decimal
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from core.super.models import Product
+from core.super.services.checkout_service import decrement_stock
+from core.super.services.stock_shard_service import StockShardService
+
+
+class Command(BaseCommand):
+    help = (
+        'Mide ventas por segundo sobre UN producto con N hilos concurrentes, '
+        'sin shards y con 1, 4 y 16 shards. Requiere PostgreSQL: SQLite '
+        'serializa todas las escrituras y no muestra diferencia.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--shards', type=int, nargs='+', default=[1, 4, 16])
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--seconds', type=float, default=5.0)
+        parser.add_argument('--hold-ms', type=float, default=5.0,
+                            help='Tiempo que cada venta mantiene la transacción abierta (resto del checkout).')
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite':
+            self.stdout.write(self.style.WARNING('  ! SQLite serializa las escrituras: los números no son representativos.'))
+
+        self.stdout.write(f"{'shards':>8} {'ventas':>8} {'ventas/s':>10}")
+        for shards in [0] + options['shards']:
+            product = Product.objects.create(name=f'__benchmark_{shards}', price=Decimal('1.00'), stock=10_000_000)
+            try:
+                if shards:
+                    StockShardService().enable(product, shards)
+                sales = self._run(product.pk, options['threads'], options['seconds'], options['hold_ms'] / 1000)
+            finally:
+                product.delete()
+            label = shards or 'sin'
+            self.stdout.write(f"{label:>8} {sales:>8} {sales / options['seconds']:>10.1f}")
+        self.stdout.write(self.style.SUCCESS('  ✓ Benchmark terminado.'))
+
+    def _run(self, product_id, threads, seconds, hold):
+        deadline = time.monotonic() + seconds
+        counts = [0] * threads
+
+        def worker(n):
+            try:
+                while time.monotonic() < deadline:
+                    with transaction.atomic():
+                        decrement_stock({product_id: 1})
+                        time.sleep(hold)
+                    counts[n] += 1
+            finally:
+                connection.close()
+
+        pool = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+        for thread in pool:
+            thread.start()
+        for thread in pool:
+            thread.join()
+        return sum(counts)
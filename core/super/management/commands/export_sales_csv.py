@@ -0,0 +1,55 @@
+import sys
+import time
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from core.super.services.csv_export_service import SalesCsvExporter, SALES, LINES
+from core.super.services.sale_filter import SaleFilter
+
+
+class Command(BaseCommand):
+    help = (
+        'Exporta las ventas (o sus líneas) a CSV comprimido con gzip, con los '
+        'mismos filtros que la página de reportes. Memoria constante sin '
+        'importar la cantidad de filas.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--kind', choices=[SALES, LINES], default=SALES,
+                            help='sales = una fila por venta; lines = una fila por línea de venta.')
+        parser.add_argument('--output', '-o', default=None,
+                            help='Archivo destino (.csv.gz). Por defecto el nombre sugerido; "-" = salida estándar.')
+        parser.add_argument('--from', dest='date_from', help='Desde (YYYY-MM-DD). Sin fechas: todo el histórico.')
+        parser.add_argument('--to', dest='date_to', help='Hasta (YYYY-MM-DD, inclusive).')
+        parser.add_argument('--payment', default='', help='Forma de pago (id o nombre).')
+        parser.add_argument('--seller', default='', help='Id de vendedor.')
+        parser.add_argument('--customer', default='', help='Id de cliente.')
+        parser.add_argument('--min-total', default='', help='Total mínimo por venta.')
+        parser.add_argument('--max-total', default='', help='Total máximo por venta.')
+        parser.add_argument('--chunk-size', type=int, default=None, help='Filas por bloque leído de la BD.')
+
+    def handle(self, *args, **options):
+        try:
+            date_from = date.fromisoformat(options['date_from']) if options['date_from'] else None
+            date_to = date.fromisoformat(options['date_to']) if options['date_to'] else None
+        except ValueError as e:
+            raise CommandError(f'Fecha inválida: {e}')
+
+        sale_filter = SaleFilter(
+            date_from, date_to,
+            payment=options['payment'], seller=options['seller'], customer=options['customer'],
+            min_total=options['min_total'], max_total=options['max_total'],
+        )
+        exporter = SalesCsvExporter(sale_filter, options['kind'])
+        if options['chunk_size']:
+            exporter.chunk_size = options['chunk_size']
+
+        output = options['output'] or exporter.filename()
+        started = time.monotonic()
+        if output == '-':
+            exporter.write(sys.stdout.buffer)
+            sys.stdout.buffer.flush()
+            return
+        with open(output, 'wb') as fileobj:
+            written = exporter.write(fileobj)
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(f'  ✓ {output}: {written / 1024:,.0f} KB en {elapsed:.1f}s.'))
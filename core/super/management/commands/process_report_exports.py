@@ -0,0 +1,49 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from core.super.models import ReportExportJob
+from core.super.services.report_job_service import ReportJobService
+
+
+class Command(BaseCommand):
+    help = (
+        'Genera las exportaciones de reportes encoladas desde la página de '
+        'reportes. Se pueden correr varios workers en paralelo: cada uno '
+        'reclama un trabajo distinto (SKIP LOCKED).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Vaciar la cola y terminar (para cron); sin esto queda escuchando.')
+        parser.add_argument('--sleep', type=float, default=2.0,
+                            help='Segundos de espera cuando la cola está vacía.')
+        parser.add_argument('--purge-days', type=int, default=None,
+                            help='Antes de procesar, borrar exportaciones terminadas hace más de N días (con su archivo).')
+
+    def handle(self, *args, **options):
+        service = ReportJobService()
+
+        if options['purge_days'] is not None:
+            count = service.purge(timedelta(days=options['purge_days']))
+            self.stdout.write(self.style.SUCCESS(f'  ✓ {count} exportaciones viejas borradas.'))
+
+        self.stdout.write('Procesando exportaciones de reportes...')
+        done = failed = 0
+        try:
+            while True:
+                job = service.run_next()
+                if job is not None:
+                    if job.status == ReportExportJob.Status.DONE:
+                        done += 1
+                        self.stdout.write(f'  · exportación #{job.pk} lista: {job.file.name}')
+                    else:
+                        failed += 1
+                        self.stdout.write(self.style.WARNING(f'  ! exportación #{job.pk} falló: {job.error}'))
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(f'  ✓ {done} exportaciones generadas, {failed} fallidas.'))
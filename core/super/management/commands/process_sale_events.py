@@ -0,0 +1,59 @@
+import time
+from datetime import timedelta
+from django.core.management.base import BaseCommand
+from core.super.services.sale_event_service import (
+    SaleEventService, SALE_EVENT_CONSUMERS, DEFAULT_BATCH_SIZE,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Procesa el outbox de eventos de venta (SaleEvent) y actualiza los '
+        'datos derivados de forma incremental. Se pueden correr varios '
+        'workers en paralelo: cada uno reclama lotes distintos (SKIP LOCKED).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help='Eventos por lote (por defecto %(default)s).')
+        parser.add_argument('--once', action='store_true',
+                            help='Vaciar la cola y terminar (para cron); sin esto queda escuchando.')
+        parser.add_argument('--sleep', type=float, default=2.0,
+                            help='Segundos de espera cuando la cola está vacía.')
+        parser.add_argument('--only', choices=sorted(SALE_EVENT_CONSUMERS), action='append',
+                            help='Ejecutar solo estos consumidores (repetible). Los eventos quedan '
+                                 'pendientes para el resto hasta que una corrida completa los aplique.')
+        parser.add_argument('--purge-days', type=int, default=None,
+                            help='Antes de procesar, borrar eventos procesados hace más de N días.')
+
+    def handle(self, *args, **options):
+        service = SaleEventService()
+        consumers = None
+        if options['only']:
+            consumers = [SALE_EVENT_CONSUMERS[name]() for name in options['only']]
+
+        if options['purge_days'] is not None:
+            count = service.purge_processed(timedelta(days=options['purge_days']))
+            self.stdout.write(self.style.SUCCESS(f'  ✓ {count} eventos procesados purgados.'))
+
+        self.stdout.write('Procesando eventos de venta...')
+        total = 0
+        try:
+            while True:
+                # Cuenta intentados, no exitosos: un lote que falla entero no
+                # corta --once (cada evento suma un intento hasta MAX_ATTEMPTS).
+                attempted = service.process_batch(options['batch_size'], consumers)
+                total += attempted
+                if attempted:
+                    self.stdout.write(f'  · lote de {attempted} eventos')
+                    continue
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+        except KeyboardInterrupt:
+            pass
+
+        self.stdout.write(self.style.SUCCESS(f'  ✓ {total} eventos intentados.'))
+        pending = service.pending_count()
+        if pending:
+            self.stdout.write(self.style.WARNING(f'  ! {pending} eventos siguen pendientes (reintento en la próxima corrida).'))
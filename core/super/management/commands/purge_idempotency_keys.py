@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from core.super.services.idempotency_service import IdempotencyService
+
+
+class Command(BaseCommand):
+    help = 'Borra las reservas de claves de idempotencia vencidas.'
+
+    def handle(self, *args, **options):
+        self.stdout.write('Purgando reservas de idempotencia vencidas...')
+        count = IdempotencyService().purge_expired()
+        self.stdout.write(self.style.SUCCESS(f'  ✓ {count} reservas eliminadas.'))
@@ -0,0 +1,28 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from core.super.services.rollup_service import SalesRollupService
+
+
+class Command(BaseCommand):
+    help = 'Reconstruye los rollups diarios de ventas desde Sale / SaleDetail (backfill; sin --from, todo el histórico).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--from', dest='date_from', help='Primer día a reconstruir (YYYY-MM-DD)')
+        parser.add_argument('--to', dest='date_to', help='Último día a reconstruir (YYYY-MM-DD, por defecto hoy)')
+
+    def handle(self, *args, **options):
+        try:
+            date_from = date.fromisoformat(options['date_from']) if options['date_from'] else None
+            date_to = date.fromisoformat(options['date_to']) if options['date_to'] else None
+        except ValueError as e:
+            raise CommandError(f'Fecha inválida: {e}')
+
+        def progress(day, rebuilt):
+            self.stdout.write(f'  … hasta {day:%d/%m/%Y}: {rebuilt} días con ventas')
+
+        self.stdout.write('Reconstruyendo rollups de ventas...')
+        rebuilt = SalesRollupService().rebuild_range(
+            date_from, date_to, progress=progress if options['verbosity'] > 1 else None,
+        )
+        self.stdout.write(self.style.SUCCESS(f'  ✓ {rebuilt} días reconstruidos.'))
@@ -2,7 +2,9 @@ from django.core.management.base import BaseCommand
 from django.utils import timezone
 from core.super.services.rfm_service import RFMSegmentationService
 from core.super.services.repurchase_service import RepurchasePredictionService
-from core.super.services.market_basket_service import MarketBasketService
+from core.super.services.market_basket_service import (
+    MarketBasketService, ENGINES, ENGINE_SQL, WINDOW_DAYS, HALF_LIFE_DAYS,
+)
 
 
 class Command(BaseCommand):
@@ -14,25 +16,69 @@ class Command(BaseCommand):
             choices=['rfm', 'repurchase', 'affinity'],
             help='Ejecutar solo una de las tareas (por defecto corren todas).',
         )
+        parser.add_argument(
+            '--engine',
+            choices=ENGINES,
+            default=ENGINE_SQL,
+            help="Motor de la reconstrucción de afinidad: 'sql' (dentro de la base) o 'python'.",
+        )
+        parser.add_argument(
+            '--window-days',
+            type=int,
+            default=WINDOW_DAYS,
+            help='Afinidad: solo las ventas de los últimos N días (0 = todo el historial).',
+        )
+        parser.add_argument(
+            '--half-life-days',
+            type=int,
+            default=HALF_LIFE_DAYS,
+            help='Afinidad: una venta pesa la mitad cada N días de antigüedad (0 = sin decaimiento).',
+        )
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Solo comparar los conteos incrementales de afinidad contra un recuento completo (no escribe).',
+        )
 
     def handle(self, *args, **options):
         start = timezone.now()
         only = options.get('only')
 
+        if options['verify']:
+            self.stdout.write('Verificando conteos de afinidad...')
+            mismatches = MarketBasketService().verify()
+            if any(mismatches.values()):
+                self.stdout.write(self.style.ERROR(
+                    f"  ✗ {mismatches['products']} productos y {mismatches['pairs']} pares no coinciden "
+                    f"(corregir con --only affinity)."
+                ))
+            else:
+                self.stdout.write(self.style.SUCCESS('  ✓ Los conteos coinciden con el historial.'))
+            return
+
         if only in (None, 'rfm'):
             self.stdout.write('Recalculando segmentación RFM...')
-            count = RFMSegmentationService().recalculate_all()
+            count = RFMSegmentationService().recalculate_all(progress=self._progress(options, 'clientes'))
             self.stdout.write(self.style.SUCCESS(f'  ✓ {count} clientes procesados.'))
 
         if only in (None, 'repurchase'):
             self.stdout.write('Recalculando patrones de recompra...')
-            count = RepurchasePredictionService().recalculate_all()
+            count = RepurchasePredictionService().recalculate_all(progress=self._progress(options, 'pares cliente-producto'))
             self.stdout.write(self.style.SUCCESS(f'  ✓ {count} pares cliente-producto procesados.'))
 
         if only in (None, 'affinity'):
             self.stdout.write('Recalculando afinidad de productos...')
-            count = MarketBasketService().recalculate_all()
-            self.stdout.write(self.style.SUCCESS(f'  ✓ {count} combinaciones de productos detectadas.'))
+            service = MarketBasketService(window_days=options['window_days'], half_life_days=options['half_life_days'])
+            count = service.recalculate_all(engine=options['engine'])
+            window = f'últimos {service.window_days} días' if service.window_days else 'todo el historial'
+            decay = f'vida media {service.half_life_days} días' if service.half_life_days else 'sin decaimiento'
+            self.stdout.write(self.style.SUCCESS(f'  ✓ {count} combinaciones de productos detectadas ({window}, {decay}).'))
 
         elapsed = (timezone.now() - start).total_seconds()
         self.stdout.write(self.style.SUCCESS(f'Listo en {elapsed:.1f}s.'))
+
+    def _progress(self, options, noun):
+        """Callback de avance para los servicios (solo con -v 2 o más)."""
+        if options['verbosity'] < 2:
+            return None
+        return lambda written: self.stdout.write(f'  … {written:,} {noun} escritos')
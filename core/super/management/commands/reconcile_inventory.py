@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from core.super.models import InventoryMovement
+from core.super.services.inventory_service import InventoryService
+
+
+class Command(BaseCommand):
+    help = (
+        'Compara el ledger de inventario con el stock real de cada producto '
+        'en una sola pasada. Con --fix registra los ajustes que los igualan '
+        '(la primera corrida con --fix carga el saldo inicial).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true',
+                            help='Registrar un movimiento de ajuste por cada diferencia.')
+        parser.add_argument('--show', type=int, default=50,
+                            help='Cuántas diferencias listar (por defecto %(default)s).')
+
+    def handle(self, *args, **options):
+        service = InventoryService()
+        self.stdout.write('Reconciliando ledger de inventario...')
+
+        initial, adjustments = {}, {}
+        count = 0
+        for pk, name, ledger, actual in service.discrepancies():
+            count += 1
+            if count <= options['show']:
+                shown = 'sin historial' if ledger is None else ledger
+                self.stdout.write(f'  · [{pk}] {name}: ledger {shown}, real {actual}')
+            target = initial if ledger is None else adjustments
+            target[pk] = actual - (ledger or 0)
+
+        if not count:
+            self.stdout.write(self.style.SUCCESS('  ✓ El ledger coincide con el stock de todos los productos.'))
+            return
+
+        self.stdout.write(self.style.WARNING(f'  ! {count} productos con diferencias.'))
+        if options['fix']:
+            with transaction.atomic():
+                service.record(initial, InventoryMovement.Reason.INITIAL)
+                service.record(adjustments, InventoryMovement.Reason.ADJUSTMENT)
+            self.stdout.write(self.style.SUCCESS(f'  ✓ {count} ajustes registrados.'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from core.super.services.stock_shard_service import StockShardService
+
+
+class Command(BaseCommand):
+    help = 'Copia a Product.stock el total de los shards de los productos en modo sharded (correr vía cron).'
+
+    def handle(self, *args, **options):
+        self.stdout.write('Reconciliando stock de productos sharded...')
+        count = StockShardService().reconcile()
+        self.stdout.write(self.style.SUCCESS(f'  ✓ {count} productos reconciliados.'))
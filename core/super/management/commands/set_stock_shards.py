@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from core.super.models import Product
+from core.super.services.stock_shard_service import StockShardService
+
+
+class Command(BaseCommand):
+    help = 'Activa el stock sharded de un producto (N shards) o lo desactiva (0).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('product_id', type=int)
+        parser.add_argument('shards', type=int, help='Cantidad de shards; 0 vuelve a stock normal.')
+
+    def handle(self, *args, **options):
+        try:
+            product = Product.objects.get(pk=options['product_id'])
+        except Product.DoesNotExist:
+            raise CommandError(f"El producto {options['product_id']} no existe.")
+
+        service = StockShardService()
+        if options['shards'] == 0:
+            service.disable(product)
+            self.stdout.write(self.style.SUCCESS(f'  ✓ {product.name}: stock normal.'))
+        else:
+            service.enable(product, options['shards'])
+            self.stdout.write(self.style.SUCCESS(f"  ✓ {product.name}: stock repartido en {options['shards']} shards."))
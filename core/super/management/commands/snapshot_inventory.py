@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from core.super.services.inventory_service import InventoryService
+
+
+class Command(BaseCommand):
+    help = 'Toma una foto del stock según el ledger para cada producto con movimientos nuevos (correr vía cron).'
+
+    def handle(self, *args, **options):
+        self.stdout.write('Tomando fotos de inventario...')
+        count = InventoryService().take_snapshots()
+        self.stdout.write(self.style.SUCCESS(f'  ✓ {count} fotos creadas.'))
@@ -0,0 +1,55 @@
+# Generated by Django 5.1.4 on 2026-10-18 08:07
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("super", "0008_product_created_at_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="IdempotencyKey",
+            fields=[
+                (
+                    "key",
+                    models.UUIDField(
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="Clave de idempotencia",
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now,
+                        verbose_name="Fecha de reserva",
+                    ),
+                ),
+                ("expires_at", models.DateTimeField(verbose_name="Vence")),
+                (
+                    "sale",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to="super.sale",
+                        verbose_name="Venta",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Clave de Idempotencia",
+                "verbose_name_plural": "Claves de Idempotencia",
+                "indexes": [
+                    models.Index(
+                        fields=["expires_at"], name="super_idemp_expires_b4c3fb_idx"
+                    )
+                ],
+            },
+        ),
+    ]
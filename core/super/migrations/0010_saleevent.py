@@ -0,0 +1,81 @@
+# Generated by Django 5.1.4 on 2026-10-18 08:09
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("super", "0009_idempotencykey"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SaleEvent",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("sale_ref", models.IntegerField(verbose_name="N° de venta")),
+                (
+                    "event_type",
+                    models.CharField(
+                        choices=[
+                            ("created", "Creada"),
+                            ("updated", "Editada"),
+                            ("deleted", "Eliminada"),
+                        ],
+                        max_length=10,
+                        verbose_name="Tipo de evento",
+                    ),
+                ),
+                (
+                    "payload",
+                    models.JSONField(
+                        default=dict, verbose_name="Datos (antes / después)"
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now,
+                        verbose_name="Fecha del evento",
+                    ),
+                ),
+                (
+                    "processed_at",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Procesado"
+                    ),
+                ),
+                (
+                    "attempts",
+                    models.IntegerField(default=0, verbose_name="Intentos fallidos"),
+                ),
+                (
+                    "last_error",
+                    models.TextField(
+                        blank=True, default="", verbose_name="Último error"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Evento de Venta",
+                "verbose_name_plural": "Eventos de Venta",
+                "ordering": ["id"],
+                "indexes": [
+                    models.Index(
+                        fields=["processed_at", "id"],
+                        name="super_salee_process_76e958_idx",
+                    )
+                ],
+            },
+        ),
+    ]
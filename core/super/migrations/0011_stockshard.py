@@ -0,0 +1,66 @@
+# Generated by Django 5.1.4 on 2026-10-18 08:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("super", "0010_saleevent"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="stock_shards",
+            field=models.PositiveSmallIntegerField(
+                default=0,
+                help_text="0 = stock normal. Con N > 0 el stock vive repartido en N filas de StockShard (productos en promoción) y 'stock' es el total reconciliado periódicamente.",
+                verbose_name="Shards de stock",
+            ),
+        ),
+        migrations.CreateModel(
+            name="StockShard",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "shard_index",
+                    models.PositiveSmallIntegerField(verbose_name="N° de shard"),
+                ),
+                ("stock", models.IntegerField(default=0, verbose_name="Stock")),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="shards",
+                        to="super.product",
+                        verbose_name="Producto",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Shard de Stock",
+                "verbose_name_plural": "Shards de Stock",
+                "ordering": ["product", "shard_index"],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("product", "shard_index"),
+                        name="stockshard_unique_index",
+                    ),
+                    models.CheckConstraint(
+                        condition=models.Q(("stock__gte", 0)),
+                        name="stockshard_stock_non_negative",
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,110 @@
+# Generated by Django 5.1.4 on 2026-10-18 08:17
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("super", "0011_stockshard"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="InventoryMovement",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                ("delta", models.IntegerField(verbose_name="Variación")),
+                (
+                    "reason",
+                    models.CharField(
+                        choices=[
+                            ("initial", "Saldo inicial"),
+                            ("sale", "Venta"),
+                            ("sale_edit", "Edición de venta"),
+                            ("sale_delete", "Venta eliminada"),
+                            ("adjustment", "Ajuste manual"),
+                        ],
+                        max_length=12,
+                        verbose_name="Motivo",
+                    ),
+                ),
+                (
+                    "sale_ref",
+                    models.IntegerField(
+                        blank=True, null=True, verbose_name="N° de venta"
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now, verbose_name="Fecha"
+                    ),
+                ),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="movements",
+                        to="super.product",
+                        verbose_name="Producto",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Movimiento de Inventario",
+                "verbose_name_plural": "Movimientos de Inventario",
+                "ordering": ["id"],
+                "indexes": [
+                    models.Index(
+                        fields=["product", "id"], name="super_inven_product_13227d_idx"
+                    ),
+                    models.Index(
+                        fields=["created_at"], name="super_inven_created_9272b1_idx"
+                    ),
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="InventorySnapshot",
+            fields=[
+                ("id", models.BigAutoField(primary_key=True, serialize=False)),
+                ("stock", models.IntegerField(verbose_name="Stock")),
+                (
+                    "last_movement_id",
+                    models.BigIntegerField(
+                        default=0, verbose_name="Último movimiento incluido"
+                    ),
+                ),
+                (
+                    "taken_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now,
+                        verbose_name="Fecha de la foto",
+                    ),
+                ),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="snapshots",
+                        to="super.product",
+                        verbose_name="Producto",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Foto de Inventario",
+                "verbose_name_plural": "Fotos de Inventario",
+                "ordering": ["product", "-taken_at"],
+                "indexes": [
+                    models.Index(
+                        fields=["product", "-taken_at"],
+                        name="super_inven_product_c71e78_idx",
+                    )
+                ],
+            },
+        ),
+    ]
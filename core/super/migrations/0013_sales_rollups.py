@@ -0,0 +1,358 @@
+# Generated by Django 5.1.4 on 2026-10-18 08:21
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("super", "0012_inventory_ledger"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="SalesRollupState",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "covered_since",
+                    models.DateField(
+                        blank=True, null=True, verbose_name="Cubierto desde"
+                    ),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(
+                        auto_now=True, verbose_name="Última reconstrucción"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Estado de Rollups",
+                "verbose_name_plural": "Estado de Rollups",
+            },
+        ),
+        migrations.CreateModel(
+            name="DailyCategoryRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField(verbose_name="Día")),
+                ("quantity", models.IntegerField(default=0, verbose_name="Unidades")),
+                (
+                    "revenue",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=Decimal("0.00"),
+                        max_digits=14,
+                        verbose_name="Ingresos",
+                    ),
+                ),
+                (
+                    "line_count",
+                    models.IntegerField(default=0, verbose_name="N° de líneas"),
+                ),
+                (
+                    "category",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to="super.category",
+                        verbose_name="Categoría",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Rollup diario por categoría",
+                "indexes": [
+                    models.Index(
+                        fields=["day", "category"], name="super_daily_day_2bd8e2_idx"
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="DailyCustomerRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField(verbose_name="Día")),
+                (
+                    "sale_count",
+                    models.IntegerField(default=0, verbose_name="N° de ventas"),
+                ),
+                (
+                    "subtotal",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=Decimal("0.00"),
+                        max_digits=14,
+                        verbose_name="Subtotal",
+                    ),
+                ),
+                (
+                    "iva",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=Decimal("0.00"),
+                        max_digits=14,
+                        verbose_name="IVA",
+                    ),
+                ),
+                (
+                    "discount",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=Decimal("0.00"),
+                        max_digits=14,
+                        verbose_name="Descuento",
+                    ),
+                ),
+                (
+                    "total",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=Decimal("0.00"),
+                        max_digits=14,
+                        verbose_name="Total",
+                    ),
+                ),
+                (
+                    "customer",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to="super.customer",
+                        verbose_name="Cliente",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Rollup diario por cliente",
+                "indexes": [
+                    models.Index(
+                        fields=["day", "customer"], name="super_daily_day_1a8254_idx"
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="DailyPaymentRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField(verbose_name="Día")),
+                (
+                    "sale_count",
+                    models.IntegerField(default=0, verbose_name="N° de ventas"),
+                ),
+                (
+                    "subtotal",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=Decimal("0.00"),
+                        max_digits=14,
+                        verbose_name="Subtotal",
+                    ),
+                ),
+                (
+                    "iva",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=Decimal("0.00"),
+                        max_digits=14,
+                        verbose_name="IVA",
+                    ),
+                ),
+                (
+                    "discount",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=Decimal("0.00"),
+                        max_digits=14,
+                        verbose_name="Descuento",
+                    ),
+                ),
+                (
+                    "total",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=Decimal("0.00"),
+                        max_digits=14,
+                        verbose_name="Total",
+                    ),
+                ),
+                (
+                    "payment",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to="super.paymentmethod",
+                        verbose_name="Forma de pago",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Rollup diario por forma de pago",
+                "indexes": [
+                    models.Index(
+                        fields=["day", "payment"], name="super_daily_day_6cb5a4_idx"
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="DailyProductRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField(verbose_name="Día")),
+                ("quantity", models.IntegerField(default=0, verbose_name="Unidades")),
+                (
+                    "revenue",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=Decimal("0.00"),
+                        max_digits=14,
+                        verbose_name="Ingresos",
+                    ),
+                ),
+                (
+                    "line_count",
+                    models.IntegerField(default=0, verbose_name="N° de líneas"),
+                ),
+                (
+                    "product",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to="super.product",
+                        verbose_name="Producto",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Rollup diario por producto",
+                "indexes": [
+                    models.Index(
+                        fields=["day", "product"], name="super_daily_day_7f6712_idx"
+                    )
+                ],
+            },
+        ),
+        migrations.CreateModel(
+            name="DailySellerRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("day", models.DateField(verbose_name="Día")),
+                (
+                    "sale_count",
+                    models.IntegerField(default=0, verbose_name="N° de ventas"),
+                ),
+                (
+                    "subtotal",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=Decimal("0.00"),
+                        max_digits=14,
+                        verbose_name="Subtotal",
+                    ),
+                ),
+                (
+                    "iva",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=Decimal("0.00"),
+                        max_digits=14,
+                        verbose_name="IVA",
+                    ),
+                ),
+                (
+                    "discount",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=Decimal("0.00"),
+                        max_digits=14,
+                        verbose_name="Descuento",
+                    ),
+                ),
+                (
+                    "total",
+                    models.DecimalField(
+                        decimal_places=2,
+                        default=Decimal("0.00"),
+                        max_digits=14,
+                        verbose_name="Total",
+                    ),
+                ),
+                (
+                    "seller",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        to="super.seller",
+                        verbose_name="Vendedor",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Rollup diario por vendedor",
+                "indexes": [
+                    models.Index(
+                        fields=["day", "seller"], name="super_daily_day_489834_idx"
+                    )
+                ],
+            },
+        ),
+    ]
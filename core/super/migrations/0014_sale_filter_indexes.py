@@ -0,0 +1,45 @@
+# Generated by Django 5.1.4 on 2026-10-18 08:25
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("super", "0013_sales_rollups"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="sale",
+            name="super_sale_sale_da_86a5f9_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="sale",
+            name="super_sale_custome_5c1968_idx",
+        ),
+        migrations.RemoveIndex(
+            model_name="sale",
+            name="super_sale_seller__28230c_idx",
+        ),
+        migrations.AddIndex(
+            model_name="sale",
+            index=models.Index(
+                fields=["sale_date", "payment"], name="sale_date_payment_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="sale",
+            index=models.Index(
+                fields=["seller", "sale_date"], name="sale_seller_date_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="sale",
+            index=models.Index(
+                fields=["customer", "sale_date"], name="sale_customer_date_idx"
+            ),
+        ),
+    ]
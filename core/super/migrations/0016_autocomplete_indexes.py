@@ -0,0 +1,49 @@
+# Generated by Django 5.1.4 on 2026-10-18 08:43
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("super", "0015_report_export_jobs"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="customer",
+            index=models.Index(
+                django.db.models.functions.text.Lower("name"),
+                name="customer_name_lower_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="customer",
+            index=models.Index(
+                django.db.models.functions.text.Lower("last_name"),
+                name="customer_lastname_lower_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="paymentmethod",
+            index=models.Index(
+                django.db.models.functions.text.Lower("name"),
+                name="payment_name_lower_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="seller",
+            index=models.Index(
+                django.db.models.functions.text.Lower("name"),
+                name="seller_name_lower_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="seller",
+            index=models.Index(
+                django.db.models.functions.text.Lower("last_name"),
+                name="seller_lastname_lower_idx",
+            ),
+        ),
+    ]
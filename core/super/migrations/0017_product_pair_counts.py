@@ -0,0 +1,91 @@
+# Generated by Django 5.1.4 on 2026-10-18 08:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("super", "0016_autocomplete_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductBasketCount",
+            fields=[
+                (
+                    "product",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="basket_count",
+                        serialize=False,
+                        to="super.product",
+                    ),
+                ),
+                (
+                    "basket_count",
+                    models.IntegerField(
+                        default=0, verbose_name="Ventas con el producto"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Conteo de Canastas por Producto",
+                "verbose_name_plural": "Conteos de Canastas por Producto",
+            },
+        ),
+        migrations.CreateModel(
+            name="ProductPairCount",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "co_occurrence_count",
+                    models.IntegerField(
+                        default=0, verbose_name="Veces compradas juntas"
+                    ),
+                ),
+                (
+                    "product_high",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="super.product",
+                    ),
+                ),
+                (
+                    "product_low",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="super.product",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Conteo de Pares de Productos",
+                "verbose_name_plural": "Conteos de Pares de Productos",
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("product_low", "product_high"),
+                        name="product_pair_count_unique",
+                    ),
+                    models.CheckConstraint(
+                        condition=models.Q(
+                            ("product_low__lt", models.F("product_high"))
+                        ),
+                        name="product_pair_count_ordered",
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 5.1.4 on 2026-10-18 09:32
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def copy_counts_to_weights(apps, schema_editor):
+    # Sin reconstrucción registrada no hay decaimiento: cada venta pesa 1.
+    apps.get_model("super", "ProductBasketCount").objects.update(weight=F("basket_count"))
+    apps.get_model("super", "ProductPairCount").objects.update(weight=F("co_occurrence_count"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("super", "0017_product_pair_counts"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="MarketBasketState",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "window_days",
+                    models.PositiveIntegerField(
+                        blank=True, null=True, verbose_name="Ventana (días)"
+                    ),
+                ),
+                (
+                    "half_life_days",
+                    models.PositiveIntegerField(
+                        blank=True, null=True, verbose_name="Vida media (días)"
+                    ),
+                ),
+                (
+                    "window_start",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Ventas desde"
+                    ),
+                ),
+                (
+                    "epoch",
+                    models.DateTimeField(
+                        blank=True, null=True, verbose_name="Referencia del decaimiento"
+                    ),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(
+                        auto_now=True, verbose_name="Última reconstrucción"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Estado de Afinidades",
+                "verbose_name_plural": "Estado de Afinidades",
+            },
+        ),
+        migrations.AddField(
+            model_name="productbasketcount",
+            name="weight",
+            field=models.FloatField(default=0, verbose_name="Peso con decaimiento"),
+        ),
+        migrations.AddField(
+            model_name="productpaircount",
+            name="weight",
+            field=models.FloatField(default=0, verbose_name="Peso con decaimiento"),
+        ),
+        migrations.RunPython(copy_counts_to_weights, migrations.RunPython.noop),
+    ]
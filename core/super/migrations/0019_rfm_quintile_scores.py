@@ -0,0 +1,66 @@
+# Generated by Django 5.1.4 on 2026-10-18 09:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("super", "0018_market_basket_window"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RFMScoreState",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "breaks",
+                    models.JSONField(default=dict, verbose_name="Cortes de quintil"),
+                ),
+                (
+                    "customers",
+                    models.IntegerField(default=0, verbose_name="Clientes con compras"),
+                ),
+                (
+                    "updated_at",
+                    models.DateTimeField(
+                        auto_now=True, verbose_name="Último recálculo completo"
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Estado de Puntajes RFM",
+                "verbose_name_plural": "Estado de Puntajes RFM",
+            },
+        ),
+        migrations.AddField(
+            model_name="customerinsight",
+            name="f_score",
+            field=models.PositiveSmallIntegerField(
+                blank=True, null=True, verbose_name="Puntaje F"
+            ),
+        ),
+        migrations.AddField(
+            model_name="customerinsight",
+            name="m_score",
+            field=models.PositiveSmallIntegerField(
+                blank=True, null=True, verbose_name="Puntaje M"
+            ),
+        ),
+        migrations.AddField(
+            model_name="customerinsight",
+            name="r_score",
+            field=models.PositiveSmallIntegerField(
+                blank=True, null=True, verbose_name="Puntaje R"
+            ),
+        ),
+    ]
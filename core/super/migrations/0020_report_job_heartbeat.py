@@ -0,0 +1,20 @@
+# Generated by Django 5.1.4 on 2026-10-18 10:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("super", "0019_rfm_quintile_scores"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="reportexportjob",
+            name="heartbeat_at",
+            field=models.DateTimeField(
+                blank=True, null=True, verbose_name="Último latido"
+            ),
+        ),
+    ]
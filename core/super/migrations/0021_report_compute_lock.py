@@ -0,0 +1,32 @@
+# Generated by Django 5.1.4 on 2026-10-18 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("super", "0020_report_job_heartbeat"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ReportComputeLock",
+            fields=[
+                (
+                    "key",
+                    models.CharField(
+                        max_length=128,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="Clave del reporte",
+                    ),
+                ),
+                ("expires_at", models.DateTimeField(verbose_name="Vence")),
+            ],
+            options={
+                "verbose_name": "Lock de Reporte",
+                "verbose_name_plural": "Locks de Reportes",
+            },
+        ),
+    ]
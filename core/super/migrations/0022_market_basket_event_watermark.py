@@ -0,0 +1,20 @@
+# Generated by Django 5.1.4 on 2026-10-18 10:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("super", "0021_report_compute_lock"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="marketbasketstate",
+            name="counted_through_event",
+            field=models.BigIntegerField(
+                blank=True, null=True, verbose_name="Eventos contados hasta (id)"
+            ),
+        ),
+    ]
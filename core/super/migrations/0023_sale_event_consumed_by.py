@@ -0,0 +1,20 @@
+# Generated by Django 5.1.4 on 2026-10-18 10:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("super", "0022_market_basket_event_watermark"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="saleevent",
+            name="consumed_by",
+            field=models.CharField(
+                blank=True, default="", max_length=255, verbose_name="Aplicado por"
+            ),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.1.4 on 2026-10-18 11:40
+
+from django.db import migrations
+from django.db.models import Min, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+
+def seed_initial_balances(apps, schema_editor):
+    # Los productos cargados antes del ledger no tienen saldo inicial: sin
+    # él, stock_as_of devuelve None (o una suma corrida) para ellos. Se
+    # registra como INITIAL la diferencia entre el stock real y lo que ya
+    # suma el ledger, fechada antes de cualquier movimiento del producto.
+    Product = apps.get_model("super", "Product")
+    InventoryMovement = apps.get_model("super", "InventoryMovement")
+    StockShard = apps.get_model("super", "StockShard")
+
+    movements = InventoryMovement.objects.filter(product=OuterRef("pk")).values("product")
+    shards = StockShard.objects.filter(product=OuterRef("pk")).values("product")
+    rows = Product.objects.annotate(
+        moved=Subquery(movements.annotate(total=Sum("delta")).values("total")),
+        first_movement=Subquery(movements.annotate(first=Min("created_at")).values("first")),
+        shard_total=Coalesce(Subquery(shards.annotate(total=Sum("stock")).values("total")), 0),
+    ).values_list("pk", "stock", "stock_shards", "shard_total", "created_at", "moved", "first_movement")
+
+    now = timezone.now()
+    batch = []
+    for pk, stock, stock_shards, shard_total, created_at, moved, first_movement in rows.iterator(chunk_size=2000):
+        # En modo sharded el stock real es la suma de los shards.
+        actual = shard_total if stock_shards else (stock or 0)
+        balance = actual - (moved or 0)
+        if not balance:
+            continue
+        dates = [d for d in (created_at, first_movement) if d is not None]
+        batch.append(InventoryMovement(
+            product_id=pk, delta=balance, reason="initial", created_at=min(dates) if dates else now,
+        ))
+        if len(batch) >= 2000:
+            InventoryMovement.objects.bulk_create(batch)
+            batch = []
+    if batch:
+        InventoryMovement.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("super", "0023_sale_event_consumed_by"),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_initial_balances, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 10:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("super", "0024_seed_initial_inventory"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="reportexportjob",
+            name="attempts",
+            field=models.PositiveSmallIntegerField(default=0, verbose_name="Intentos"),
+        ),
+    ]
@@ -1,5 +1,7 @@
-from django.db import models
-from django.db.models import CheckConstraint, Q
+from dataclasses import dataclass
+from django.db import models, transaction
+from django.db.models import CheckConstraint, Q, F, Sum, Count, DecimalField
+from django.db.models.functions import Lower
 from django.utils import timezone
 from django.conf import settings
 from decimal import Decimal
@@ -60,7 +62,11 @@ class PaymentMethod(models.Model):
         verbose_name = "Forma de Pago"
         verbose_name_plural = "Forma de Pagos"
         ordering = ['id_payment_method', 'name']
-        indexes = [models.Index(fields=['name'])]
+        indexes = [
+            models.Index(fields=['name']),
+            # Autocompletado por prefijo (services/autocomplete_service.py)
+            models.Index(Lower('name'), name='payment_name_lower_idx'),
+        ]
 
 
 class Customer(models.Model):
@@ -144,6 +150,9 @@ class Customer(models.Model):
             models.Index(fields=['phone']),
             models.Index(fields=['birth_date']),
             models.Index(fields=['gender']),
+            # Autocompletado por prefijo (services/autocomplete_service.py)
+            models.Index(Lower('name'), name='customer_name_lower_idx'),
+            models.Index(Lower('last_name'), name='customer_lastname_lower_idx'),
         ]
 
 
@@ -188,6 +197,9 @@ class Seller(models.Model):
             models.Index(fields=['phone']),
             models.Index(fields=['birth_date']),
             models.Index(fields=['gender']),
+            # Autocompletado por prefijo (services/autocomplete_service.py)
+            models.Index(Lower('name'), name='seller_name_lower_idx'),
+            models.Index(Lower('last_name'), name='seller_lastname_lower_idx'),
         ]
 
 
@@ -236,6 +248,12 @@ class Product(models.Model):
         verbose_name="Fecha de registro en el sistema",
         help_text="Se llena automáticamente al crear el producto. Distinta de 'Fecha de elaboración'.",
     )
+    stock_shards = models.PositiveSmallIntegerField(
+        default=0,
+        verbose_name="Shards de stock",
+        help_text="0 = stock normal. Con N > 0 el stock vive repartido en N filas de StockShard "
+                  "(productos en promoción) y 'stock' es el total reconciliado periódicamente.",
+    )
 
     # Manager custom — reemplaza al Manager por defecto implícito.
     # No requiere migración: los managers no son parte del esquema de BD.
@@ -259,9 +277,78 @@ class Product(models.Model):
             return False
         return self.expiration_date <= timezone.now().date() + timedelta(days=days)
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Stock tal como se leyó: save() lo usa para registrar el ajuste en el ledger.
+        instance._loaded_stock = instance.__dict__.get('stock')
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, **kwargs):
+        super().refresh_from_db(using=using, fields=fields, **kwargs)
+        if fields is None or 'stock' in fields:
+            self._loaded_stock = self.stock
+
     def save(self, *args, **kwargs):
-        self.state = self.stock > 0
-        super().save(*args, **kwargs)
+        adding = self._state.adding
+        previous = 0 if adding else getattr(self, '_loaded_stock', None)
+        update_fields = kwargs.get('update_fields')
+        track = previous is not None and (update_fields is None or 'stock' in update_fields)
+        if track and not adding and self.stock == previous:
+            # Sin cambio de stock no hace falta transacción ni bloqueo, pero
+            # tampoco se escribe el stock leído: pisaría los descuentos con
+            # F() que otras ventas hayan hecho desde la lectura.
+            if update_fields is None:
+                deferred = self.get_deferred_fields()
+                update_fields = [
+                    f.attname for f in self._meta.concrete_fields
+                    if not f.primary_key and f.name not in ('stock', 'state') and f.attname not in deferred
+                ]
+            else:
+                update_fields = [name for name in update_fields if name not in ('stock', 'state')]
+            super().save(*args, **{**kwargs, 'update_fields': update_fields})
+            return
+        with transaction.atomic():
+            delta = (self.stock or 0) - previous if track else 0
+            if track and not adding:
+                self.stock = self._apply_stock_adjustment(delta)
+            self.state = self.stock > 0
+            super().save(*args, **kwargs)
+            if delta:
+                InventoryMovement.objects.create(
+                    product=self,
+                    delta=delta,
+                    reason=InventoryMovement.Reason.INITIAL if adding else InventoryMovement.Reason.ADJUSTMENT,
+                )
+        self._loaded_stock = self.stock
+
+    def _apply_stock_adjustment(self, delta):
+        """
+        Aplica la edición manual como variación sobre el stock actual.
+
+        El ajuste es lo que se cambió respecto de lo leído (`delta`), no el
+        número final: se bloquea la fila y se suma a su stock de ahora, así
+        un descuento con F() de otra venta entre la lectura y el save no se
+        pisa y el movimiento ADJUSTMENT del ledger coincide con lo aplicado.
+
+        En modo sharded la variación se mueve en los shards (si no,
+        reconcile() la pisaría con su suma) y el total sale de ellos.
+        """
+        current, shards = Product.objects.select_for_update().values_list('stock', 'stock_shards').get(pk=self.pk)
+        if shards:
+            from core.super.services.stock_shard_service import StockShardService
+            service = StockShardService()
+            if delta > 0:
+                service.restore(self.pk, delta)
+            elif delta < 0:
+                service.consume(self.pk, -delta)
+            return service.totals([self.pk]).get(self.pk, 0)
+        if current + delta < 0:
+            raise ValueError(
+                f"Stock insuficiente para '{self.name}'. "
+                f"Disponible: {current}, ajuste: {delta}"
+            )
+        return current + delta
 
     def get_image_url(self):
         return get_image(self.image)
@@ -291,6 +378,94 @@ class Product(models.Model):
         ]
 
 
+class StockShard(models.Model):
+    """
+    Porción del stock de un producto en modo sharded (Product.stock_shards > 0).
+
+    En promociones, todos los checkouts de un mismo producto hacían cola
+    sobre SU única fila. Repartiendo el stock en N filas, cada venta
+    bloquea solo el shard del que descuenta y hasta N ventas del mismo
+    producto avanzan en paralelo. La restricción de no-negativo se aplica
+    por shard, así que el total tampoco puede quedar negativo.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='shards', verbose_name="Producto")
+    shard_index = models.PositiveSmallIntegerField(verbose_name="N° de shard")
+    stock = models.IntegerField(default=0, verbose_name="Stock")
+
+    def __str__(self):
+        return f'{self.product} - shard {self.shard_index}'
+
+    class Meta:
+        verbose_name = "Shard de Stock"
+        verbose_name_plural = "Shards de Stock"
+        ordering = ['product', 'shard_index']
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'shard_index'], name='stockshard_unique_index'),
+            CheckConstraint(check=Q(stock__gte=0), name='stockshard_stock_non_negative'),
+        ]
+
+
+class InventoryMovement(models.Model):
+    """
+    Ledger de inventario: una fila por cada cambio de stock, solo se agrega.
+
+    Lo escriben en lote decrement_stock (ventas, ediciones, eliminaciones,
+    sincronización POS) y Product.save (alta y ajustes manuales). Con
+    InventorySnapshot permite responder "¿cuánto stock había el día X?"
+    sin re-jugar todas las ventas.
+    """
+    class Reason(models.TextChoices):
+        INITIAL = 'initial', 'Saldo inicial'
+        SALE = 'sale', 'Venta'
+        SALE_EDIT = 'sale_edit', 'Edición de venta'
+        SALE_DELETE = 'sale_delete', 'Venta eliminada'
+        ADJUSTMENT = 'adjustment', 'Ajuste manual'
+
+    id = models.BigAutoField(primary_key=True)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='movements', verbose_name="Producto")
+    delta = models.IntegerField(verbose_name="Variación")
+    reason = models.CharField(max_length=12, choices=Reason.choices, verbose_name="Motivo")
+    # No es ForeignKey: el movimiento de una venta eliminada se conserva.
+    sale_ref = models.IntegerField(blank=True, null=True, verbose_name="N° de venta")
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="Fecha")
+
+    def __str__(self):
+        return f'{self.product} {self.delta:+d} ({self.reason})'
+
+    class Meta:
+        verbose_name = "Movimiento de Inventario"
+        verbose_name_plural = "Movimientos de Inventario"
+        ordering = ['id']
+        indexes = [
+            models.Index(fields=['product', 'id']),
+            models.Index(fields=['created_at']),
+        ]
+
+
+class InventorySnapshot(models.Model):
+    """
+    Foto periódica del stock según el ledger (comando snapshot_inventory).
+
+    last_movement_id es el último movimiento incluido: el stock a una
+    fecha es la foto más cercana anterior + los movimientos posteriores a
+    last_movement_id, nunca todo el historial.
+    """
+    id = models.BigAutoField(primary_key=True)
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='snapshots', verbose_name="Producto")
+    stock = models.IntegerField(verbose_name="Stock")
+    last_movement_id = models.BigIntegerField(default=0, verbose_name="Último movimiento incluido")
+    taken_at = models.DateTimeField(default=timezone.now, verbose_name="Fecha de la foto")
+
+    def __str__(self):
+        return f'{self.product} = {self.stock} ({self.taken_at:%Y-%m-%d %H:%M})'
+
+    class Meta:
+        verbose_name = "Foto de Inventario"
+        verbose_name_plural = "Fotos de Inventario"
+        ordering = ['product', '-taken_at']
+        indexes = [models.Index(fields=['product', '-taken_at'])]
+
+
 class Sale(models.Model):
     id_sale = models.AutoField(primary_key=True, verbose_name="ID", blank=False, null=False, unique=True)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, verbose_name="Usuario que compró", null=True, blank=True)
@@ -333,10 +508,13 @@ class Sale(models.Model):
         verbose_name = "Venta"
         verbose_name_plural = "Ventas"
         ordering = ['id_sale']
+        # Compuestos para los filtros de SaleFilter (rango semiabierto de
+        # sale_date + forma de pago / vendedor / cliente). Cubren también
+        # los índices simples que reemplazan (sale_date, customer, seller).
         indexes = [
-            models.Index(fields=['sale_date']),
-            models.Index(fields=['customer']),
-            models.Index(fields=['seller']),
+            models.Index(fields=['sale_date', 'payment'], name='sale_date_payment_idx'),
+            models.Index(fields=['seller', 'sale_date'], name='sale_seller_date_idx'),
+            models.Index(fields=['customer', 'sale_date'], name='sale_customer_date_idx'),
             models.Index(fields=['idempotency_key']),
         ]
         constraints = [
@@ -347,6 +525,94 @@ class Sale(models.Model):
         ]
 
 
+class IdempotencyKey(models.Model):
+    """
+    Reserva de una clave de idempotencia ANTES de procesar la venta.
+
+    Sale.idempotency_key (unique) sigue siendo la garantía final, pero solo
+    se choca contra ella al final de la transacción — con un doble clic, las
+    dos requests bloqueaban productos y registraban todo el carrito antes de
+    que una muriera. Esta tabla se reclama con INSERT ... ON CONFLICT DO
+    NOTHING en autocommit, así que la segunda request sabe al instante que
+    perdió y solo espera a que la primera asocie su venta.
+    """
+    key = models.UUIDField(primary_key=True, verbose_name="Clave de idempotencia")
+    sale = models.ForeignKey(Sale, on_delete=models.CASCADE, verbose_name="Venta", blank=True, null=True)
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="Fecha de reserva")
+    expires_at = models.DateTimeField(verbose_name="Vence")
+
+    def __str__(self):
+        return f'Clave {self.key}'
+
+    class Meta:
+        verbose_name = "Clave de Idempotencia"
+        verbose_name_plural = "Claves de Idempotencia"
+        indexes = [models.Index(fields=['expires_at'])]
+
+
+class ReportComputeLock(models.Model):
+    """
+    Lock single-flight del recálculo de un reporte cacheado (ReportCache).
+
+    Se reclama con INSERT ... ON CONFLICT DO NOTHING en autocommit, igual
+    que IdempotencyKey: de N requests que encuentran la misma entrada
+    invalidada, exactamente una inserta la fila y recalcula. La caché de
+    archivos no sirve para esto (su add() es has_key + set, no atómico).
+    expires_at libera el lock de un proceso que murió sin borrarlo.
+    """
+    key = models.CharField(max_length=128, primary_key=True, verbose_name="Clave del reporte")
+    expires_at = models.DateTimeField(verbose_name="Vence")
+
+    def __str__(self):
+        return f'Lock {self.key}'
+
+    class Meta:
+        verbose_name = "Lock de Reporte"
+        verbose_name_plural = "Locks de Reportes"
+
+
+class SaleEvent(models.Model):
+    """
+    Outbox transaccional de ventas.
+
+    Se escribe en la MISMA transacción que crea, edita o elimina la venta:
+    si la venta se confirma, el evento también; si hace rollback, no queda
+    evento huérfano. El comando process_sale_events los consume en lotes y
+    los reparte a los consumidores incrementales (insights, recompra...),
+    así la request no paga ese trabajo y los datos derivados quedan
+    atrasados segundos en vez de un batch nocturno.
+
+    sale_ref no es ForeignKey a propósito: el evento de una venta
+    eliminada tiene que sobrevivir a la venta.
+
+    consumed_by lleva los consumidores que ya lo aplicaron (",a,b,"):
+    processed_at recién se marca cuando pasaron todos los registrados, así
+    que correr solo algunos (--only) no se lo saltea a los demás.
+    """
+    class EventType(models.TextChoices):
+        CREATED = 'created', 'Creada'
+        UPDATED = 'updated', 'Editada'
+        DELETED = 'deleted', 'Eliminada'
+
+    sale_ref = models.IntegerField(verbose_name="N° de venta")
+    event_type = models.CharField(max_length=10, choices=EventType.choices, verbose_name="Tipo de evento")
+    payload = models.JSONField(default=dict, verbose_name="Datos (antes / después)")
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="Fecha del evento")
+    processed_at = models.DateTimeField(blank=True, null=True, verbose_name="Procesado")
+    attempts = models.IntegerField(default=0, verbose_name="Intentos fallidos")
+    last_error = models.TextField(blank=True, default='', verbose_name="Último error")
+    consumed_by = models.CharField(max_length=255, blank=True, default='', verbose_name="Aplicado por")
+
+    def __str__(self):
+        return f'Evento {self.event_type} - Venta N°{self.sale_ref}'
+
+    class Meta:
+        verbose_name = "Evento de Venta"
+        verbose_name_plural = "Eventos de Venta"
+        ordering = ['id']
+        indexes = [models.Index(fields=['processed_at', 'id'])]
+
+
 class SaleDetail(models.Model):
     id_detail = models.AutoField(primary_key=True, verbose_name="ID", blank=False, null=False, unique=True)
     sale = models.ForeignKey(Sale, on_delete=models.CASCADE, verbose_name="Venta", blank=True, null=True)
@@ -377,6 +643,190 @@ class SaleDetail(models.Model):
         ]
 
 
+class SalesRollupState(models.Model):
+    """
+    Estado de los rollups de ventas (fila única, pk=1).
+
+    covered_since: desde qué día los rollups están completos. Los días
+    anteriores no se reconstruyeron (rebuild_rollups) y los reportes que
+    los incluyan leen de las tablas crudas. La fila también sirve de lock:
+    las reconstrucciones se serializan con select_for_update sobre ella.
+    """
+    covered_since = models.DateField(blank=True, null=True, verbose_name="Cubierto desde")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Última reconstrucción")
+
+    class Meta:
+        verbose_name = "Estado de Rollups"
+        verbose_name_plural = "Estado de Rollups"
+
+
+class SalesRollup(models.Model):
+    """Métricas de venta agregadas por día (base de los rollups por dimensión)."""
+    day = models.DateField(verbose_name="Día")
+    sale_count = models.IntegerField(default=0, verbose_name="N° de ventas")
+    subtotal = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'), verbose_name="Subtotal")
+    iva = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'), verbose_name="IVA")
+    discount = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'), verbose_name="Descuento")
+    total = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'), verbose_name="Total")
+
+    class Meta:
+        abstract = True
+
+
+class DailyPaymentRollup(SalesRollup):
+    payment = models.ForeignKey(PaymentMethod, on_delete=models.SET_NULL, blank=True, null=True, verbose_name="Forma de pago")
+
+    class Meta:
+        verbose_name = "Rollup diario por forma de pago"
+        indexes = [models.Index(fields=['day', 'payment'])]
+
+
+class DailySellerRollup(SalesRollup):
+    seller = models.ForeignKey(Seller, on_delete=models.SET_NULL, blank=True, null=True, verbose_name="Vendedor")
+
+    class Meta:
+        verbose_name = "Rollup diario por vendedor"
+        indexes = [models.Index(fields=['day', 'seller'])]
+
+
+class DailyCustomerRollup(SalesRollup):
+    customer = models.ForeignKey(Customer, on_delete=models.SET_NULL, blank=True, null=True, verbose_name="Cliente")
+
+    class Meta:
+        verbose_name = "Rollup diario por cliente"
+        indexes = [models.Index(fields=['day', 'customer'])]
+
+
+class LineRollup(models.Model):
+    """Métricas de líneas de venta (SaleDetail) agregadas por día."""
+    day = models.DateField(verbose_name="Día")
+    quantity = models.IntegerField(default=0, verbose_name="Unidades")
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=Decimal('0.00'), verbose_name="Ingresos")
+    line_count = models.IntegerField(default=0, verbose_name="N° de líneas")
+
+    class Meta:
+        abstract = True
+
+
+class DailyProductRollup(LineRollup):
+    product = models.ForeignKey(Product, on_delete=models.SET_NULL, blank=True, null=True, verbose_name="Producto")
+
+    class Meta:
+        verbose_name = "Rollup diario por producto"
+        indexes = [models.Index(fields=['day', 'product'])]
+
+
+class DailyCategoryRollup(LineRollup):
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, blank=True, null=True, verbose_name="Categoría")
+
+    class Meta:
+        verbose_name = "Rollup diario por categoría"
+        indexes = [models.Index(fields=['day', 'category'])]
+
+
+class ReportExportJob(models.Model):
+    """
+    Exportación del reporte de ventas generada en segundo plano.
+
+    La vista la encola con los filtros ya normalizados (params) y el
+    comando process_report_exports la genera en el storage por defecto
+    (MEDIA_ROOT o S3). Mientras un trabajo está pendiente o corriendo,
+    pedir los mismos filtros devuelve ese trabajo: la restricción única
+    parcial sobre params_hash lo garantiza también con pedidos simultáneos.
+    """
+
+    class Status(models.TextChoices):
+        PENDING = 'pending', 'Pendiente'
+        RUNNING = 'running', 'Generando'
+        DONE = 'done', 'Lista'
+        FAILED = 'failed', 'Fallida'
+
+    status = models.CharField(max_length=10, choices=Status.choices, default=Status.PENDING, verbose_name="Estado")
+    params = models.JSONField(default=dict, verbose_name="Filtros")
+    params_hash = models.CharField(max_length=64, verbose_name="Hash de filtros")
+    progress = models.PositiveSmallIntegerField(default=0, verbose_name="Progreso (%)")
+    file = models.FileField(upload_to='reports/exports/', blank=True, null=True, verbose_name="Archivo")
+    error = models.TextField(blank=True, default='', verbose_name="Error")
+    requested_by = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, blank=True, null=True, verbose_name="Solicitado por")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Creado")
+    started_at = models.DateTimeField(blank=True, null=True, verbose_name="Iniciado")
+    heartbeat_at = models.DateTimeField(blank=True, null=True, verbose_name="Último latido")
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name="Intentos")
+    finished_at = models.DateTimeField(blank=True, null=True, verbose_name="Terminado")
+
+    def __str__(self):
+        return f'Exportación #{self.pk} ({self.get_status_display()})'
+
+    @property
+    def is_active(self):
+        return self.status in (self.Status.PENDING, self.Status.RUNNING)
+
+    class Meta:
+        verbose_name = "Exportación de reporte"
+        verbose_name_plural = "Exportaciones de reportes"
+        indexes = [models.Index(fields=['status', 'created_at'])]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['params_hash'],
+                condition=Q(status__in=['pending', 'running']),
+                name='reportexportjob_one_active_per_params',
+            ),
+        ]
+
+
+IVA_FACTOR = Decimal('1.15')
+
+
+@dataclass(frozen=True)
+class CartSummary:
+    """
+    Totales de un carrito calculados con UNA sola query agregada.
+
+    Antes, get_subtotal(), get_iva() y get_total() recorrían cada uno
+    self.items.all() y cargaban cada product por separado — una página de
+    carrito leía los items ~5 veces más N queries de productos. Ahora el
+    carrito, el checkout (GET y POST) y la vista previa del descuento
+    comparten este mismo objeto.
+    """
+    total: Decimal = Decimal('0.00')
+    line_count: int = 0
+    expired_count: int = 0
+
+    @property
+    def subtotal(self):
+        return self.total / IVA_FACTOR
+
+    @property
+    def iva(self):
+        return self.total - self.subtotal
+
+    @property
+    def has_expired(self):
+        return self.expired_count > 0
+
+    @property
+    def is_empty(self):
+        return self.line_count == 0
+
+
+class CartItemQuerySet(models.QuerySet):
+    def summary(self) -> CartSummary:
+        """SUM(precio * cantidad), número de líneas y líneas caducadas en un solo SELECT."""
+        agg = self.aggregate(
+            total=Sum(
+                F('product__price') * F('quantity'),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            ),
+            line_count=Count('id'),
+            expired_count=Count('id', filter=Q(product__expiration_date__lt=timezone.now().date())),
+        )
+        return CartSummary(
+            total=agg['total'] or Decimal('0.00'),
+            line_count=agg['line_count'],
+            expired_count=agg['expired_count'],
+        )
+
+
 class Cart(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, verbose_name="Usuario")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de creación")
@@ -385,14 +835,20 @@ class Cart(models.Model):
     def __str__(self):
         return f'Carrito de {self.user.username}'
 
+    def get_summary(self) -> CartSummary:
+        """Memoizado en la instancia: una request que reutiliza el mismo Cart paga una sola query."""
+        if not hasattr(self, '_summary'):
+            self._summary = self.items.summary()
+        return self._summary
+
     def get_total(self):
-        return sum(item.get_subtotal() for item in self.items.all())
+        return self.get_summary().total
 
     def get_subtotal(self):
-        return self.get_total() / Decimal('1.15')
+        return self.get_summary().subtotal
 
     def get_iva(self):
-        return self.get_total() - self.get_subtotal()
+        return self.get_summary().iva
 
     def get_item_count(self):
         return self.items.count()
@@ -408,6 +864,8 @@ class CartItem(models.Model):
     quantity = models.IntegerField(default=1, verbose_name="Cantidad")
     added_at = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de agregado")
 
+    objects = CartItemQuerySet.as_manager()
+
     def __str__(self):
         return f'{self.quantity}x {self.product.name}'
 
@@ -436,12 +894,35 @@ class CustomerInsight(models.Model):
         ('perdido', 'Perdido'),
         ('campeon', 'Campeón'),      # frecuente + alto ticket
     ], default='nuevo')
+    # Quintiles (1-5, 5 = mejor) contra toda la base de clientes con compras;
+    # null si el cliente nunca compró. Ver RFMScoreState.
+    r_score = models.PositiveSmallIntegerField(null=True, blank=True, verbose_name="Puntaje R")
+    f_score = models.PositiveSmallIntegerField(null=True, blank=True, verbose_name="Puntaje F")
+    m_score = models.PositiveSmallIntegerField(null=True, blank=True, verbose_name="Puntaje M")
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         indexes = [models.Index(fields=['segment'])]
 
 
+class RFMScoreState(models.Model):
+    """
+    Cortes de quintil del último recálculo RFM completo (fila única, pk=1).
+
+    breaks = {'recency': [...], 'frequency': [...], 'monetary': [...]}, cuatro
+    cortes ascendentes por métrica (la recencia va negada: menos días es
+    mejor). El recálculo incremental puntúa con estos cortes, sin volver a
+    leer toda la base.
+    """
+    breaks = models.JSONField(default=dict, verbose_name="Cortes de quintil")
+    customers = models.IntegerField(default=0, verbose_name="Clientes con compras")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Último recálculo completo")
+
+    class Meta:
+        verbose_name = "Estado de Puntajes RFM"
+        verbose_name_plural = "Estado de Puntajes RFM"
+
+
 class RepurchasePattern(models.Model):
     """Patrón de recompra por cliente/producto."""
     customer = models.ForeignKey('Customer', on_delete=models.CASCADE, related_name='patterns')
@@ -482,3 +963,70 @@ class ProductAffinity(models.Model):
         unique_together = ('product_a', 'product_b')
         indexes = [models.Index(fields=['product_a', '-confidence'])]
         ordering = ['-confidence']
+
+
+class ProductBasketCount(models.Model):
+    """
+    En cuántas ventas de 2 o más productos distintos aparece cada producto
+    (denominador de la confianza de ProductAffinity). Se mantiene de forma
+    incremental desde el outbox (MarketBasketConsumer).
+
+    weight es la misma suma con cada venta pesada por su antigüedad (ver
+    MarketBasketState); sin decaimiento, weight == basket_count.
+    """
+    product = models.OneToOneField(
+        'Product', on_delete=models.CASCADE, primary_key=True, related_name='basket_count',
+    )
+    basket_count = models.IntegerField(default=0, verbose_name="Ventas con el producto")
+    weight = models.FloatField(default=0, verbose_name="Peso con decaimiento")
+
+    class Meta:
+        verbose_name = "Conteo de Canastas por Producto"
+        verbose_name_plural = "Conteos de Canastas por Producto"
+
+
+class ProductPairCount(models.Model):
+    """
+    Cuántas ventas contienen a la vez dos productos (par no direccional:
+    product_low_id < product_high_id). Se mantiene de forma incremental
+    desde el outbox (MarketBasketConsumer).
+    """
+    product_low = models.ForeignKey('Product', on_delete=models.CASCADE, related_name='+')
+    product_high = models.ForeignKey('Product', on_delete=models.CASCADE, related_name='+')
+    co_occurrence_count = models.IntegerField(default=0, verbose_name="Veces compradas juntas")
+    weight = models.FloatField(default=0, verbose_name="Peso con decaimiento")
+
+    class Meta:
+        verbose_name = "Conteo de Pares de Productos"
+        verbose_name_plural = "Conteos de Pares de Productos"
+        constraints = [
+            models.UniqueConstraint(fields=['product_low', 'product_high'], name='product_pair_count_unique'),
+            CheckConstraint(check=Q(product_low__lt=F('product_high')), name='product_pair_count_ordered'),
+        ]
+
+
+class MarketBasketState(models.Model):
+    """
+    Parámetros de la última reconstrucción de afinidades (fila única, pk=1).
+
+    window_start: solo cuentan las ventas desde esta fecha (null = todo el
+    historial). epoch: referencia del decaimiento; una venta pesa
+    2 ** ((sale_date - epoch) / half_life_days), así que las anteriores
+    pesan menos de 1 y las posteriores más. La confianza es un cociente
+    de pesos y no depende de la referencia elegida, por eso el consumidor
+    incremental puede seguir sumando ventas nuevas con la misma fórmula.
+
+    counted_through_event: mayor SaleEvent.id visible al reconstruir. Esas
+    ventas ya están en los conteos, así que el consumidor ignora los
+    eventos con id menor o igual aunque sigan pendientes en el outbox.
+    """
+    window_days = models.PositiveIntegerField(blank=True, null=True, verbose_name="Ventana (días)")
+    half_life_days = models.PositiveIntegerField(blank=True, null=True, verbose_name="Vida media (días)")
+    window_start = models.DateTimeField(blank=True, null=True, verbose_name="Ventas desde")
+    epoch = models.DateTimeField(blank=True, null=True, verbose_name="Referencia del decaimiento")
+    counted_through_event = models.BigIntegerField(blank=True, null=True, verbose_name="Eventos contados hasta (id)")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Última reconstrucción")
+
+    class Meta:
+        verbose_name = "Estado de Afinidades"
+        verbose_name_plural = "Estado de Afinidades"
@@ -0,0 +1,112 @@
+"""
+Búsqueda por prefijo de clientes, vendedores y formas de pago para los
+filtros de reportes y del listado de ventas (en vez de un <select> con
+todas las filas).
+
+- Coincide por prefijo en nombre, apellido o cédula. "luis mo" además
+  busca nombre "luis…" + apellido "mo…".
+- El prefijo se expresa como rango sobre lower(campo):
+  lower(name) >= 'lu' AND lower(name) < 'lv'. Un rango lo resuelve un
+  índice B-tree común en cualquier collation, algo que LIKE 'lu%' solo
+  logra con text_pattern_ops. El LIKE se mantiene como verificación.
+  Índices funcionales en Customer.Meta / Seller.Meta / PaymentMethod.Meta.
+- Páginas de AUTOCOMPLETE_LIMIT resultados; el cliente pide la siguiente
+  solo si `more` es True.
+- Resultado cacheado un minuto bajo el namespace 'autocomplete:<tipo>',
+  que signals.py invalida cuando cambia un cliente, vendedor o forma de pago.
+"""
+
+from django.db.models import Q
+from django.db.models.functions import Lower
+
+from core.super.models import Customer, Seller, PaymentMethod
+from core.super.services.cache_service import cached
+
+AUTOCOMPLETE_LIMIT = 20
+AUTOCOMPLETE_TIMEOUT = 60
+MAX_TERM_LENGTH = 50
+
+CUSTOMERS = 'customers'
+SELLERS = 'sellers'
+PAYMENTS = 'payments'
+
+# tipo → (modelo, ¿tiene apellido y cédula?)
+SOURCES = {
+    CUSTOMERS: (Customer, True),
+    SELLERS: (Seller, True),
+    PAYMENTS: (PaymentMethod, False),
+}
+
+
+def _successor(prefix):
+    """Menor string mayor que todos los que empiezan con `prefix` ('lu' → 'lv')."""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def _prefix(field, prefix):
+    return Q(**{f'{field}__gte': prefix, f'{field}__lt': _successor(prefix), f'{field}__startswith': prefix})
+
+
+def _label(row, people):
+    if not people:
+        return row['name'] or '—'
+    full_name = ' '.join(part for part in (row['name'], row['last_name']) if part)
+    return f"{full_name or '—'} · {row['dni']}"
+
+
+@cached(lambda kind, term='', page=1: f'autocomplete:{kind}', timeout=AUTOCOMPLETE_TIMEOUT)
+def autocomplete(kind, term='', page=1) -> dict:
+    """{'results': [{'id', 'text'}], 'more': bool} para el tipo pedido (ValueError si no existe)."""
+    if kind not in SOURCES:
+        raise ValueError(f'Autocompletado inválido: {kind}')
+    model, people = SOURCES[kind]
+    term = ' '.join(term.lower().split())[:MAX_TERM_LENGTH]
+    page = max(int(page), 1)
+
+    fields = ['pk', 'name', 'last_name', 'dni'] if people else ['pk', 'name']
+    qs = model.objects.annotate(name_lower=Lower('name'))
+    if people:
+        qs = qs.annotate(last_name_lower=Lower('last_name'))
+    if term:
+        query = _prefix('name_lower', term)
+        if people:
+            query |= _prefix('last_name_lower', term) | _prefix('dni', term)
+            first, _, rest = term.partition(' ')
+            if rest:
+                query |= _prefix('name_lower', first) & _prefix('last_name_lower', rest)
+        qs = qs.filter(query)
+
+    offset = (page - 1) * AUTOCOMPLETE_LIMIT
+    # Una fila de más para saber si hay otra página sin hacer COUNT(*).
+    rows = list(qs.order_by('name_lower', 'pk').values(*fields)[offset:offset + AUTOCOMPLETE_LIMIT + 1])
+    return {
+        'results': [{'id': row['pk'], 'text': _label(row, people)} for row in rows[:AUTOCOMPLETE_LIMIT]],
+        'more': len(rows) > AUTOCOMPLETE_LIMIT,
+    }
+
+
+def selected_label(kind, pk):
+    """Texto a mostrar para el valor ya elegido de un filtro ('' si no existe)."""
+    model, people = SOURCES[kind]
+    fields = ['name', 'last_name', 'dni'] if people else ['name']
+    try:
+        row = model.objects.values(*fields).get(pk=int(pk))
+    except (TypeError, ValueError, model.DoesNotExist):
+        return ''
+    return _label(row, people)
+
+
+def filter_labels(request) -> dict:
+    """
+    Valor (sel_*) y texto visible (sel_*_label) de los filtros de forma de
+    pago, vendedor y cliente: una búsqueda por pk por filtro elegido, no
+    la tabla entera. Una forma de pago por nombre (enlaces viejos) se
+    muestra tal cual.
+    """
+    labels = {}
+    for param, kind in (('payment', PAYMENTS), ('seller', SELLERS), ('customer', CUSTOMERS)):
+        value = request.GET.get(param, '').strip()
+        label = selected_label(kind, value) if value.isdigit() else value
+        labels[f'sel_{param}'] = value
+        labels[f'sel_{param}_label'] = label
+    return labels
@@ -0,0 +1,239 @@
+"""
+Caché de dos niveles para lecturas repetidas (catálogo, dashboard, chatbot).
+
+- L1: LRU en memoria del proceso, acotado por número de entradas. Es lo
+  más rápido, pero cada worker de gunicorn tiene el suyo.
+- L2: backend compartido entre workers (CACHES['shared'], file-based —
+  no requiere Redis ni ningún servicio externo).
+
+La invalidación es por namespaces versionados ("catalog", "sales",
+"customer:<id>", "user:<id>"): cada clave incluye la versión actual de su namespace,
+y las señales de core/super/signals.py incrementan esa versión cuando
+cambia un modelo. No hace falta borrar claves una por una — las viejas
+quedan huérfanas y expiran solas.
+"""
+
+import functools
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.core.cache import caches
+from django.db import models
+
+SHARED_CACHE_ALIAS = 'shared'
+L1_MAX_ENTRIES = 1000
+# Cuánto tiempo confía cada worker en el número de versión que ya leyó
+# antes de volver a consultarlo en L2. Es el desfase máximo con el que un
+# worker ve una invalidación hecha por OTRO worker (el que invalida la ve
+# al instante).
+VERSION_CHECK_SECONDS = 5
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Diccionario LRU thread-safe con expiración por entrada."""
+
+    def __init__(self, max_entries=L1_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=_MISSING):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.time():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, expires_at=None):
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class TwoTierCache:
+    """
+    Fachada L1 + L2 con namespaces versionados y contadores de hit/miss.
+
+    Singleton por proceso (mismo patrón que IdempotencyService): el L1 y
+    los contadores tienen que ser compartidos por todas las requests del
+    worker para servir de algo.
+    """
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            instance = super().__new__(cls)
+            instance._l1 = LRUCache()
+            instance._stats_lock = threading.Lock()
+            instance._stats = dict.fromkeys(('l1_hits', 'l2_hits', 'misses'), 0)
+            cls._instance = instance
+        return cls._instance
+
+    @property
+    def l2(self):
+        return caches[SHARED_CACHE_ALIAS]
+
+    # ── Namespaces ───────────────────────────────────────────────────────
+
+    def _version_key(self, namespace):
+        return f'ns:{namespace}'
+
+    def version(self, namespace) -> int:
+        key = self._version_key(namespace)
+        version = self._l1.get(key)
+        if version is _MISSING:
+            version = self.l2.get(key)
+            if version is None:
+                # Contador ausente: nunca creado, o descartado por el cull
+                # del L2. Arranca en el reloj y no en 1, así nunca repite un
+                # número ya usado y no revive entradas viejas "ns@1" (add no
+                # pisa a otro worker que lo haya creado en paralelo).
+                seed = _version_seed()
+                self.l2.add(key, seed, None)
+                version = self.l2.get(key, seed)
+            self._l1.set(key, version, time.time() + VERSION_CHECK_SECONDS)
+        return version
+
+    def bump(self, *namespaces):
+        """Invalida todo lo cacheado bajo cada namespace."""
+        for namespace in namespaces:
+            key = self._version_key(namespace)
+            try:
+                version = self.l2.incr(key)
+            except ValueError:
+                version = _version_seed()
+                self.l2.set(key, version, None)
+            self._l1.set(key, version, time.time() + VERSION_CHECK_SECONDS)
+
+    def _full_key(self, namespaces, key):
+        versions = ':'.join(f'{ns}@{self.version(ns)}' for ns in namespaces)
+        return f'{versions}|{key}'
+
+    # ── Lectura / escritura ──────────────────────────────────────────────
+
+    def get(self, namespaces, key, default=None):
+        full_key = self._full_key(_as_tuple(namespaces), key)
+
+        value = self._l1.get(full_key)
+        if value is not _MISSING:
+            self._count('l1_hits')
+            return value
+
+        entry = self.l2.get(full_key)
+        if entry is not None:
+            value, expires_at = entry
+            self._l1.set(full_key, value, expires_at)
+            self._count('l2_hits')
+            return value
+
+        self._count('misses')
+        return default
+
+    def set(self, namespaces, key, value, timeout=300):
+        full_key = self._full_key(_as_tuple(namespaces), key)
+        # L2 guarda la expiración absoluta junto al valor: así, al
+        # promover a L1 desde otro worker, no se extiende la vida útil.
+        expires_at = time.time() + timeout if timeout is not None else None
+        self.l2.set(full_key, (value, expires_at), timeout)
+        self._l1.set(full_key, value, expires_at)
+
+    def get_or_set(self, namespaces, key, compute, timeout=300):
+        value = self.get(namespaces, key, _MISSING)
+        if value is _MISSING:
+            value = compute()
+            self.set(namespaces, key, value, timeout)
+        return value
+
+    def clear(self):
+        self._l1.clear()
+        self.l2.clear()
+
+    # ── Métricas ─────────────────────────────────────────────────────────
+
+    def _count(self, name):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = sum(stats.values())
+        stats['hit_ratio'] = (stats['l1_hits'] + stats['l2_hits']) / lookups if lookups else 0.0
+        stats['l1_size'] = len(self._l1)
+        return stats
+
+    def reset_stats(self):
+        with self._stats_lock:
+            for name in self._stats:
+                self._stats[name] = 0
+
+
+def _version_seed():
+    """Versión inicial de un namespace: mayor que cualquiera emitida antes."""
+    return time.time_ns()
+
+
+def _as_tuple(namespaces):
+    return (namespaces,) if isinstance(namespaces, str) else tuple(namespaces)
+
+
+def _key_part(value):
+    """Representación estable de un argumento para armar la clave."""
+    if value is None or isinstance(value, (str, int, float, bool, Decimal, date, datetime)):
+        return repr(value)
+    if isinstance(value, models.Model):
+        return f'{value._meta.label}:{value.pk}'
+    if isinstance(value, (list, tuple)):
+        return '(' + ','.join(_key_part(v) for v in value) + ')'
+    raise TypeError(f'@cached no sabe armar una clave con {type(value).__qualname__!r}')
+
+
+def cached(namespaces, timeout=300):
+    """
+    Decorador opt-in para funciones y métodos de servicios/vistas.
+
+    `namespaces` puede ser un string, una tupla de strings, o un callable
+    que recibe los mismos argumentos que la función y devuelve cualquiera
+    de los dos (ej. lambda customer: f'customer:{customer.pk}').
+
+    El resultado tiene que ser picklable: devolver listas/dicts, no
+    querysets sin evaluar. Los argumentos solo pueden ser escalares,
+    modelos, o listas/tuplas de ellos (TypeError si no). En un método, el
+    `self` no forma parte de la clave: la clase ya está en el prefijo y
+    los builders que se decoran no tienen estado propio.
+    """
+    def decorator(func):
+        prefix = f'{func.__module__}.{func.__qualname__}'
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            ns = namespaces(*args, **kwargs) if callable(namespaces) else namespaces
+            key_args = args
+            if args and getattr(type(args[0]), func.__name__, None) is wrapper:
+                key_args = args[1:]
+            raw = _key_part(key_args) + _key_part(tuple(sorted(kwargs.items())))
+            key = f'{prefix}:{hashlib.md5(raw.encode()).hexdigest()}'
+            return TwoTierCache().get_or_set(ns, key, lambda: func(*args, **kwargs), timeout)
+
+        return wrapper
+    return decorator
@@ -0,0 +1,44 @@
+from core.super.models import CartItem
+from core.super.services.cache_service import TwoTierCache
+
+# Contador del badge del carrito en caché por usuario.
+#
+# cart_count_processor corre en CADA render de template (incluidas las
+# páginas de admin), y antes hacía Cart.objects.get + items.count() cada
+# vez. Ahora lee una entrada de la caché de dos niveles, compartida entre
+# workers. Las vistas del carrito la reescriben al cambiarlo, y el
+# post_save / post_delete de CartItem (signals.py) invalida el namespace
+# 'cart:<user_id>' al confirmar: también los borrados en cascada de un
+# producto o de un carrito, y lo que haga otro worker.
+CART_COUNT_TIMEOUT = 60 * 60
+
+
+def cart_namespace(user_id):
+    return f'cart:{user_id}'
+
+
+class CartCountService:
+    """Lee y mantiene el número de productos distintos en el carrito de un usuario."""
+
+    KEY = 'cart_count'
+
+    def __init__(self):
+        self.cache = TwoTierCache()
+
+    def get(self, user) -> int:
+        if not user.is_authenticated:
+            return 0
+        count = self.cache.get(cart_namespace(user.pk), self.KEY)
+        if count is None:
+            count = self.refresh(user)
+        return count
+
+    def refresh(self, user) -> int:
+        """Recalcula desde la BD (una sola query) y guarda el resultado."""
+        count = CartItem.objects.filter(cart__user=user).count()
+        self.cache.set(cart_namespace(user.pk), self.KEY, count, CART_COUNT_TIMEOUT)
+        return count
+
+    def clear(self, user):
+        """El carrito quedó vacío (ej. después del checkout): no hace falta consultar."""
+        self.cache.set(cart_namespace(user.pk), self.KEY, 0, CART_COUNT_TIMEOUT)
@@ -0,0 +1,16 @@
+from core.super.models import Category, Brand
+from core.super.services.cache_service import cached
+
+# Listas para los filtros de la tienda y el catálogo. Cambian muy rara
+# vez y se pedían en cada página: quedan en la caché de dos niveles bajo
+# el namespace "catalog", que se invalida al guardar/borrar Category o Brand.
+
+
+@cached('catalog', timeout=60 * 60)
+def get_categories():
+    return list(Category.objects.all())
+
+
+@cached('catalog', timeout=60 * 60)
+def get_brands():
+    return list(Brand.objects.all())
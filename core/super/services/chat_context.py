@@ -3,6 +3,7 @@ from django.db.models import Sum, Count, Avg
 from django.utils import timezone
 from datetime import timedelta
 from decimal import Decimal
+from core.super.services.cache_service import cached
 
 
 # ─────────────────────────────────────────────────────────────────
@@ -56,6 +57,7 @@ def _get_recent_products(days: int = 14, limit: int = 10):
 class StoreContextBuilder:
     """Construye el contexto de inventario para el chatbot (todos los roles)."""
 
+    @cached('catalog', timeout=10 * 60)
     def build(self) -> str:
         categories = list(Category.objects.values_list('name', flat=True).order_by('name'))
         brands = list(Brand.objects.values_list('name', flat=True).order_by('name'))
@@ -124,90 +126,97 @@ class SalesContextBuilder:
     """Construye el contexto de ventas solo para admins."""
 
     def build(self) -> str:
+        # El error se arma fuera de la función cacheada: un fallo pasajero
+        # de la BD no debe quedar guardado como si fuera el contexto.
         try:
-            now = timezone.now()
-            last_24h = now - timedelta(hours=24)
-            last_7d  = now - timedelta(days=7)
-            last_30d = now - timedelta(days=30)
-
-            count_24h = Sale.objects.filter(sale_date__gte=last_24h).count()
-            count_7d  = Sale.objects.filter(sale_date__gte=last_7d).count()
-            count_30d = Sale.objects.filter(sale_date__gte=last_30d).count()
-            count_all = Sale.objects.count()
-
-            total_24h = Sale.objects.filter(sale_date__gte=last_24h).aggregate(t=Sum('total'))['t'] or Decimal('0.00')
-            total_7d  = Sale.objects.filter(sale_date__gte=last_7d).aggregate(t=Sum('total'))['t'] or Decimal('0.00')
-            total_30d = Sale.objects.filter(sale_date__gte=last_30d).aggregate(t=Sum('total'))['t'] or Decimal('0.00')
-            avg_ticket= Sale.objects.filter(sale_date__gte=last_30d).aggregate(a=Avg('total'))['a'] or Decimal('0.00')
-
-            recent_sales = (
-                Sale.objects
-                .select_related("customer", "payment", "seller")
-                .order_by("-sale_date")[:10]
-            )
+            return self._build()
+        except Exception as exc:
+            return f"(Error al cargar datos de ventas: {exc})"
 
-            recent_lines = []
-            for s in recent_sales:
-                fecha   = s.sale_date.strftime('%d/%m/%Y %H:%M')
-                cliente = s.customer.get_full_name() if s.customer else "Sin cliente"
-                pago    = s.payment.name if s.payment else "N/A"
-                vendedor= s.seller.get_full_name() if s.seller else "N/A"
-                recent_lines.append(
-                    f"  - Venta #{s.id_sale:06d} | {fecha} | Cliente: {cliente} "
-                    f"| Vendedor: {vendedor} | Pago: {pago} | Total: ${s.total:.2f}"
-                )
+    # Incluye ventanas relativas a "ahora" (24h/7d/30d): TTL corto además
+    # de la invalidación por namespace.
+    @cached(('sales', 'catalog'), timeout=60)
+    def _build(self) -> str:
+        now = timezone.now()
+        last_24h = now - timedelta(hours=24)
+        last_7d  = now - timedelta(days=7)
+        last_30d = now - timedelta(days=30)
+
+        count_24h = Sale.objects.filter(sale_date__gte=last_24h).count()
+        count_7d  = Sale.objects.filter(sale_date__gte=last_7d).count()
+        count_30d = Sale.objects.filter(sale_date__gte=last_30d).count()
+        count_all = Sale.objects.count()
+
+        total_24h = Sale.objects.filter(sale_date__gte=last_24h).aggregate(t=Sum('total'))['t'] or Decimal('0.00')
+        total_7d  = Sale.objects.filter(sale_date__gte=last_7d).aggregate(t=Sum('total'))['t'] or Decimal('0.00')
+        total_30d = Sale.objects.filter(sale_date__gte=last_30d).aggregate(t=Sum('total'))['t'] or Decimal('0.00')
+        avg_ticket= Sale.objects.filter(sale_date__gte=last_30d).aggregate(a=Avg('total'))['a'] or Decimal('0.00')
+
+        recent_sales = (
+            Sale.objects
+            .select_related("customer", "payment", "seller")
+            .order_by("-sale_date")[:10]
+        )
 
-            top_products = (
-                SaleDetail.objects
-                .filter(sale__sale_date__gte=last_30d)
-                .values("product__name")
-                .annotate(total_qty=Sum("quantity"), total_rev=Sum("subtotal"))
-                .order_by("-total_qty")[:5]
+        recent_lines = []
+        for s in recent_sales:
+            fecha   = s.sale_date.strftime('%d/%m/%Y %H:%M')
+            cliente = s.customer.get_full_name() if s.customer else "Sin cliente"
+            pago    = s.payment.name if s.payment else "N/A"
+            vendedor= s.seller.get_full_name() if s.seller else "N/A"
+            recent_lines.append(
+                f"  - Venta #{s.id_sale:06d} | {fecha} | Cliente: {cliente} "
+                f"| Vendedor: {vendedor} | Pago: {pago} | Total: ${s.total:.2f}"
             )
 
-            top_lines = [
-                f"  {i}. {tp['product__name']} — {tp['total_qty']} uds. / ${tp['total_rev']:.2f}"
-                for i, tp in enumerate(top_products, 1)
-            ]
+        top_products = (
+            SaleDetail.objects
+            .filter(sale__sale_date__gte=last_30d)
+            .values("product__name")
+            .annotate(total_qty=Sum("quantity"), total_rev=Sum("subtotal"))
+            .order_by("-total_qty")[:5]
+        )
 
-            # Alertas de stock bajo
-            low_stock = _get_low_stock_products(threshold=5)
-            out_count = _get_out_of_stock_count()
-
-            parts = [
-                "RESUMEN DE VENTAS (tiempo real):",
-                f"  • Últimas 24 horas : {count_24h} venta(s) | ${total_24h:.2f}",
-                f"  • Últimos 7 días   : {count_7d} venta(s) | ${total_7d:.2f}",
-                f"  • Últimos 30 días  : {count_30d} venta(s) | ${total_30d:.2f}",
-                f"  • Ticket promedio  : ${avg_ticket:.2f}",
-                f"  • Total histórico  : {count_all} venta(s)",
-            ]
+        top_lines = [
+            f"  {i}. {tp['product__name']} — {tp['total_qty']} uds. / ${tp['total_rev']:.2f}"
+            for i, tp in enumerate(top_products, 1)
+        ]
 
-            if recent_lines:
-                parts.append(f"\nÚLTIMAS {len(recent_lines)} VENTA(S):")
-                parts.extend(recent_lines)
+        # Alertas de stock bajo
+        low_stock = _get_low_stock_products(threshold=5)
+        out_count = _get_out_of_stock_count()
 
-            if top_lines:
-                parts.append("\nTOP 5 PRODUCTOS (últimos 30 días):")
-                parts.extend(top_lines)
+        parts = [
+            "RESUMEN DE VENTAS (tiempo real):",
+            f"  • Últimas 24 horas : {count_24h} venta(s) | ${total_24h:.2f}",
+            f"  • Últimos 7 días   : {count_7d} venta(s) | ${total_7d:.2f}",
+            f"  • Últimos 30 días  : {count_30d} venta(s) | ${total_30d:.2f}",
+            f"  • Ticket promedio  : ${avg_ticket:.2f}",
+            f"  • Total histórico  : {count_all} venta(s)",
+        ]
 
-            # Alertas de inventario
-            parts.append(f"\nALERTAS DE INVENTARIO:")
-            parts.append(f"  • Productos agotados: {out_count}")
-            if low_stock:
-                parts.append(f"  • Stock crítico (≤5 unidades):")
-                for p in low_stock:
-                    parts.append(
-                        f"    - {p['name']} | Stock: {p['stock']} | "
-                        f"Cat: {p['category__name'] or 'N/A'}"
-                    )
-            else:
-                parts.append("  • Sin productos en stock crítico ✅")
+        if recent_lines:
+            parts.append(f"\nÚLTIMAS {len(recent_lines)} VENTA(S):")
+            parts.extend(recent_lines)
 
-            return "\n".join(parts)
+        if top_lines:
+            parts.append("\nTOP 5 PRODUCTOS (últimos 30 días):")
+            parts.extend(top_lines)
 
-        except Exception as exc:
-            return f"(Error al cargar datos de ventas: {exc})"
+        # Alertas de inventario
+        parts.append(f"\nALERTAS DE INVENTARIO:")
+        parts.append(f"  • Productos agotados: {out_count}")
+        if low_stock:
+            parts.append(f"  • Stock crítico (≤5 unidades):")
+            for p in low_stock:
+                parts.append(
+                    f"    - {p['name']} | Stock: {p['stock']} | "
+                    f"Cat: {p['category__name'] or 'N/A'}"
+                )
+        else:
+            parts.append("  • Sin productos en stock crítico ✅")
+
+        return "\n".join(parts)
 
 
 class CustomerContextBuilder:
@@ -286,6 +295,7 @@ class CustomerContextBuilder:
 class GuestContextBuilder:
     """Contexto mínimo y motivador para visitantes no autenticados."""
 
+    @cached('catalog', timeout=10 * 60)
     def build(self) -> str:
         total_products = Product.objects.filter(state=True, stock__gt=0).count()
         total_cats = Category.objects.count()
@@ -362,45 +372,60 @@ def get_admin_quick_summary() -> dict:
     Se serializa a JSON y se envía en la respuesta de apertura.
     """
     try:
-        now = timezone.now()
-        last_24h = now - timedelta(hours=24)
-        last_7d  = now - timedelta(days=7)
-
-        sales_24h = Sale.objects.filter(sale_date__gte=last_24h)
-        total_24h = sales_24h.aggregate(t=Sum('total'))['t'] or Decimal('0')
-        count_24h = sales_24h.count()
-
-        sales_7d  = Sale.objects.filter(sale_date__gte=last_7d)
-        total_7d  = sales_7d.aggregate(t=Sum('total'))['t'] or Decimal('0')
-
-        low_stock = _get_low_stock_products(5)
-        out_count = _get_out_of_stock_count()
-
-        return {
-            'count_24h': count_24h,
-            'total_24h': float(total_24h),
-            'total_7d':  float(total_7d),
-            'low_stock_count': len(low_stock),
-            'out_of_stock': out_count,
-            'low_stock_items': [
-                {'name': p['name'], 'stock': p['stock']}
-                for p in low_stock[:3]
-            ],
-        }
+        return _admin_quick_summary()
     except Exception:
-        return {}
+        return {}  # sin cachear: el próximo pedido vuelve a intentar
 
 
 def get_customer_quick_summary(user) -> dict:
     """Datos para el saludo inicial del cliente."""
     try:
-        orders = Sale.objects.filter(user=user)
-        total_spent = orders.aggregate(t=Sum('total'))['t'] or Decimal('0')
-        last_order = orders.order_by('-sale_date').first()
-        return {
-            'order_count': orders.count(),
-            'total_spent': float(total_spent),
-            'last_order_date': last_order.sale_date.strftime('%d/%m/%Y') if last_order else None,
-        }
+        return _customer_quick_summary(user)
     except Exception:
         return {}
+
+
+def user_namespace(user_id) -> str:
+    """Namespace de los datos cacheados por usuario comprador (lo invalida cada Sale con ese user)."""
+    return f'user:{user_id}'
+
+
+@cached(('sales', 'catalog'), timeout=60)
+def _admin_quick_summary() -> dict:
+    now = timezone.now()
+    last_24h = now - timedelta(hours=24)
+    last_7d  = now - timedelta(days=7)
+
+    sales_24h = Sale.objects.filter(sale_date__gte=last_24h)
+    total_24h = sales_24h.aggregate(t=Sum('total'))['t'] or Decimal('0')
+    count_24h = sales_24h.count()
+
+    sales_7d  = Sale.objects.filter(sale_date__gte=last_7d)
+    total_7d  = sales_7d.aggregate(t=Sum('total'))['t'] or Decimal('0')
+
+    low_stock = _get_low_stock_products(5)
+    out_count = _get_out_of_stock_count()
+
+    return {
+        'count_24h': count_24h,
+        'total_24h': float(total_24h),
+        'total_7d':  float(total_7d),
+        'low_stock_count': len(low_stock),
+        'out_of_stock': out_count,
+        'low_stock_items': [
+            {'name': p['name'], 'stock': p['stock']}
+            for p in low_stock[:3]
+        ],
+    }
+
+
+@cached(lambda user: user_namespace(user.pk), timeout=5 * 60)
+def _customer_quick_summary(user) -> dict:
+    orders = Sale.objects.filter(user=user)
+    total_spent = orders.aggregate(t=Sum('total'))['t'] or Decimal('0')
+    last_order = orders.order_by('-sale_date').first()
+    return {
+        'order_count': orders.count(),
+        'total_spent': float(total_spent),
+        'last_order_date': last_order.sale_date.strftime('%d/%m/%Y') if last_order else None,
+    }
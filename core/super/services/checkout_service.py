@@ -1,7 +1,12 @@
 from decimal import Decimal
+from django.db import transaction
 from django.utils import timezone
-from django.db.models import F
-from core.super.models import Sale, SaleDetail, Customer, Seller, PaymentMethod, Product
+from django.db.models import F, Case, When, IntegerField
+from django.db.models.signals import post_delete
+from core.super.models import Sale, SaleDetail, SaleEvent, Customer, Seller, PaymentMethod, Product, InventoryMovement
+from core.super.services.inventory_service import InventoryService
+from core.super.services.sale_event_service import SaleEventService
+from core.super.services.stock_shard_service import StockShardService
 
 # SRP — Extraer servicios de CheckoutView y sale.py
 
@@ -15,6 +20,39 @@ DISCOUNT_ELIGIBLE_PAYMENT_NAMES = {
     'tarjeta de débito',
 }
 
+# DNI compartido por los registros "centinela": el Customer "CONSUMIDOR FINAL"
+# y el Seller "Vendedor Online". Son filas fijas que casi nunca cambian, así
+# que su id se resuelve UNA vez por proceso en vez de un get_or_create en
+# cada checkout. Si alguien borra la fila, el post_delete de abajo olvida el
+# id cacheado y el siguiente checkout la vuelve a crear. El id se cachea
+# recién en el commit del checkout que lo resolvió.
+SENTINEL_DNI = '9999999999'
+FINAL_CUSTOMER_DEFAULTS = {'name': 'CONSUMIDOR', 'last_name': 'FINAL', 'address': 'S/N'}
+ONLINE_SELLER_DEFAULTS = {'name': 'Vendedor', 'last_name': 'Online'}
+
+_sentinel_ids = {}
+
+
+def _get_sentinel_id(model, defaults):
+    """Devuelve el pk del registro centinela de `model`, creándolo la primera vez."""
+    pk = _sentinel_ids.get(model)
+    if pk is None:
+        obj, _ = model.objects.get_or_create(dni=SENTINEL_DNI, defaults=defaults)
+        pk = obj.pk
+        # Se cachea recién cuando la fila está confirmada: si el checkout
+        # que la creó hace rollback, el pk no queda apuntando a la nada.
+        transaction.on_commit(lambda: _sentinel_ids.__setitem__(model, pk))
+    return pk
+
+
+def clear_sentinel_cache(**kwargs):
+    """Olvida los ids centinela cacheados (usado por el post_delete y por los tests)."""
+    _sentinel_ids.clear()
+
+
+post_delete.connect(clear_sentinel_cache, sender=Customer, dispatch_uid='checkout_sentinel_customer')
+post_delete.connect(clear_sentinel_cache, sender=Seller, dispatch_uid='checkout_sentinel_seller')
+
 # Clase que se encarga de resolver el checkout (SRP - Single Responsibility Principle)
 class CheckoutService:
     """Orquesta la creación de una venta desde el carrito."""
@@ -28,14 +66,14 @@ class CheckoutService:
         - dni_type == 'personal' → Cliente identificado por su email/DNI (puede tener descuento)
         """
         if dni_type == 'final':
-            customer, _ = Customer.objects.get_or_create(
-                dni='9999999999',
-                defaults={
-                    'name': 'CONSUMIDOR', 
-                    'last_name': 'FINAL', 
-                    'address': 'S/N'
-                }
+            # Instancia liviana con el pk cacheado: Consumidor Final nunca
+            # tiene descuento, así que no hace falta leer la fila completa.
+            customer = Customer(
+                id_customer=_get_sentinel_id(Customer, FINAL_CUSTOMER_DEFAULTS),
+                dni=SENTINEL_DNI,
+                **FINAL_CUSTOMER_DEFAULTS,
             )
+            customer._state.adding = False
             return customer
 
         customer, _ = Customer.objects.get_or_create(
@@ -66,7 +104,8 @@ class CheckoutService:
         En cualquier otro caso (Consumidor Final, Transferencia, descuento expirado)
         el descuento se fija en 0.
         """
-        cart_total = cart.get_total()
+        summary = cart.get_summary()
+        cart_total = summary.total
         discount_amount = Decimal('0.00')
  
         is_eligible_payment = payment_name.lower() in DISCOUNT_ELIGIBLE_PAYMENT_NAMES
@@ -75,8 +114,8 @@ class CheckoutService:
         if is_personal and is_eligible_payment and customer.has_active_discount():
             discount_amount = cart_total * (customer.discount_percentage / 100)
         return {
-            'subtotal': cart.get_subtotal(),
-            'iva': cart.get_iva(),
+            'subtotal': summary.subtotal,
+            'iva': summary.iva,
             'discount': discount_amount,
             'total': cart_total - discount_amount,
         }
@@ -85,14 +124,10 @@ class CheckoutService:
     def create_sale(self, user, customer, payment_id, totals,
                     amount_received, change, idempotency_key,
                     card_number_masked='', transfer_account_masked=''):
-        seller, _ = Seller.objects.get_or_create(
-            dni='9999999999',
-            defaults={'name': 'Vendedor', 'last_name': 'Online'}
-        )
         return Sale.objects.create(
             user=user,
             customer=customer,
-            seller=seller,
+            seller_id=_get_sentinel_id(Seller, ONLINE_SELLER_DEFAULTS),
             payment_id=payment_id,
             sale_date=timezone.now(),
             idempotency_key=idempotency_key,
@@ -108,32 +143,109 @@ class CheckoutService:
         """
         Registra el detalle de venta y descuenta el stock de cada producto.
 
-        select_for_update() bloquea la fila del producto (fix del race
-        condition de stock). Aquí también se revalida is_expired: un
-        producto pudo caducar entre que el cliente lo agregó al carrito
-        y el momento en que paga — mismo principio de "revalidar en el
-        instante crítico" que ya se aplica al stock.
+        Todo el carrito se procesa en lote, con un número de queries fijo
+        sin importar cuántas líneas tenga:
+
+        1. Un solo SELECT ... FOR UPDATE bloquea todos los productos, en
+           orden de pk — dos checkouts concurrentes toman los locks en el
+           mismo orden, así que no pueden hacer deadlock entre sí. Los
+           productos en modo sharded se leen sin bloquear (ver
+           StockShardService).
+        2. Stock y caducidad se validan en memoria sobre las filas ya
+           bloqueadas. También se revalida is_expired: un producto pudo
+           caducar entre que el cliente lo agregó al carrito y el momento
+           en que paga — "revalidar en el instante crítico".
+        3. Los SaleDetail se insertan con un único bulk_create.
+        4. Todos los descuentos de stock van en un solo UPDATE con CASE,
+           usando F() para que la resta ocurra en la BD.
+        5. El evento 'created' se escribe en el outbox (SaleEvent) dentro
+           de la misma transacción.
         """
-        for item in items:
-            product = Product.objects.select_for_update().get(pk=item.product_id)
+        lines = list(items)
+        if not lines:
+            items.delete()
+            return
+
+        quantities = {}
+        for item in lines:
+            quantities[item.product_id] = quantities.get(item.product_id, 0) + item.quantity
+
+        # Los productos sharded NO se bloquean: su stock se descuenta por
+        # shard en decrement_stock, que es lo que evita la cola en promociones.
+        products = {
+            product.pk: product
+            for product in Product.objects.select_for_update().filter(pk__in=quantities, stock_shards=0).order_by('pk')
+        }
+        missing = quantities.keys() - products.keys()
+        if missing:
+            products.update((product.pk, product) for product in Product.objects.filter(pk__in=missing))
+
+        details = []
+        for item in lines:
+            product = products.get(item.product_id)
+            if product is None:
+                raise Product.DoesNotExist('Product matching query does not exist.')
 
             if product.is_expired:
                 raise ValueError(f"'{product.name}' está caducado y no se puede vender.")
 
-            if product.stock < item.quantity:
+            # Sharded: la validación la hace StockShardService.consume con los shards bloqueados.
+            if not product.stock_shards and product.stock < quantities[product.pk]:
                 raise ValueError(
                     f"Stock insuficiente para '{product.name}'. "
-                    f"Disponible: {product.stock}, solicitado: {item.quantity}"
+                    f"Disponible: {product.stock}, solicitado: {quantities[product.pk]}"
                 )
 
-            SaleDetail.objects.create(
+            details.append(SaleDetail(
                 sale=sale,
                 product=product,
                 quantity=item.quantity,
                 price=product.price,
-                subtotal=item.get_subtotal(),
-            )
+                subtotal=product.price * item.quantity,
+            ))
+
+        SaleDetail.objects.bulk_create(details)
+        decrement_stock(quantities, sale_ref=sale.pk)
+        SaleEventService().record(sale, SaleEvent.EventType.CREATED, details=details)
 
-            Product.objects.filter(pk=product.pk).update(stock=F('stock') - item.quantity)
+        items.delete()
 
-        items.delete()
\ No newline at end of file
+
+def decrement_stock(quantities, reason=InventoryMovement.Reason.SALE, sale_ref=None, record=True):
+    """
+    Descuenta stock de varios productos en un solo UPDATE.
+
+    `quantities` es {product_id: cantidad}. Cada fila recibe su propia
+    resta vía CASE; una cantidad negativa devuelve stock (edición de
+    ventas). La restricción product_stock_non_negative sigue siendo la
+    última línea de defensa en la BD.
+
+    Los productos en modo sharded (stock_shards > 0) no se tocan en ese
+    UPDATE: su stock se mueve en StockShard. Solo cuesta una consulta
+    extra cuando el lote incluye alguno.
+
+    Cada llamada deja sus movimientos en el ledger (InventoryMovement) con
+    un solo INSERT. record=False es para quien registra el ledger por su
+    cuenta (ej. la sincronización POS, que lo separa por venta).
+    """
+    if not quantities:
+        return 0
+    updated = Product.objects.filter(pk__in=quantities, stock_shards=0).update(
+        stock=Case(
+            *[When(pk=pk, then=F('stock') - qty) for pk, qty in quantities.items()],
+            default=F('stock'),
+            output_field=IntegerField(),
+        )
+    )
+    if updated < len(quantities):
+        shard_service = StockShardService()
+        sharded = Product.objects.filter(pk__in=quantities, stock_shards__gt=0).values_list('pk', flat=True)
+        for pk in sorted(sharded):
+            if quantities[pk] > 0:
+                shard_service.consume(pk, quantities[pk])
+            elif quantities[pk] < 0:
+                shard_service.restore(pk, -quantities[pk])
+            updated += 1
+    if record:
+        InventoryService().record({pk: -qty for pk, qty in quantities.items()}, reason, sale_ref)
+    return updated
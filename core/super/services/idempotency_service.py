@@ -1,5 +1,17 @@
+import time
 import uuid
-from core.super.models import Sale
+from datetime import timedelta
+from django.db import connection
+from django.utils import timezone
+from core.super.models import Sale, IdempotencyKey
+
+# Cuánto vive una reserva. Solo importa si el proceso que la tomó muere a
+# mitad de camino: pasado este tiempo la clave se puede volver a reclamar.
+# Una vez asociada a una venta, Sale.idempotency_key sigue protegiendo.
+RESERVATION_TTL = timedelta(minutes=15)
+# Cuánto espera la request "perdedora" a que la ganadora termine.
+WAIT_SECONDS = 5
+POLL_INTERVAL = 0.2
 
 # Singleton seguro para IdempotencyService
 
@@ -29,4 +41,70 @@ class IdempotencyService:
     def find_existing(self, key) -> Sale | None:
         if key is None:
             return None
-        return Sale.objects.filter(idempotency_key=key).first()
\ No newline at end of file
+        return Sale.objects.filter(idempotency_key=key).first()
+
+    # ── Reserva single-flight ────────────────────────────────────────────
+
+    def reserve(self, key) -> bool:
+        """
+        Reclama la clave de forma atómica. True = esta request es la dueña.
+
+        Debe llamarse FUERA de transaction.atomic (en autocommit) y antes de
+        bloquear cualquier producto: así la reserva es visible de inmediato
+        para la request concurrente, que no llega a tocar el stock.
+        """
+        if self._insert_reservation(key):
+            return True
+        # La reserva existente puede ser de un proceso que murió sin
+        # liberarla: si ya venció y no tiene venta, se libera y se reintenta.
+        stale = IdempotencyKey.objects.filter(
+            key=key, sale__isnull=True, expires_at__lt=timezone.now()
+        ).delete()[0]
+        return bool(stale) and self._insert_reservation(key)
+
+    def _insert_reservation(self, key) -> bool:
+        now = timezone.now()
+        opts = IdempotencyKey._meta
+        fields = [opts.get_field(name) for name in ('key', 'created_at', 'expires_at')]
+        values = [
+            field.get_db_prep_value(value, connection)
+            for field, value in zip(fields, (key, now, now + RESERVATION_TTL))
+        ]
+        qn = connection.ops.quote_name
+        sql = (
+            f"INSERT INTO {qn(opts.db_table)} ({', '.join(qn(f.column) for f in fields)}) "
+            f"VALUES (%s, %s, %s) ON CONFLICT ({qn(fields[0].column)}) DO NOTHING"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, values)
+            return cursor.rowcount == 1
+
+    def attach_sale(self, key, sale):
+        """Asocia la venta a la reserva (dentro de la misma transacción que la crea)."""
+        IdempotencyKey.objects.filter(key=key).update(sale=sale)
+
+    def release(self, key):
+        """Libera la reserva si la venta no llegó a confirmarse (no toca reservas ya asociadas)."""
+        IdempotencyKey.objects.filter(key=key, sale__isnull=True).delete()
+
+    def wait_for_sale(self, key, timeout=WAIT_SECONDS) -> Sale | None:
+        """
+        Espera a que la request dueña de la clave confirme su venta.
+
+        Devuelve None si la reserva desaparece (la dueña falló y la liberó)
+        o si se agota el tiempo.
+        """
+        deadline = time.monotonic() + timeout
+        while True:
+            row = IdempotencyKey.objects.filter(key=key).values('sale_id').first()
+            if row is None:
+                return self.find_existing(key)
+            if row['sale_id']:
+                return Sale.objects.filter(pk=row['sale_id']).first()
+            if time.monotonic() >= deadline:
+                return None
+            time.sleep(POLL_INTERVAL)
+
+    def purge_expired(self) -> int:
+        """Borra en un solo DELETE todas las reservas vencidas."""
+        return IdempotencyKey.objects.filter(expires_at__lt=timezone.now()).delete()[0]
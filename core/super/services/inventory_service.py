@@ -0,0 +1,139 @@
+"""
+Ledger de inventario: movimientos, fotos periódicas y stock a una fecha.
+
+- record(): agrega movimientos en un solo INSERT (lo llama decrement_stock).
+- take_snapshots(): foto por producto = foto anterior + movimientos nuevos.
+  Se corre periódicamente (comando snapshot_inventory).
+- stock_as_of(): foto más cercana anterior a la fecha + movimientos
+  posteriores a ella → el costo depende de los movimientos desde la última
+  foto, no del historial completo.
+- discrepancies(): compara el ledger con Product.stock en una sola pasada
+  en streaming (comando reconcile_inventory).
+"""
+
+from datetime import timedelta
+
+from django.db.models import Max, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from core.super.models import InventoryMovement, InventorySnapshot, Product, StockShard
+
+CHUNK_SIZE = 2000
+# Una foto solo incluye movimientos con al menos esta antigüedad: un
+# movimiento de una transacción todavía abierta puede tener un id menor
+# que otro ya confirmado, y la foto no debe "saltárselo".
+SNAPSHOT_SETTLE = timedelta(minutes=5)
+
+
+class InventoryService:
+    """Escritura y consultas del ledger de inventario."""
+
+    # ── Escritura ────────────────────────────────────────────────────────
+
+    def movements(self, deltas, reason, sale_ref=None):
+        """Arma (sin guardar) un movimiento por producto. `deltas` es {product_id: variación con signo}."""
+        now = timezone.now()
+        return [
+            InventoryMovement(product_id=pk, delta=delta, reason=reason, sale_ref=sale_ref, created_at=now)
+            for pk, delta in deltas.items() if delta
+        ]
+
+    def record(self, deltas, reason, sale_ref=None):
+        movements = self.movements(deltas, reason, sale_ref)
+        if movements:
+            InventoryMovement.objects.bulk_create(movements, batch_size=CHUNK_SIZE)
+        return movements
+
+    # ── Lectura ──────────────────────────────────────────────────────────
+
+    def _with_ledger(self, products, when=None, until_id=None):
+        """
+        Anota en cada producto la foto de referencia (snap_stock,
+        snap_movement) y la suma de movimientos posteriores (moved).
+        """
+        snapshots = InventorySnapshot.objects.filter(product=OuterRef('pk'))
+        if when is not None:
+            snapshots = snapshots.filter(taken_at__lte=when)
+        snapshots = snapshots.order_by('-taken_at', '-id')
+        products = products.annotate(
+            snap_stock=Subquery(snapshots.values('stock')[:1]),
+            snap_movement=Coalesce(Subquery(snapshots.values('last_movement_id')[:1]), 0),
+        )
+
+        movements = InventoryMovement.objects.filter(product=OuterRef('pk'), id__gt=OuterRef('snap_movement'))
+        if when is not None:
+            movements = movements.filter(created_at__lte=when)
+        if until_id is not None:
+            movements = movements.filter(id__lte=until_id)
+        return products.annotate(
+            moved=Subquery(movements.values('product').annotate(total=Sum('delta')).values('total')),
+        )
+
+    def stock_as_of(self, when, product_ids=None) -> dict:
+        """{product_id: stock según el ledger en `when`} para los productos con historial."""
+        products = Product.objects.all()
+        if product_ids is not None:
+            products = products.filter(pk__in=product_ids)
+        rows = self._with_ledger(products, when=when).values_list('pk', 'snap_stock', 'moved')
+        return {
+            pk: (snap_stock or 0) + (moved or 0)
+            for pk, snap_stock, moved in rows.iterator(chunk_size=CHUNK_SIZE)
+            if snap_stock is not None or moved is not None
+        }
+
+    def as_of(self, product_id, when) -> int | None:
+        """Stock de un producto en `when`; None si el ledger no tiene historial para él."""
+        return self.stock_as_of(when, [product_id]).get(product_id)
+
+    # ── Fotos ────────────────────────────────────────────────────────────
+
+    def take_snapshots(self, chunk_size=CHUNK_SIZE) -> int:
+        """Crea una foto por cada producto con movimientos desde su foto anterior."""
+        cutoff = InventoryMovement.objects.filter(
+            created_at__lt=timezone.now() - SNAPSHOT_SETTLE
+        ).aggregate(last=Max('id'))['last']
+        if cutoff is None:
+            return 0
+
+        rows = self._with_ledger(Product.objects.all(), until_id=cutoff).values_list('pk', 'snap_stock', 'moved')
+        now = timezone.now()
+        batch, count = [], 0
+        for pk, snap_stock, moved in rows.iterator(chunk_size=chunk_size):
+            if moved is None:
+                continue  # sin movimientos nuevos: la foto anterior sigue vigente
+            batch.append(InventorySnapshot(
+                product_id=pk, stock=(snap_stock or 0) + moved, last_movement_id=cutoff, taken_at=now,
+            ))
+            if len(batch) >= chunk_size:
+                InventorySnapshot.objects.bulk_create(batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            InventorySnapshot.objects.bulk_create(batch)
+            count += len(batch)
+        return count
+
+    # ── Reconciliación ───────────────────────────────────────────────────
+
+    def discrepancies(self, chunk_size=CHUNK_SIZE):
+        """
+        Genera (product_id, nombre, stock_ledger | None, stock_real) para
+        cada producto cuyo ledger no coincide. Una sola consulta en
+        streaming; en productos sharded el stock real es la suma de shards.
+        """
+        shard_total = Subquery(
+            StockShard.objects.filter(product=OuterRef('pk'))
+            .values('product').annotate(total=Sum('stock')).values('total')
+        )
+        rows = (
+            self._with_ledger(Product.objects.all())
+            .annotate(shard_total=shard_total)
+            .values_list('pk', 'name', 'stock', 'stock_shards', 'shard_total', 'snap_stock', 'moved')
+        )
+        for pk, name, stock, shards, shard_total, snap_stock, moved in rows.iterator(chunk_size=chunk_size):
+            actual = (shard_total or 0) if shards else (stock or 0)
+            has_history = snap_stock is not None or moved is not None
+            ledger = (snap_stock or 0) + (moved or 0) if has_history else None
+            if ledger != actual and not (ledger is None and actual == 0):
+                yield pk, name, ledger, actual
@@ -3,91 +3,487 @@ Market basket analysis: detecta qué productos se compran juntos con
 frecuencia, usando el historial real de SaleDetail. No usa nada de
 machine learning — es conteo de co-ocurrencia + confianza, el mismo
 principio detrás de "la gente que compró esto también compró...".
+
+Los conteos viven en dos tablas que se actualizan de forma incremental
+desde el outbox (MarketBasketConsumer):
+
+- ProductBasketCount: en cuántas ventas (de 2+ productos) aparece cada uno.
+- ProductPairCount: cuántas ventas contienen cada par.
+
+Una venta nueva suma su canasta, una eliminada la resta y una editada
+resta la canasta vieja y suma la nueva. Después se recalculan la
+confianza y el top-N SOLO de los productos tocados.
+
+La reconstrucción cuenta todas las ventas confirmadas, también las que
+todavía tienen su evento pendiente en el outbox. Por eso guarda el mayor
+id de evento que vio (MarketBasketState.counted_through_event) y
+apply_events() descarta los eventos hasta ese id: de otro modo esas
+ventas se contarían dos veces. Queda una carrera de milisegundos con
+checkouts que confirman MIENTRAS se reconstruye; --verify la detecta.
+
+recalculate_all() reconstruye todo desde SaleDetail (carga inicial y
+verificación); verify() compara lo guardado contra un recuento sin
+escribir nada. Las afinidades siempre se reemplazan dentro de una
+transacción: el carrito nunca ve la tabla vacía.
+
+Ventana y decaimiento: la reconstrucción solo lee las ventas de los
+últimos WINDOW_DAYS días y pesa cada una por su antigüedad (la mitad
+cada HALF_LIFE_DAYS). La confianza es peso(A y B) / peso(A); el mínimo
+de co-ocurrencia se sigue exigiendo sobre el conteo sin pesar. Los
+parámetros usados quedan en MarketBasketState y el incremental los
+respeta hasta la próxima reconstrucción.
+
+La reconstrucción tiene dos motores:
+
+- 'sql' (por defecto): todo dentro de la base. Auto-join de SaleDetail
+  por venta (a.product_id < b.product_id) agrupado por par, ranking
+  top-N por producto con funciones de ventana y escritura con
+  INSERT ... SELECT. No viaja ninguna línea de venta a Python.
+- 'python': recorre las líneas ordenadas por sale_date en lotes (cursor
+  del lado del servidor en PostgreSQL); la memoria crece con la cantidad
+  de pares distintos, no con la de líneas. verify() lo usa para tener un
+  recuento independiente.
+
+Canastas de más de MAX_BASKET_SIZE productos distintos (compras
+mayoristas, cargas de inventario) se ignoran en los dos motores y en el
+incremental: sus pares crecen en forma cuadrática y no dicen nada de
+qué se compra junto.
 """
 
+import math
 from collections import defaultdict
-from itertools import combinations
-from core.super.models import SaleDetail, ProductAffinity
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from itertools import combinations, groupby
+from operator import itemgetter
+
+from django.db import connection, transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from core.super.models import (
+    Sale, SaleDetail, SaleEvent, Product, ProductAffinity, ProductBasketCount, ProductPairCount, MarketBasketState,
+)
+from core.super.services.rollup_service import event_datetime
+
+UPSERT_BATCH_SIZE = 500
+STREAM_CHUNK_SIZE = 5000
+
+ENGINE_SQL = 'sql'
+ENGINE_PYTHON = 'python'
+ENGINES = (ENGINE_SQL, ENGINE_PYTHON)
+
+WINDOW_DAYS = 180     # None = todo el historial
+HALF_LIFE_DAYS = 90   # None = sin decaimiento (todas las ventas pesan 1)
+
+
+@dataclass(frozen=True)
+class BasketWindow:
+    """Qué ventas cuentan (desde start) y cuánto pesa cada una (2 ** (edad / vida media))."""
+    start: datetime | None = None
+    epoch: datetime | None = None
+    half_life_days: int | None = None
+    counted_through_event: int | None = None
+
+    def includes(self, sale_date) -> bool:
+        return self.start is None or (sale_date is not None and sale_date >= self.start)
+
+    def weight(self, sale_date) -> float:
+        if not self.half_life_days or sale_date is None:
+            return 1.0
+        return 2 ** ((sale_date - self.epoch).total_seconds() / 86400 / self.half_life_days)
 
 
 class MarketBasketService:
     MIN_CO_OCCURRENCE = 3   # menos de esto, es coincidencia, no patrón
     MIN_CONFIDENCE = 0.3    # bajo 30% de "si compra A, compra B", no vale la pena sugerirlo
     TOP_N_PER_PRODUCT = 3   # cuántas sugerencias guardar por producto, para no acumular basura
+    MAX_BASKET_SIZE = 50    # más productos distintos que esto no es una canasta de cliente
+
+    def __init__(self, window_days=WINDOW_DAYS, half_life_days=HALF_LIFE_DAYS):
+        # Solo afectan a recalculate_all(); el resto usa lo guardado en MarketBasketState.
+        self.window_days = window_days or None
+        self.half_life_days = half_life_days or None
+
+    def recorded_window(self, lock=False) -> BasketWindow:
+        """Ventana de la última reconstrucción (sin reconstrucción: todo el historial, sin decaimiento)."""
+        states = MarketBasketState.objects.filter(pk=1)
+        if lock:
+            states = states.select_for_update()
+        state = states.first()
+        if state is None:
+            return BasketWindow()
+        return BasketWindow(state.window_start, state.epoch, state.half_life_days, state.counted_through_event)
+
+    # ── Incremental ──────────────────────────────────────────────────────
+
+    def apply_events(self, events) -> set:
+        """
+        apply_changes() con las fotos 'before'/'after' de eventos del
+        outbox, salvo los que la última reconstrucción ya contó.
+        """
+        with transaction.atomic():
+            window = self.recorded_window(lock=True)
+            baskets = {'before': [], 'after': []}
+            for event in events:
+                if window.counted_through_event is not None and event.pk <= window.counted_through_event:
+                    continue
+                for side, found in baskets.items():
+                    snap = event.payload.get(side)
+                    if snap:
+                        found.append((event_datetime(snap['sale_date']), [product_id for product_id, _, _ in snap['lines']]))
+            return self.apply_changes(removed=baskets['before'], added=baskets['after'])
+
+    def apply_changes(self, removed=(), added=()) -> set:
+        """
+        Resta las canastas `removed` y suma las `added` (pares (sale_date,
+        product_ids) por venta) y recalcula las afinidades de los productos
+        afectados. Devuelve esos productos.
+
+        Las canastas anteriores al inicio de la ventana se ignoran: la
+        reconstrucción no las contó, así que tampoco se restan.
+        """
+        with transaction.atomic():
+            window = self.recorded_window(lock=True)
+            product_deltas = defaultdict(lambda: [0, 0.0])
+            pair_deltas = defaultdict(lambda: [0, 0.0])
+            for baskets, sign in ((removed, -1), (added, 1)):
+                for sale_date, basket in baskets:
+                    products = sorted({product_id for product_id in basket if product_id})
+                    # Ventas de un solo producto no aportan co-ocurrencia
+                    if not 2 <= len(products) <= self.MAX_BASKET_SIZE or not window.includes(sale_date):
+                        continue
+                    weight = sign * window.weight(sale_date)
+                    for deltas, keys in ((product_deltas, products), (pair_deltas, combinations(products, 2))):
+                        for key in keys:
+                            deltas[key][0] += sign
+                            deltas[key][1] += weight
+
+            # Una edición que no cambia productos ni fecha se anula sola.
+            product_deltas = {k: tuple(v) for k, v in product_deltas.items() if any(v)}
+            pair_deltas = {k: tuple(v) for k, v in pair_deltas.items() if any(v)}
+            touched = set(product_deltas) | {product_id for pair in pair_deltas for product_id in pair}
+            if not touched:
+                return set()
+
+            # Las fotos de eventos viejos pueden nombrar productos ya eliminados.
+            existing = set(Product.objects.filter(pk__in=touched).values_list('pk', flat=True))
+            self._upsert(
+                ProductBasketCount, ('product',), ('basket_count', 'weight'),
+                [((product_id,), d) for product_id, d in product_deltas.items() if product_id in existing],
+            )
+            self._upsert(
+                ProductPairCount, ('product_low', 'product_high'), ('co_occurrence_count', 'weight'),
+                [(pair, d) for pair, d in pair_deltas.items() if set(pair) <= existing],
+            )
+            ProductBasketCount.objects.filter(product_id__in=touched, basket_count__lte=0).delete()
+            ProductPairCount.objects.filter(
+                Q(product_low_id__in=touched) | Q(product_high_id__in=touched), co_occurrence_count__lte=0,
+            ).delete()
+            self.refresh(touched & existing)
+        return touched & existing
+
+    def _upsert(self, model, key_fields, value_fields, rows):
+        """INSERT ... ON CONFLICT DO UPDATE SET n = n + delta, por lotes (PostgreSQL y SQLite)."""
+        if not rows:
+            return
+        opts = model._meta
+        qn = connection.ops.quote_name
+        keys = [qn(opts.get_field(name).column) for name in key_fields]
+        values = [qn(opts.get_field(name).column) for name in value_fields]
+        table = qn(opts.db_table)
+        placeholders = '(' + ', '.join(['%s'] * (len(keys) + len(values))) + ')'
+        for start in range(0, len(rows), UPSERT_BATCH_SIZE):
+            batch = rows[start:start + UPSERT_BATCH_SIZE]
+            sql = (
+                f"INSERT INTO {table} ({', '.join(keys + values)}) "
+                f"VALUES {', '.join([placeholders] * len(batch))} "
+                f"ON CONFLICT ({', '.join(keys)}) "
+                f"DO UPDATE SET {', '.join(f'{v} = {table}.{v} + EXCLUDED.{v}' for v in values)}"
+            )
+            params = [value for key, deltas in batch for value in (*key, *deltas)]
+            with connection.cursor() as cursor:
+                cursor.execute(sql, params)
 
-    def recalculate_all(self):
-        baskets = self._build_baskets()
-        purchase_counts = self._count_purchases_per_product(baskets)
-        co_counts = self._count_co_occurrences(baskets)
-
-        affinities = self._build_affinities(co_counts, purchase_counts)
-        affinities = self._keep_top_n_per_product(affinities)
-
-        # Reemplazo completo: las combinaciones cambian con el tiempo (productos
-        # nuevos, patrones que dejan de cumplirse), así que en vez de ir
-        # actualizando fila por fila, se recalcula desde cero cada vez.
-        ProductAffinity.objects.all().delete()
-        ProductAffinity.objects.bulk_create([
-            ProductAffinity(
-                product_a_id=a,
-                product_b_id=b,
-                co_occurrence_count=co_counts[frozenset((a, b))],
-                confidence=confidence,
+    def refresh(self, product_ids=None) -> int:
+        """
+        Recalcula confianza y top-N de los productos origen indicados (None
+        = todos) desde las tablas de conteo, y reemplaza sus afinidades en
+        una sola transacción.
+        """
+        counts = ProductBasketCount.objects.all()
+        pairs = ProductPairCount.objects.filter(co_occurrence_count__gte=self.MIN_CO_OCCURRENCE)
+        affinities = ProductAffinity.objects.all()
+        if product_ids is not None:
+            product_ids = set(product_ids)
+            counts = counts.filter(product_id__in=product_ids)
+            pairs = pairs.filter(Q(product_low_id__in=product_ids) | Q(product_high_id__in=product_ids))
+            affinities = affinities.filter(product_a_id__in=product_ids)
+
+        product_weights = dict(counts.values_list('product_id', 'weight'))
+        co_counts = {
+            (low, high): (co, weight)
+            for low, high, co, weight in pairs.values_list('product_low_id', 'product_high_id', 'co_occurrence_count', 'weight')
+        }
+        found = self._keep_top_n_per_product(self._build_affinities(co_counts, product_weights, sources=product_ids))
+
+        with transaction.atomic():
+            affinities.delete()
+            ProductAffinity.objects.bulk_create([
+                ProductAffinity(
+                    product_a_id=a,
+                    product_b_id=b,
+                    co_occurrence_count=co_counts[(min(a, b), max(a, b))][0],
+                    confidence=confidence,
+                )
+                for (a, b), confidence in found.items()
+            ])
+        return len(found)
+
+    # ── Reconstrucción completa / verificación ───────────────────────────
+
+    def recalculate_all(self, engine=ENGINE_SQL):
+        """
+        Recuenta las ventas de la ventana, reemplaza las tablas de conteo y
+        todas las afinidades, y registra la ventana usada.
+        """
+        if engine not in ENGINES:
+            raise ValueError(f'Motor inválido: {engine}')
+        now = timezone.now()
+        window = BasketWindow(
+            start=now - timedelta(days=self.window_days) if self.window_days else None,
+            epoch=now,
+            half_life_days=self.half_life_days,
+        )
+
+        with transaction.atomic():
+            # La fila de estado también serializa la reconstrucción con el incremental.
+            MarketBasketState.objects.get_or_create(pk=1)
+            state = MarketBasketState.objects.select_for_update().get(pk=1)
+            # Se lee ANTES de contar: todo evento hasta acá tiene su venta
+            # confirmada y, por lo tanto, incluida en el recuento.
+            counted_through = SaleEvent.objects.aggregate(last=Max('id'))['last']
+            ProductBasketCount.objects.all().delete()
+            ProductPairCount.objects.all().delete()
+
+            if engine == ENGINE_SQL:
+                ProductAffinity.objects.all().delete()
+                count = self._rebuild_in_db(window)
+            else:
+                products, pairs = self._count_history(window)
+                ProductBasketCount.objects.bulk_create(
+                    [ProductBasketCount(product_id=p, basket_count=n, weight=w) for p, (n, w) in products.items()],
+                    batch_size=UPSERT_BATCH_SIZE,
+                )
+                ProductPairCount.objects.bulk_create(
+                    [
+                        ProductPairCount(product_low_id=a, product_high_id=b, co_occurrence_count=n, weight=w)
+                        for (a, b), (n, w) in pairs.items()
+                    ],
+                    batch_size=UPSERT_BATCH_SIZE,
+                )
+                count = self.refresh()
+
+            state.window_days = self.window_days
+            state.half_life_days = self.half_life_days
+            state.window_start = window.start
+            state.epoch = window.epoch
+            state.counted_through_event = counted_through
+            state.save()
+        return count
+
+    def _rebuild_in_db(self, window) -> int:
+        """
+        Motor 'sql': tres INSERT ... SELECT sobre tablas ya vacías (conteo
+        por producto, conteo por par, afinidades). Funciona en PostgreSQL y
+        en SQLite (funciones de ventana desde 3.25; POWER lo registra Django).
+        """
+        qn = connection.ops.quote_name
+        detail, basket_count, pair_count, affinity = (
+            SaleDetail._meta, ProductBasketCount._meta, ProductPairCount._meta, ProductAffinity._meta,
+        )
+
+        def column(opts, name):
+            return qn(opts.get_field(name).column)
+
+        def prep(value):
+            return Sale._meta.get_field('sale_date').get_db_prep_value(value, connection)
+
+        sale, product = column(detail, 'sale'), column(detail, 'product')
+        sale_date = f"s.{column(Sale._meta, 'sale_date')}"
+        params = []
+        if window.half_life_days:
+            weight = f"POWER(2.0, COALESCE({_age_in_days(sale_date)}, 0) / %s)"
+            params += [prep(window.epoch), window.half_life_days]
+        else:
+            weight = "1.0"
+        in_window = ''
+        if window.start:
+            in_window = f" AND {sale_date} >= %s"
+            params.append(prep(window.start))
+        params.append(self.MAX_BASKET_SIZE)
+
+        # Ventas que cuentan como canasta, con su peso. Los dos lados del
+        # auto-join van contra SaleDetail (índice por venta), no contra una
+        # subconsulta sin índice; el GROUP BY interno absorbe las líneas
+        # repetidas del mismo producto.
+        baskets = (
+            f"WITH baskets AS ("
+            f"  SELECT d.{sale} AS sale_id, {weight} AS weight"
+            f"  FROM {qn(detail.db_table)} d JOIN {qn(Sale._meta.db_table)} s ON s.{qn(Sale._meta.pk.column)} = d.{sale}"
+            f"  WHERE d.{product} IS NOT NULL{in_window}"
+            f"  GROUP BY d.{sale}, {sale_date}"
+            f"  HAVING COUNT(DISTINCT d.{product}) BETWEEN 2 AND %s"
+            f") "
+        )
+        confidence = f"pairs.weight / NULLIF(counts.{column(basket_count, 'weight')}, 0)"
+        now = affinity.get_field('updated_at').get_db_prep_value(timezone.now(), connection)
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                baskets
+                + f"INSERT INTO {qn(basket_count.db_table)} "
+                f"({column(basket_count, 'product')}, {column(basket_count, 'basket_count')}, {column(basket_count, 'weight')}) "
+                f"SELECT product_id, COUNT(*), SUM(weight) FROM ("
+                f"  SELECT d.{product} AS product_id, baskets.weight AS weight FROM baskets"
+                f"  JOIN {qn(detail.db_table)} d ON d.{sale} = baskets.sale_id"
+                f"  WHERE d.{product} IS NOT NULL"
+                f"  GROUP BY baskets.sale_id, baskets.weight, d.{product}"
+                f") items GROUP BY product_id",
+                params,
+            )
+            cursor.execute(
+                baskets
+                + f"INSERT INTO {qn(pair_count.db_table)} "
+                f"({column(pair_count, 'product_low')}, {column(pair_count, 'product_high')}, "
+                f"{column(pair_count, 'co_occurrence_count')}, {column(pair_count, 'weight')}) "
+                f"SELECT low, high, COUNT(*), SUM(weight) FROM ("
+                f"  SELECT a.{product} AS low, b.{product} AS high, baskets.weight AS weight FROM baskets"
+                f"  JOIN {qn(detail.db_table)} a ON a.{sale} = baskets.sale_id"
+                f"  JOIN {qn(detail.db_table)} b ON b.{sale} = a.{sale} AND a.{product} < b.{product}"
+                f"  GROUP BY baskets.sale_id, baskets.weight, a.{product}, b.{product}"
+                f") items GROUP BY low, high",
+                params,
+            )
+            # Cada par en las dos direcciones; confianza contra el peso del
+            # origen y ranking por origen (mismo desempate que _keep_top_n_per_product).
+            low, high, co, pair_weight = (
+                column(pair_count, name) for name in ('product_low', 'product_high', 'co_occurrence_count', 'weight')
+            )
+            cursor.execute(
+                f"INSERT INTO {qn(affinity.db_table)} "
+                f"({column(affinity, 'product_a')}, {column(affinity, 'product_b')}, "
+                f"{column(affinity, 'co_occurrence_count')}, {column(affinity, 'confidence')}, {column(affinity, 'updated_at')}) "
+                f"SELECT source, target, co, confidence, %s FROM ("
+                f"  SELECT pairs.source, pairs.target, pairs.co, {confidence} AS confidence,"
+                f"    ROW_NUMBER() OVER (PARTITION BY pairs.source ORDER BY {confidence} DESC, pairs.target) AS source_rank"
+                f"  FROM ("
+                f"    SELECT {low} AS source, {high} AS target, {co} AS co, {pair_weight} AS weight"
+                f"    FROM {qn(pair_count.db_table)} WHERE {co} >= %s"
+                f"    UNION ALL"
+                f"    SELECT {high}, {low}, {co}, {pair_weight} FROM {qn(pair_count.db_table)} WHERE {co} >= %s"
+                f"  ) pairs"
+                f"  JOIN {qn(basket_count.db_table)} counts ON counts.{column(basket_count, 'product')} = pairs.source"
+                f"  WHERE {confidence} >= %s"
+                f") ranked WHERE source_rank <= %s",
+                [now, self.MIN_CO_OCCURRENCE, self.MIN_CO_OCCURRENCE, self.MIN_CONFIDENCE, self.TOP_N_PER_PRODUCT],
             )
-            for (a, b), confidence in affinities.items()
-        ])
-        return len(affinities)
-
-    def _build_baskets(self):
-        """Un 'basket' = el conjunto de productos distintos comprados en UNA venta."""
-        baskets = defaultdict(set)
-        details = SaleDetail.objects.filter(product__isnull=False).values('sale_id', 'product_id')
-        for row in details:
-            baskets[row['sale_id']].add(row['product_id'])
-        # Descartamos ventas de un solo producto — no aportan co-ocurrencia
-        return {sale_id: products for sale_id, products in baskets.items() if len(products) >= 2}
-
-    def _count_purchases_per_product(self, baskets):
-        """En cuántos baskets (ventas) distintas aparece cada producto."""
-        counts = defaultdict(int)
-        for products in baskets.values():
-            for product_id in products:
-                counts[product_id] += 1
-        return counts
-
-    def _count_co_occurrences(self, baskets):
-        """Cuántas veces aparecen A y B juntos en el mismo basket (no direccional)."""
-        counts = defaultdict(int)
-        for products in baskets.values():
-            for a, b in combinations(sorted(products), 2):
-                counts[frozenset((a, b))] += 1
-        return counts
-
-    def _build_affinities(self, co_counts, purchase_counts):
+            return cursor.rowcount
+
+    def verify(self) -> dict:
+        """Diferencias entre las tablas de conteo y un recuento completo con la ventana registrada (no escribe nada)."""
+        products, pairs = self._count_history(self.recorded_window())
+        stored_products = {
+            product_id: (n, w) for product_id, n, w in ProductBasketCount.objects.values_list('product_id', 'basket_count', 'weight')
+        }
+        stored_pairs = {
+            (low, high): (n, w)
+            for low, high, n, w in ProductPairCount.objects.values_list('product_low_id', 'product_high_id', 'co_occurrence_count', 'weight')
+        }
+        return {
+            'products': _diff(products, stored_products),
+            'pairs': _diff(pairs, stored_pairs),
+        }
+
+    def _count_history(self, window):
+        """
+        Conteo y peso por producto y por par, recorriendo las líneas
+        ordenadas por (sale_date, venta) en lotes de STREAM_CHUNK_SIZE: en
+        memoria solo están la canasta actual y los acumulados.
+        """
+        details = SaleDetail.objects.filter(sale__isnull=False, product__isnull=False)
+        if window.start:
+            details = details.filter(sale__sale_date__gte=window.start)
+        rows = (
+            details.order_by('sale__sale_date', 'sale_id')
+            .values_list('sale_id', 'sale__sale_date', 'product_id')
+            .iterator(chunk_size=STREAM_CHUNK_SIZE)
+        )
+
+        products = defaultdict(lambda: [0, 0.0])
+        pairs = defaultdict(lambda: [0, 0.0])
+        for (_, sale_date), lines in groupby(rows, key=itemgetter(0, 1)):
+            basket = sorted({product_id for _, _, product_id in lines})
+            # Descartamos ventas de un solo producto — no aportan co-ocurrencia
+            if not 2 <= len(basket) <= self.MAX_BASKET_SIZE:
+                continue
+            weight = window.weight(sale_date)
+            for totals, keys in ((products, basket), (pairs, combinations(basket, 2))):
+                for key in keys:
+                    totals[key][0] += 1
+                    totals[key][1] += weight
+        return products, pairs
+
+    # ── Confianza ────────────────────────────────────────────────────────
+
+    def _build_affinities(self, co_counts, product_weights, sources=None):
         """
         Genera confianza en AMBAS direcciones para cada par que cumpla el
-        mínimo de co-ocurrencia: confidence(A→B) = co(A,B) / compras(A).
+        mínimo de co-ocurrencia: confidence(A→B) = peso(A y B) / peso(A).
+        `co_counts` es {(A, B): (conteo, peso)}. Con `sources` solo se
+        calculan los orígenes indicados.
         """
         affinities = {}
-        for pair, co_count in co_counts.items():
+        for (a, b), (co_count, co_weight) in co_counts.items():
             if co_count < self.MIN_CO_OCCURRENCE:
                 continue
-            a, b = tuple(pair)
             for source, target in ((a, b), (b, a)):
-                confidence = co_count / purchase_counts[source]
+                if sources is not None and source not in sources:
+                    continue
+                if not product_weights.get(source):
+                    continue
+                confidence = co_weight / product_weights[source]
                 if confidence >= self.MIN_CONFIDENCE:
                     affinities[(source, target)] = confidence
         return affinities
 
     def _keep_top_n_per_product(self, affinities):
-        """Por cada producto origen, solo nos quedamos con sus N mejores sugerencias."""
+        """Por cada producto origen, solo nos quedamos con sus N mejores sugerencias (empate: menor id)."""
         by_source = defaultdict(list)
         for (source, target), confidence in affinities.items():
             by_source[source].append((target, confidence))
 
         trimmed = {}
         for source, targets in by_source.items():
-            targets.sort(key=lambda t: t[1], reverse=True)
+            targets.sort(key=lambda t: (-t[1], t[0]))
             for target, confidence in targets[:self.TOP_N_PER_PRODUCT]:
                 trimmed[(source, target)] = confidence
         return trimmed
+
+
+def _age_in_days(column) -> str:
+    """SQL: días (con fracción) entre la referencia (%s) y `column`; negativo si es anterior."""
+    if connection.vendor == 'postgresql':
+        return f"CAST(EXTRACT(EPOCH FROM ({column} - %s)) AS DOUBLE PRECISION) / 86400.0"
+    return f"(julianday({column}) - julianday(%s))"
+
+
+def _diff(expected, stored) -> int:
+    """Cantidad de claves cuyo (conteo, peso) difiere (incluye las que faltan o sobran)."""
+    mismatches = 0
+    for key in expected.keys() | stored.keys():
+        count, weight = expected.get(key, (0, 0.0))
+        stored_count, stored_weight = stored.get(key, (0, 0.0))
+        if count != stored_count or not math.isclose(weight, stored_weight, rel_tol=1e-9, abs_tol=1e-9):
+            mismatches += 1
+    return mismatches
@@ -0,0 +1,183 @@
+"""
+Caché del resultado de los reportes (ReportSnapshot): lo comparten la
+pantalla de reportes, la exportación a Excel y la API JSON.
+
+La clave es el filtro normalizado (SaleFilter.as_params con la forma de
+pago ya resuelta a ids): el mismo filtro escrito distinto cae en la misma
+entrada. La política depende del período:
+
+- Termina antes de hoy → namespace 'reports:history', vida larga. Las
+  ventas nuevas del día no lo tocan; lo invalidan solo las ediciones y
+  eliminaciones (o ventas cargadas con fecha pasada), ver signals.py.
+- Incluye hoy → namespace 'sales', que invalida cualquier venta nueva,
+  editada o eliminada.
+
+Contra la estampida: cuando una entrada se invalida, UN solo request la
+recalcula (lock en la tabla ReportComputeLock, reclamado con un INSERT
+atómico); los demás reciben la última copia calculada, marcada como
+'stale', en vez de lanzar los mismos agregados en paralelo. Si todavía no
+hay copia, esperan a que termine el que calcula y, pasado WAIT_SECONDS,
+calculan por su cuenta.
+
+Los contadores (hits, recálculos, copias stale, tiempo de cálculo) viven
+en el backend compartido y se muestran en la página de reportes. Son
+APROXIMADOS: el incr del backend de archivos es leer + escribir, y dos
+workers que cuentan a la vez pueden perder un incremento. Sirven para ver
+la tendencia, no para facturar.
+"""
+
+import hashlib
+import json
+import time
+from datetime import timedelta
+
+from django.db import connection
+from django.utils import timezone
+
+from core.super.models import ReportComputeLock
+from core.super.services.cache_service import TwoTierCache
+from core.super.services.report_snapshot import ReportSnapshot, SNAPSHOT_VERSION
+
+REPORT_HISTORY_NAMESPACE = 'reports:history'
+LIVE_NAMESPACE = 'sales'
+HISTORY_TIMEOUT = 24 * 60 * 60
+LIVE_TIMEOUT = 10 * 60
+STALE_TIMEOUT = 24 * 60 * 60
+LOCK_TIMEOUT = 60
+WAIT_SECONDS = 5
+WAIT_STEP = 0.1
+
+HIT = 'hit'
+MISS = 'miss'
+STALE = 'stale'
+_STATS = ('hits', 'computes', 'stale', 'compute_ms')
+
+
+def touches_history(sale_date) -> bool:
+    """True si una venta con esta fecha cae en un período ya cerrado (antes de hoy)."""
+    if sale_date is None:
+        return False
+    day = timezone.localdate(sale_date) if timezone.is_aware(sale_date) else sale_date.date()
+    return day < timezone.localdate()
+
+
+class ReportCache:
+    """Devuelve el ReportSnapshot de un SalesReport desde la caché o calculándolo una sola vez."""
+
+    def __init__(self):
+        self.cache = TwoTierCache()
+
+    def key(self, report) -> str:
+        params = report.filter.as_params()
+        payment_ids = report.filter.payment_ids
+        params['payment'] = sorted(payment_ids) if payment_ids is not None else None
+        digest = hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+        return f'reports:v{SNAPSHOT_VERSION}:{digest}'
+
+    def policy(self, report):
+        """(namespace, timeout) según si el período incluye el día de hoy."""
+        if report.date_to is not None and report.date_to < timezone.localdate():
+            return REPORT_HISTORY_NAMESPACE, HISTORY_TIMEOUT
+        return LIVE_NAMESPACE, LIVE_TIMEOUT
+
+    def get(self, report):
+        """Devuelve (snapshot, meta). meta = {'source', 'computed_at', 'compute_ms'}."""
+        namespace, timeout = self.policy(report)
+        key = self.key(report)
+
+        entry = self.cache.get(namespace, key)
+        if entry is not None:
+            return self._serve(entry, HIT)
+
+        if self.acquire(key):
+            try:
+                return self._compute(report, namespace, key, timeout)
+            finally:
+                self.release(key)
+
+        # Otro request ya lo está calculando.
+        stale = self.cache.l2.get(f'{key}:stale')
+        if stale is not None:
+            return self._serve(stale, STALE)
+        deadline = time.monotonic() + WAIT_SECONDS
+        while time.monotonic() < deadline:
+            time.sleep(WAIT_STEP)
+            entry = self.cache.get(namespace, key)
+            if entry is not None:
+                return self._serve(entry, HIT)
+        return self._compute(report, namespace, key, timeout)
+
+    # ── Lock single-flight ───────────────────────────────────────────────
+
+    def acquire(self, key) -> bool:
+        """
+        Reclama el recálculo de `key`. True = este request es el que calcula.
+
+        Debe llamarse fuera de transaction.atomic: la fila tiene que ser
+        visible para los demás requests en cuanto se inserta.
+        """
+        if self._insert_lock(key):
+            return True
+        # El dueño pudo haber muerto sin liberarlo: si venció, se reintenta.
+        stale = ReportComputeLock.objects.filter(key=key, expires_at__lt=timezone.now()).delete()[0]
+        return bool(stale) and self._insert_lock(key)
+
+    def _insert_lock(self, key) -> bool:
+        opts = ReportComputeLock._meta
+        fields = [opts.get_field(name) for name in ('key', 'expires_at')]
+        values = [
+            field.get_db_prep_value(value, connection)
+            for field, value in zip(fields, (key, timezone.now() + timedelta(seconds=LOCK_TIMEOUT)))
+        ]
+        qn = connection.ops.quote_name
+        sql = (
+            f"INSERT INTO {qn(opts.db_table)} ({', '.join(qn(f.column) for f in fields)}) "
+            f"VALUES (%s, %s) ON CONFLICT ({qn(fields[0].column)}) DO NOTHING"
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(sql, values)
+            return cursor.rowcount == 1
+
+    def release(self, key):
+        ReportComputeLock.objects.filter(key=key).delete()
+
+    def _serve(self, entry, source):
+        self._count('hits' if source == HIT else 'stale')
+        return entry['snapshot'], dict(entry['meta'], source=source)
+
+    def _compute(self, report, namespace, key, timeout):
+        started = time.monotonic()
+        snapshot = ReportSnapshot.compute(report)
+        compute_ms = int((time.monotonic() - started) * 1000)
+        entry = {'snapshot': snapshot, 'meta': {'computed_at': snapshot.computed_at, 'compute_ms': compute_ms}}
+
+        self.cache.set(namespace, key, entry, timeout)
+        # Copia sin versión: sobrevive a las invalidaciones y es lo que
+        # reciben los requests concurrentes mientras se recalcula.
+        self.cache.l2.set(f'{key}:stale', entry, STALE_TIMEOUT)
+        self._count('computes')
+        self._count('compute_ms', compute_ms)
+        return snapshot, dict(entry['meta'], source=MISS)
+
+    # ── Métricas ─────────────────────────────────────────────────────────
+
+    def _count(self, name, amount=1):
+        """Incremento aproximado (ver docstring del módulo)."""
+        key = f'reports:stats:{name}'
+        try:
+            self.cache.l2.incr(key, amount)
+        except ValueError:
+            # add no pisa a otro worker que lo haya creado en paralelo.
+            if not self.cache.l2.add(key, amount, None):
+                self.cache.l2.incr(key, amount)
+
+    def stats(self) -> dict:
+        values = self.cache.l2.get_many([f'reports:stats:{name}' for name in _STATS])
+        stats = {name: values.get(f'reports:stats:{name}', 0) for name in _STATS}
+        lookups = stats['hits'] + stats['computes'] + stats['stale']
+        stats['hit_ratio'] = (stats['hits'] + stats['stale']) / lookups if lookups else 0.0
+        stats['avg_compute_ms'] = stats['compute_ms'] / stats['computes'] if stats['computes'] else 0
+        return stats
+
+    def reset_stats(self):
+        self.cache.l2.delete_many([f'reports:stats:{name}' for name in _STATS])
@@ -0,0 +1,168 @@
+"""
+Comparación del período del reporte contra el período anterior y contra
+el mismo período del año pasado.
+
+- Período anterior: misma cantidad de días, inmediatamente antes.
+- Año anterior (YoY): mismas fechas un año antes (29/02 → 28/02).
+
+Cada período es un SalesReport con los mismos filtros, así que sale de
+los rollups diarios siempre que el período esté cubierto y los filtros lo
+permitan (ver report_service.py): comparar cuesta leer N días × dimensión
+más, no volver a recorrer las ventas. Las secciones de los tres períodos
+se calculan juntas con ReportEngine.
+
+El resultado se cachea con la misma clave que el ReportSnapshot del
+filtro. Los períodos de comparación siempre terminaron, por eso la
+entrada depende también del namespace 'reports:history'. Como sale de
+los rollups, la invalida también su reconstrucción (rollup_service), no
+solo la señal de la venta, que llega antes de que el rollup cambie.
+"""
+
+from datetime import timedelta
+from decimal import Decimal
+from functools import partial
+
+from core.super.services.cache_service import TwoTierCache
+from core.super.services.report_cache_service import ReportCache, REPORT_HISTORY_NAMESPACE
+from core.super.services.report_engine import ReportEngine
+from core.super.services.report_service import SalesReport
+from core.super.services.sale_filter import SaleFilter
+
+CURRENT = 'current'
+PREVIOUS = 'previous'
+YOY = 'yoy'
+COMPARISONS = (PREVIOUS, YOY)
+
+KPI_KEYS = ('revenue', 'count', 'avg_ticket', 'discount')
+TOP_SELLERS = 10
+TOP_PRODUCTS = 15
+TOP_CATEGORIES = 10
+
+# entidad → (sección de SalesReport, campos que identifican la fila, cuántos forman
+#            el texto visible, métrica comparada, tamaño del top)
+ENTITIES = {
+    'sellers': ('top_sellers', ('seller__name', 'seller__last_name'), 2, 'total', TOP_SELLERS),
+    'products': ('top_products', ('product__name', 'product__category__name'), 1, 'revenue', TOP_PRODUCTS),
+    'categories': ('categories', ('product__category__name',), 1, 'revenue', TOP_CATEGORIES),
+}
+
+
+def _year_before(day):
+    try:
+        return day.replace(year=day.year - 1)
+    except ValueError:  # 29 de febrero
+        return day.replace(year=day.year - 1, day=28)
+
+
+def comparison_periods(date_from, date_to) -> dict:
+    """{'current' | 'previous' | 'yoy': (desde, hasta)}."""
+    days = (date_to - date_from).days + 1
+    return {
+        CURRENT: (date_from, date_to),
+        PREVIOUS: (date_from - timedelta(days=days), date_from - timedelta(days=1)),
+        YOY: (_year_before(date_from), _year_before(date_to)),
+    }
+
+
+def delta(current, base):
+    """Variación porcentual (1 decimal) de base a current; None si base es 0."""
+    if not base:
+        return None
+    return round(float((Decimal(current) - Decimal(base)) / Decimal(base) * 100), 1)
+
+
+class PeriodComparison:
+    """KPIs, serie diaria superpuesta y variación por vendedor / producto / categoría."""
+
+    def __init__(self, report):
+        self.report = report
+        self.periods = comparison_periods(report.date_from, report.date_to)
+
+    def get(self) -> dict:
+        report_cache = ReportCache()
+        namespace, timeout = report_cache.policy(self.report)
+        return TwoTierCache().get_or_set(
+            (namespace, REPORT_HISTORY_NAMESPACE),
+            f'{report_cache.key(self.report)}:comparison',
+            self.compute,
+            timeout,
+        )
+
+    def _report_for(self, name):
+        if name == CURRENT:
+            return self.report
+        date_from, date_to = self.periods[name]
+        params = dict(self.report.filter.as_params(), date_from=date_from.isoformat(), date_to=date_to.isoformat())
+        return SalesReport(SaleFilter.from_params(params))
+
+    def compute(self) -> dict:
+        sections = {}
+        for name in self.periods:
+            report = self._report_for(name)
+            sections[f'{name}:kpis'] = report.kpis
+            sections[f'{name}:daily'] = report.daily
+            for entity, (method, _, _, _, limit) in ENTITIES.items():
+                # Del período actual, el top; de los otros, todos (para encontrar cada fila del top).
+                top = limit if name == CURRENT else None
+                sections[f'{name}:{entity}'] = partial(getattr(report, method), top)
+        results = ReportEngine().run(sections)
+
+        return {
+            'periods': {
+                name: {'date_from': date_from, 'date_to': date_to}
+                for name, (date_from, date_to) in self.periods.items()
+            },
+            'kpis': self._kpis(results),
+            'daily': self._daily(results),
+            **{entity: self._entities(results, entity) for entity in ENTITIES},
+        }
+
+    def _kpis(self, results):
+        values = {}
+        for name in self.periods:
+            kpis = dict(results[f'{name}:kpis'])
+            kpis['avg_ticket'] = (
+                (kpis['revenue'] / kpis['count']).quantize(Decimal('0.01')) if kpis['count'] else Decimal('0.00')
+            )
+            values[name] = kpis
+        return {key: self._compare(key, {name: values[name][key] for name in values}) for key in KPI_KEYS}
+
+    def _compare(self, label, values):
+        row = {'label': label, CURRENT: values[CURRENT]}
+        for name in COMPARISONS:
+            row[name] = values[name]
+            row[f'{name}_delta'] = delta(values[CURRENT], values[name])
+        return row
+
+    def _daily(self, results):
+        """Una fila por día del período actual; los otros períodos alineados por posición (día 1 con día 1)."""
+        totals = {
+            name: {row['day']: row['total'] for row in results[f'{name}:daily']}
+            for name in self.periods
+        }
+        days = (self.periods[CURRENT][1] - self.periods[CURRENT][0]).days + 1
+        rows = []
+        for offset in range(days):
+            row = {}
+            for name, (date_from, _) in self.periods.items():
+                day = date_from + timedelta(days=offset)
+                if name == CURRENT:
+                    row['day'] = day
+                row[name] = totals[name].get(day, Decimal('0.00'))
+            rows.append(row)
+        return rows
+
+    def _entities(self, results, entity):
+        _, fields, label_fields, metric, _ = ENTITIES[entity]
+        indexed = {
+            name: {tuple(row[field] for field in fields): row[metric] or 0 for row in results[f'{name}:{entity}']}
+            for name in COMPARISONS
+        }
+        rows = []
+        for row in results[f'{CURRENT}:{entity}']:
+            key = tuple(row[field] for field in fields)
+            label = ' '.join(part for part in key[:label_fields] if part) or '—'
+            values = {CURRENT: row[metric] or 0}
+            values.update({name: indexed[name].get(key, 0) for name in COMPARISONS})
+            rows.append(self._compare(label, values))
+        return rows
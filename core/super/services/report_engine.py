@@ -0,0 +1,62 @@
+"""
+Ejecución concurrente de las secciones de un reporte.
+
+Las secciones de SalesReport (KPIs, serie diaria, tops, desgloses) son
+consultas independientes entre sí. ReportEngine las lanza en un pool de
+hilos acotado y compartido por todo el proceso: cada hilo usa su propia
+conexión (en Django las conexiones son por hilo) y la cierra al terminar
+la sección, así que el pool limita también cuántas conexiones abren los
+reportes a la vez. El tiempo total queda cerca del de la consulta más
+lenta en vez de la suma.
+
+Se ejecuta en serie cuando el paralelismo no aplica:
+
+- Fuera de PostgreSQL: SQLite no saca provecho (y la base en memoria de
+  los tests no se comparte entre conexiones).
+- Dentro de una transacción (atomic): las otras conexiones no verían lo
+  que esta transacción todavía no confirmó.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+from django.db import connection, connections
+
+MAX_WORKERS = 4
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _pool():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS, thread_name_prefix='report')
+        return _executor
+
+
+def _run_section(fn):
+    try:
+        return fn()
+    finally:
+        # La conexión es de este hilo del pool: se cierra para no dejarla
+        # abierta (ni con una transacción colgada) entre reportes.
+        connections.close_all()
+
+
+class ReportEngine:
+    """Evalúa un dict {nombre: callable} y devuelve {nombre: resultado}."""
+
+    def __init__(self, parallel=None):
+        self.parallel = parallel
+
+    def can_parallelize(self) -> bool:
+        return connection.vendor == 'postgresql' and not connection.in_atomic_block
+
+    def run(self, sections: dict) -> dict:
+        parallel = self.can_parallelize() if self.parallel is None else self.parallel
+        if not parallel or len(sections) < 2:
+            return {name: fn() for name, fn in sections.items()}
+        futures = {name: _pool().submit(_run_section, fn) for name, fn in sections.items()}
+        return {name: future.result() for name, future in futures.items()}
@@ -0,0 +1,353 @@
+"""
+Exportación del reporte de ventas a Excel en modo streaming.
+
+El libro se arma con un Workbook(write_only=True): cada fila se escribe al
+archivo apenas se agrega y no queda en memoria, así que el consumo no
+crece con la cantidad de ventas (incluido ?all=1, todo el histórico).
+
+- Estilos: NamedStyle registrados una vez por combinación (fuente,
+  relleno, alineación, formato) y referenciados por nombre desde cada
+  celda, en vez de crear Font / PatternFill / Alignment por celda.
+- Hoja de detalle: values_list() + iterator(chunk_size=...) sobre Sale,
+  sin instanciar modelos ni cachear el queryset.
+- Las secciones agregadas salen del ReportSnapshot del filtro (el mismo
+  que usa la pantalla de reportes, desde ReportCache): exportar después
+  de ver la página no recalcula nada, acá solo se da formato.
+
+El llamador decide dónde se escribe: la vista usa un SpooledTemporaryFile
+(memoria hasta cierto tamaño, disco después) y lo devuelve con FileResponse.
+"""
+
+from datetime import date
+from itertools import zip_longest
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Alignment, Border, Font, NamedStyle, PatternFill, Side
+from openpyxl.utils import get_column_letter
+
+from core.super.services.report_cache_service import ReportCache
+
+EXPORT_CHUNK_SIZE = 2000
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+# Colores corporativos
+RED_DARK = '7F1D1D'
+RED_MED = '991B1B'
+WHITE = 'FFFFFF'
+GRAY_DARK = '1F2937'
+GRAY_LIGHT = 'F9FAFB'
+GRAY_MUTED = '9CA3AF'
+AMBER = 'F59E0B'
+GREEN = '16A34A'
+BLUE = '2563EB'
+CYAN = '0EA5E9'
+PURPLE = '7C3AED'
+MEDAL_COLORS = ['FFD700', 'C0C0C0', 'CD7F32']
+MONEY_FORMAT = '"$"#,##0.00'
+
+_THIN = Side(style='thin', color='E5E7EB')
+_BORDER = Border(left=_THIN, right=_THIN, top=_THIN, bottom=_THIN)
+_ALIGNMENTS = {
+    'center': dict(horizontal='center', vertical='center', wrap_text=True),
+    'right': dict(horizontal='right', vertical='center'),
+    'left': dict(horizontal='left', vertical='center'),
+    'plain': dict(vertical='center', wrap_text=False),
+}
+
+
+class _StyleBook:
+    """Registra cada combinación de estilo como NamedStyle la primera vez que se pide."""
+
+    def __init__(self, workbook):
+        self.workbook = workbook
+        self.names = set()
+
+    def __call__(self, size=10, bold=False, color=GRAY_DARK, fill=None, align='plain',
+                 money=False, border=True, indent=0):
+        name = f'rv-{size}-{int(bold)}-{color}-{fill}-{align}-{int(money)}-{int(border)}-{indent}'
+        if name not in self.names:
+            self.workbook.add_named_style(NamedStyle(
+                name=name,
+                font=Font(name='Arial', size=size, bold=bold, color=color),
+                fill=PatternFill('solid', fgColor=fill) if fill else PatternFill(),
+                alignment=Alignment(indent=indent, **_ALIGNMENTS[align]),
+                border=_BORDER if border else Border(),
+                number_format=MONEY_FORMAT if money else 'General',
+            ))
+            self.names.add(name)
+        return name
+
+
+class ReportExcelExporter:
+    """Escribe el reporte de un SalesReport como .xlsx en un archivo abierto."""
+
+    def __init__(self, report, chunk_size=EXPORT_CHUNK_SIZE, progress=None, snapshot=None):
+        """
+        `progress(porcentaje)` se llama cada chunk_size filas de la hoja de
+        detalle (la más larga). Sin `snapshot` se toma de ReportCache.
+        """
+        self.report = report
+        self.snapshot = snapshot
+        self.chunk_size = chunk_size
+        self.progress = progress
+
+    def filename(self):
+        return (
+            f"reporte_ventas_{self.report.date_from.strftime('%Y%m%d')}_"
+            f"{self.report.date_to.strftime('%Y%m%d')}.xlsx"
+        )
+
+    def write(self, fileobj):
+        self.workbook = Workbook(write_only=True)
+        self.style = _StyleBook(self.workbook)
+        if self.snapshot is None:
+            self.snapshot, _ = ReportCache().get(self.report)
+        self._summary_sheet()
+        self._detail_sheet()
+        self._products_sheet()
+        self._categories_sheet()
+        self._people_sheet()
+        self.workbook.save(fileobj)
+
+    # ── Helpers ──────────────────────────────────────────────────────────
+
+    def _sheet(self, title, widths):
+        ws = self.workbook.create_sheet(title)
+        ws.sheet_view.showGridLines = False
+        # En modo write_only las columnas se definen antes de la primera fila.
+        for col, width in enumerate(widths, 1):
+            if width:
+                ws.column_dimensions[get_column_letter(col)].width = width
+        return ws
+
+    def _cell(self, ws, value, style):
+        cell = WriteOnlyCell(ws, value=value)
+        cell.style = style
+        return cell
+
+    def _row(self, ws, values, style):
+        return [self._cell(ws, value, style) for value in values]
+
+    def _banner(self, ws, row, first_col, last_col, text, fill, size=14):
+        ws.merged_cells.add(f'{get_column_letter(first_col)}{row}:{get_column_letter(last_col)}{row}')
+        return self._cell(ws, text, self.style(size=size, bold=True, color=WHITE, fill=fill, align='center', border=False))
+
+    def _header(self, ws, headers, fill):
+        return self._row(ws, headers, self.style(size=9, bold=True, color=WHITE, fill=fill, align='center'))
+
+    @staticmethod
+    def _bg(row_idx):
+        return GRAY_LIGHT if row_idx % 2 == 0 else WHITE
+
+    # ── Hoja 1: resumen ejecutivo ────────────────────────────────────────
+
+    def _summary_sheet(self):
+        ws = self._sheet('Resumen Ejecutivo', [28, 14, 18, 2, 24, 12, 16, 12])
+        style = self.style
+        report = self.report
+
+        kpis = self.snapshot.kpis
+        total_revenue = float(kpis['revenue'])
+        total_sales = int(kpis['count'])
+        avg_ticket = float(self.snapshot.avg_ticket)
+        kpi_rows = [
+            ('💰 Ingresos Totales', f'${total_revenue:,.2f}', GREEN),
+            ('🧾 Ventas Realizadas', f'{total_sales:,}', BLUE),
+            ('📊 Ticket Promedio', f'${avg_ticket:,.2f}', CYAN),
+            ('🏷️ Descuentos', f"${float(kpis['discount']):,.2f}", AMBER),
+            ('📋 IVA Recaudado', f"${float(kpis['iva']):,.2f}", PURPLE),
+        ]
+        payments = self.snapshot.by_payment
+
+        ws.row_dimensions[1].height = 42
+        ws.append([self._banner(ws, 1, 1, 8, '🛒  MY SUPERMARKET — REPORTE DE VENTAS', RED_DARK, size=18)])
+        ws.merged_cells.add('A2:H2')
+        ws.row_dimensions[2].height = 22
+        ws.append([self._cell(
+            ws,
+            f"Período: {report.date_from.strftime('%d/%m/%Y')} — {report.date_to.strftime('%d/%m/%Y')}"
+            f"     |     Generado el {date.today().strftime('%d/%m/%Y')}",
+            style(color='FCA5A5', fill=RED_MED, align='center', border=False),
+        )])
+        ws.row_dimensions[3].height = 10
+        ws.append([])
+
+        section = style(size=9, bold=True, color=GRAY_MUTED, fill=GRAY_LIGHT, align='left', border=False)
+        ws.merged_cells.add('A4:B4')
+        ws.merged_cells.add('E4:H4')
+        ws.row_dimensions[4].height = 18
+        ws.append([
+            self._cell(ws, 'INDICADORES CLAVE DE DESEMPEÑO', section), None, None, None,
+            self._cell(ws, 'VENTAS POR MÉTODO DE PAGO', section),
+        ])
+
+        # Filas 5 en adelante: KPIs en A-C y formas de pago en E-H, lado a lado.
+        payment_rows = [None] + payments  # la fila 5 lleva el encabezado de pagos
+        for offset, (kpi, payment) in enumerate(zip_longest(kpi_rows, payment_rows)):
+            row_idx = 5 + offset
+            row = [None] * 4
+            if kpi is not None:
+                label, value, color = kpi
+                ws.merged_cells.add(f'A{row_idx}:B{row_idx}')
+                row[0] = self._cell(ws, label, style(bold=True, color=color, fill=GRAY_LIGHT, align='left', indent=1))
+                row[2] = self._cell(ws, value, style(size=13, bold=True, color=color, align='center'))
+            if offset == 0:
+                row += self._header(ws, ['Método de Pago', 'N° Ventas', 'Total $', '% del Total'], RED_DARK)
+            elif payment is not None:
+                total = float(payment['total'] or 0)
+                pct = (total / total_revenue * 100) if total_revenue else 0
+                row += self._row(ws, [
+                    payment['payment__name'] or '—', payment['count'], f'${total:,.2f}', f'{pct:.1f}%',
+                ], style(fill=self._bg(row_idx), align='center'))
+            ws.row_dimensions[row_idx].height = 32 if kpi is not None else 20
+            ws.append(row)
+
+    # ── Hoja 2: detalle de ventas ────────────────────────────────────────
+
+    def _detail_sheet(self):
+        ws = self._sheet('Detalle de Ventas', [5, 18, 24, 20, 18, 13, 11, 13, 13, 36])
+        # Alto por defecto en vez de una entrada de row_dimensions por venta.
+        ws.sheet_format.defaultRowHeight = 18
+        ws.sheet_format.customHeight = True
+
+        ws.row_dimensions[1].height = 32
+        ws.append([self._banner(ws, 1, 1, 10, 'DETALLE DE VENTAS', RED_DARK)])
+        ws.row_dimensions[2].height = 22
+        ws.append(self._header(ws, [
+            '#', 'Fecha', 'Cliente', 'Vendedor', 'Método Pago',
+            'Subtotal $', 'IVA $', 'Descuento $', 'Total $', 'UUID',
+        ], RED_MED))
+
+        text = {bg: self.style(fill=bg) for bg in (GRAY_LIGHT, WHITE)}
+        money = {bg: self.style(fill=bg, align='right', money=True) for bg in (GRAY_LIGHT, WHITE)}
+
+        rows = (
+            self.report.sales
+            .order_by('-sale_date')
+            .values_list(
+                'id_sale', 'sale_date',
+                'customer_id', 'customer__name', 'customer__last_name',
+                'seller_id', 'seller__name', 'seller__last_name',
+                'payment__name', 'subtotal', 'iva', 'discount', 'total', 'idempotency_key',
+            )
+            .iterator(chunk_size=self.chunk_size)
+        )
+        total_rows = self.report.sales.count() if self.progress else 0
+        row_idx = 2
+        for (pk, sale_date, customer_id, customer_name, customer_last, seller_id, seller_name, seller_last,
+             payment_name, subtotal, iva, discount, total, key) in rows:
+            row_idx += 1
+            bg = self._bg(row_idx)
+            ws.append([
+                self._cell(ws, pk, text[bg]),
+                self._cell(ws, sale_date.strftime('%d/%m/%Y %H:%M') if sale_date else '', text[bg]),
+                self._cell(ws, f'{customer_name} {customer_last}' if customer_id else '—', text[bg]),
+                self._cell(ws, f'{seller_name} {seller_last}' if seller_id else '—', text[bg]),
+                self._cell(ws, payment_name or '—', text[bg]),
+                self._cell(ws, float(subtotal or 0), money[bg]),
+                self._cell(ws, float(iva or 0), money[bg]),
+                self._cell(ws, float(discount or 0), money[bg]),
+                self._cell(ws, float(total or 0), money[bg]),
+                self._cell(ws, str(key) if key else '', text[bg]),
+            ])
+            if total_rows and (row_idx - 2) % self.chunk_size == 0:
+                # El 100 % lo marca quien guarda el archivo.
+                self.progress(min(99, (row_idx - 2) * 100 // total_rows))
+
+        # Totales
+        total_style = self.style(bold=True, color=WHITE, fill=RED_DARK, align='right', money=True)
+        ws.append(
+            [self._cell(ws, 'TOTAL', self.style(bold=True, color=WHITE, fill=RED_DARK, align='center', border=False))]
+            + [None] * 4
+            + [self._cell(ws, f'=SUM({col}3:{col}{row_idx})', total_style) for col in 'FGHI']
+        )
+
+    # ── Hoja 3: productos más vendidos ───────────────────────────────────
+
+    def _products_sheet(self):
+        ws = self._sheet('Productos Más Vendidos', [10, 34, 22, 16, 16, 14])
+        ws.row_dimensions[1].height = 32
+        ws.append([self._banner(ws, 1, 1, 6, 'PRODUCTOS MÁS VENDIDOS', PURPLE)])
+        ws.row_dimensions[2].height = 22
+        ws.append(self._header(ws, ['Ranking', 'Producto', 'Categoría', 'Uds. Vendidas', 'Ingresos $', '% Ing. Total'], PURPLE))
+
+        top_products = self.snapshot.top_products
+        total_revenue = sum(float(p['revenue'] or 0) for p in top_products)
+        for row_idx, product in enumerate(top_products, 3):
+            medal = row_idx <= 5
+            bg = MEDAL_COLORS[row_idx - 3] if medal else self._bg(row_idx)
+            font = dict(bold=medal, color='000000' if medal else GRAY_DARK, fill=bg)
+            revenue = float(product['revenue'] or 0)
+            pct = (revenue / total_revenue * 100) if total_revenue else 0
+            ws.row_dimensions[row_idx].height = 20
+            ws.append([
+                self._cell(ws, row_idx - 2, self.style(align='center', **font)),
+                self._cell(ws, product['product__name'] or '—', self.style(**font)),
+                self._cell(ws, product['product__category__name'] or 'Sin categoría', self.style(align='center', **font)),
+                self._cell(ws, int(product['qty'] or 0), self.style(align='center', **font)),
+                self._cell(ws, revenue, self.style(align='right', money=True, **font)),
+                self._cell(ws, f'{pct:.1f}%', self.style(align='center', **font)),
+            ])
+
+    # ── Hoja 4: análisis por categoría ───────────────────────────────────
+
+    def _categories_sheet(self):
+        ws = self._sheet('Por Categoría', [28, 16, 16, 14, 16])
+        ws.row_dimensions[1].height = 32
+        ws.append([self._banner(ws, 1, 1, 5, 'ANÁLISIS DE VENTAS POR CATEGORÍA', GREEN)])
+        ws.row_dimensions[2].height = 22
+        ws.append(self._header(ws, ['Categoría', 'Uds. Vendidas', 'Ingresos $', '% del Total', 'Ticket Prom. $'], GREEN))
+
+        categories = self.snapshot.categories
+        total_revenue = sum(float(c['revenue'] or 0) for c in categories)
+        for row_idx, category in enumerate(categories, 3):
+            bg = self._bg(row_idx)
+            revenue = float(category['revenue'] or 0)
+            pct = (revenue / total_revenue * 100) if total_revenue else 0
+            ws.row_dimensions[row_idx].height = 20
+            ws.append([
+                self._cell(ws, category['product__category__name'] or 'Sin categoría', self.style(fill=bg, align='center')),
+                self._cell(ws, int(category['qty'] or 0), self.style(fill=bg, align='center')),
+                self._cell(ws, revenue, self.style(fill=bg, align='right', money=True)),
+                self._cell(ws, f'{pct:.1f}%', self.style(fill=bg, align='center')),
+                self._cell(ws, revenue / int(category['items'] or 1), self.style(fill=bg, align='right', money=True)),
+            ])
+
+    # ── Hoja 5: top vendedores y clientes ────────────────────────────────
+
+    def _people_sheet(self):
+        ws = self._sheet('Vendedores y Clientes', [24, 12, 14, 14, 4, 24, 12, 14, 14])
+        ws.row_dimensions[1].height = 28
+        ws.append(
+            [self._banner(ws, 1, 1, 4, 'TOP VENDEDORES', BLUE, size=13), None, None, None, None,
+             self._banner(ws, 1, 6, 9, 'TOP CLIENTES', CYAN, size=13)]
+        )
+        ws.row_dimensions[2].height = 20
+        ws.append(
+            self._header(ws, ['Vendedor', 'N° Ventas', 'Total $', 'Ticket Prom. $'], BLUE) + [None]
+            + self._header(ws, ['Cliente', 'N° Compras', 'Total $', 'Ticket Prom. $'], CYAN)
+        )
+
+        sellers = self.snapshot.top_sellers
+        customers = self.snapshot.top_customers
+        for row_idx, (seller, customer) in enumerate(zip_longest(sellers, customers), 3):
+            row = self._person(ws, row_idx, seller, 'seller') + [None]
+            row += self._person(ws, row_idx, customer, 'customer')
+            ws.row_dimensions[row_idx].height = 20
+            ws.append(row)
+
+    def _person(self, ws, row_idx, data, prefix):
+        if data is None:
+            return [None] * 4
+        bg = self._bg(row_idx)
+        name = f"{data[f'{prefix}__name'] or ''} {data[f'{prefix}__last_name'] or ''}".strip() or '—'
+        count = int(data['count'] or 0)
+        total = float(data['total'] or 0)
+        return [
+            self._cell(ws, name, self.style(fill=bg, align='center')),
+            self._cell(ws, count, self.style(fill=bg, align='center')),
+            self._cell(ws, total, self.style(fill=bg, align='right', money=True)),
+            self._cell(ws, (total / count) if count else 0.0, self.style(fill=bg, align='right', money=True)),
+        ]
+
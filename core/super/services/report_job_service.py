@@ -0,0 +1,215 @@
+"""
+Exportaciones del reporte de ventas en segundo plano (ReportExportJob).
+
+- enqueue(): la vista guarda los filtros normalizados (SaleFilter.as_params)
+  y responde al instante. Si ya hay un trabajo pendiente o corriendo con los
+  mismos filtros se devuelve ese: diez clics en "exportar todo" generan un
+  solo archivo.
+- run_next(): el comando process_report_exports reclama el trabajo más
+  viejo (SELECT ... FOR UPDATE SKIP LOCKED, varios workers no se pisan),
+  genera el .xlsx con ReportExcelExporter y lo sube al storage por defecto
+  (MEDIA_ROOT o S3 vía django-storages). El progreso se guarda a medida
+  que avanza la hoja de detalle; un hilo aparte actualiza el latido
+  (heartbeat_at) durante todo el trabajo: cálculo del reporte, escritura
+  del libro y subida al storage.
+- Un trabajo RUNNING cuyo latido dejó de avanzar se da por huérfano y
+  vuelve a la cola; uno largo pero vivo no se toca. Después de
+  MAX_ATTEMPTS reclamos se marca como fallido: un trabajo que tumba al
+  worker no vuelve a la cola para siempre.
+- La página de reportes consulta el estado (status_payload) y ofrece la
+  descarga cuando el archivo está listo.
+"""
+
+import hashlib
+import json
+import tempfile
+import threading
+from datetime import timedelta
+
+from django.core.files import File
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.db.models import Q
+from django.urls import reverse
+from django.utils import timezone
+
+from core.super.models import ReportExportJob
+from core.super.services.report_export_service import ReportExcelExporter
+from core.super.services.report_service import SalesReport
+from core.super.services.sale_filter import SaleFilter
+
+# Un trabajo RUNNING sin latir pasado este tiempo se da por huérfano (el
+# worker murió) y vuelve a la cola. Un worker vivo late cada
+# HEARTBEAT_EVERY mientras el trabajo corre.
+STALE_AFTER = timedelta(minutes=10)
+HEARTBEAT_EVERY = timedelta(seconds=30)
+# Reclamos permitidos por trabajo antes de darlo por fallido.
+MAX_ATTEMPTS = 3
+SPOOL_MAX_SIZE = 8 * 1024 * 1024
+
+
+def params_hash(params) -> str:
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()
+
+
+class _Heartbeat(threading.Thread):
+    """
+    Actualiza heartbeat_at cada HEARTBEAT_EVERY hasta stop(). Corre en su
+    propio hilo (y conexión) para latir también mientras el hilo principal
+    está bloqueado en una consulta larga, en workbook.save o en la subida.
+    """
+
+    def __init__(self, job_id):
+        super().__init__(name=f'report-job-{job_id}-heartbeat', daemon=True)
+        self.job_id = job_id
+        self.done = threading.Event()
+
+    def run(self):
+        try:
+            while not self.done.wait(HEARTBEAT_EVERY.total_seconds()):
+                try:
+                    ReportExportJob.objects.filter(
+                        pk=self.job_id, status=ReportExportJob.Status.RUNNING,
+                    ).update(heartbeat_at=timezone.now())
+                except DatabaseError:
+                    pass  # un latido perdido; el siguiente lo repone
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.done.set()
+        self.join()
+
+
+class ReportJobService:
+    """Encola, ejecuta y describe exportaciones en segundo plano."""
+
+    def enqueue(self, sale_filter, user=None):
+        """Devuelve (job, creado). Reutiliza el trabajo activo con los mismos filtros."""
+        params = sale_filter.as_params()
+        digest = params_hash(params)
+        job = self._active(digest)
+        if job is not None:
+            return job, False
+        try:
+            with transaction.atomic():
+                job = ReportExportJob.objects.create(
+                    params=params,
+                    params_hash=digest,
+                    requested_by=user if user is not None and user.is_authenticated else None,
+                )
+            return job, True
+        except IntegrityError:
+            # Otro pedido con los mismos filtros lo creó entre el SELECT y el INSERT.
+            return self._active(digest), False
+
+    def _active(self, digest):
+        return (
+            ReportExportJob.objects
+            .filter(params_hash=digest, status__in=[ReportExportJob.Status.PENDING, ReportExportJob.Status.RUNNING])
+            .first()
+        )
+
+    # ── Worker ───────────────────────────────────────────────────────────
+
+    def claim(self):
+        """Marca como RUNNING el trabajo pendiente más viejo y lo devuelve (None si no hay)."""
+        self.requeue_stale()
+        with transaction.atomic():
+            job = (
+                ReportExportJob.objects
+                .select_for_update(skip_locked=True)
+                .filter(status=ReportExportJob.Status.PENDING)
+                .order_by('created_at', 'id')
+                .first()
+            )
+            if job is None:
+                return None
+            job.status = ReportExportJob.Status.RUNNING
+            job.started_at = job.heartbeat_at = timezone.now()
+            job.progress = 0
+            job.attempts += 1
+            job.save(update_fields=['status', 'started_at', 'heartbeat_at', 'progress', 'attempts'])
+        return job
+
+    def run_next(self):
+        """Procesa un trabajo. Devuelve el trabajo procesado o None si la cola está vacía."""
+        job = self.claim()
+        if job is not None:
+            self.run(job)
+        return job
+
+    def run(self, job):
+        def progress(percent):
+            if percent != job.progress:
+                job.progress = percent
+                ReportExportJob.objects.filter(pk=job.pk).update(progress=percent)
+
+        heartbeat = _Heartbeat(job.pk)
+        heartbeat.start()
+        try:
+            report = SalesReport(SaleFilter.from_params(job.params))
+            exporter = ReportExcelExporter(report, progress=progress)
+            with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as buf:
+                exporter.write(buf)
+                buf.seek(0)
+                job.file.save(exporter.filename(), File(buf), save=False)
+        except Exception as e:
+            job.status = ReportExportJob.Status.FAILED
+            job.error = f'{type(e).__name__}: {e}'[:1000]
+        else:
+            job.status = ReportExportJob.Status.DONE
+            job.progress = 100
+        finally:
+            heartbeat.stop()
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'progress', 'file', 'error', 'finished_at'])
+        return job
+
+    def requeue_stale(self) -> int:
+        """
+        Vuelve a la cola los trabajos RUNNING cuyo worker dejó de latir; los
+        que ya agotaron MAX_ATTEMPTS se marcan como fallidos. Devuelve
+        cuántos volvieron a la cola.
+        """
+        now = timezone.now()
+        cutoff = now - STALE_AFTER
+        stale = ReportExportJob.objects.filter(
+            Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff),
+            status=ReportExportJob.Status.RUNNING,
+        )
+        stale.filter(attempts__gte=MAX_ATTEMPTS).update(
+            status=ReportExportJob.Status.FAILED,
+            error=f'El worker se detuvo {MAX_ATTEMPTS} veces generando esta exportación.',
+            finished_at=now,
+        )
+        return stale.filter(attempts__lt=MAX_ATTEMPTS).update(status=ReportExportJob.Status.PENDING, progress=0)
+
+    def purge(self, older_than=timedelta(days=7)) -> int:
+        """Borra los trabajos terminados más viejos que `older_than` junto con su archivo."""
+        cutoff = timezone.now() - older_than
+        jobs = ReportExportJob.objects.filter(
+            status__in=[ReportExportJob.Status.DONE, ReportExportJob.Status.FAILED], finished_at__lt=cutoff,
+        )
+        count = 0
+        for job in jobs.iterator():
+            if job.file:
+                job.file.delete(save=False)
+            job.delete()
+            count += 1
+        return count
+
+    # ── Estado para la página de reportes ────────────────────────────────
+
+    def status_payload(self, job) -> dict:
+        return {
+            'id': job.pk,
+            'status': job.status,
+            'status_display': job.get_status_display(),
+            'progress': job.progress,
+            'error': job.error,
+            'status_url': reverse('super:report_export_status', args=[job.pk]),
+            'download_url': (
+                reverse('super:report_export_download', args=[job.pk])
+                if job.status == ReportExportJob.Status.DONE else None
+            ),
+        }
@@ -0,0 +1,279 @@
+"""
+Consultas de la pantalla de reportes y de la exportación a Excel.
+
+Cada sección elige su fuente:
+
+- Rollups diarios (DailyPaymentRollup, DailySellerRollup, ...) cuando el
+  período está cubierto (SalesRollupState.covered_since) y los filtros se
+  pueden responder con la tabla de esa sección: leer N días × dimensión en
+  vez de todas las ventas y líneas del período.
+- Tablas crudas (Sale / SaleDetail) en cualquier otro caso: filtros por
+  monto o búsqueda de texto (se aplican venta por venta), períodos no
+  cubiertos, períodos con eventos del outbox que el rollup todavía no
+  aplicó, o combinaciones de filtros que ningún rollup tiene juntas.
+
+Las filas devueltas tienen las mismas claves sin importar la fuente, así
+que la plantilla y la exportación no saben de dónde vienen. Los rollups se
+actualizan desde el outbox (SalesRollupConsumer): pueden ir unos segundos
+detrás de la última venta.
+
+collect() calcula todas las secciones de una vez con ReportEngine (en
+paralelo sobre PostgreSQL). Cuando los tres desgloses por venta (forma de
+pago, vendedor, cliente) salen de las tablas crudas, en PostgreSQL se
+resuelven con un solo GROUPING SETS: un recorrido de las ventas en vez
+de tres.
+"""
+
+from datetime import timedelta
+from decimal import Decimal
+from functools import partial
+
+from django.db import connection
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from core.super.models import (
+    SaleDetail,
+    DailyPaymentRollup, DailySellerRollup, DailyCustomerRollup,
+    DailyProductRollup, DailyCategoryRollup,
+)
+from core.super.services.report_engine import ReportEngine
+from core.super.services.rollup_service import ROLLUP_EPOCH, SalesRollupService
+from core.super.services.sale_filter import SaleFilter
+
+# Filtro de dimensión → (rollup que lo puede responder, lookup dentro del rollup)
+DIMENSION_ROLLUPS = {
+    'payment': (DailyPaymentRollup, 'payment_id__in'),
+    'seller': (DailySellerRollup, 'seller_id'),
+    'customer': (DailyCustomerRollup, 'customer_id'),
+}
+
+
+class SalesReport:
+    """Reporte de ventas de un período con los filtros de la pantalla de reportes (un SaleFilter)."""
+
+    def __init__(self, sale_filter):
+        self.filter = sale_filter
+        self.date_from = sale_filter.date_from
+        self.date_to = sale_filter.date_to
+        self.dimensions = {
+            name: value
+            for name, value in (
+                ('payment', sale_filter.payment_ids),
+                ('seller', sale_filter.seller_id),
+                ('customer', sale_filter.customer_id),
+            )
+            if value is not None
+        }
+
+        rollups = SalesRollupService()
+        covered_since = rollups.covered_since()
+        # Con eventos del período todavía sin aplicar (worker atrasado o
+        # detenido), el rollup no refleja las ventas: se leen las tablas crudas.
+        self.use_rollups = (
+            not sale_filter.has_amount_filter and not sale_filter.q
+            and covered_since is not None and covered_since <= self.date_from
+            and not rollups.has_pending(self.date_from, self.date_to)
+        )
+
+    @classmethod
+    def from_request(cls, request, force_all=False):
+        return cls(report_filter(request, force_all))
+
+    # ── Fuentes ──────────────────────────────────────────────────────────
+
+    @property
+    def sales(self):
+        """Queryset crudo de Sale con todos los filtros (detalle de ventas y fallback)."""
+        return self.filter.apply()
+
+    @property
+    def lines(self):
+        return SaleDetail.objects.filter(sale__in=self.sales)
+
+    def _rollup(self, model, lookup=None, value=None):
+        qs = model.objects.filter(day__gte=self.date_from, day__lte=self.date_to)
+        return qs.filter(**{lookup: value}) if lookup else qs
+
+    def _sale_rollup(self, dimension=None):
+        """
+        Rollup de ventas que responde los filtros activos, o None.
+
+        Con `dimension` solo sirve si los filtros activos son, a lo sumo,
+        sobre esa misma dimensión. Sin `dimension` (KPIs, serie diaria)
+        sirve el de la única dimensión filtrada, o el de pagos si no hay
+        filtros.
+        """
+        if not self.use_rollups or len(self.dimensions) > 1:
+            return None
+        if dimension is not None and set(self.dimensions) - {dimension}:
+            return None
+        if not self.dimensions:
+            return self._rollup(DIMENSION_ROLLUPS[dimension or 'payment'][0])
+        name, value = next(iter(self.dimensions.items()))
+        model, lookup = DIMENSION_ROLLUPS[name]
+        return self._rollup(model, lookup, value)
+
+    def _line_rollup(self, model):
+        """Los rollups de líneas no tienen dimensiones de venta: solo sirven sin filtros."""
+        if not self.use_rollups or self.dimensions:
+            return None
+        return self._rollup(model)
+
+    # ── Secciones ────────────────────────────────────────────────────────
+
+    def collect(self, top_products, top_categories, top_sellers, top_customers, parallel=None) -> dict:
+        """
+        Calcula las secciones con ReportEngine. Claves: kpis, daily,
+        top_products, top_categories, by_payment, top_sellers, top_customers.
+        parallel=None decide según la base (ver ReportEngine).
+        """
+        sections = {
+            'kpis': self.kpis,
+            'top_products': partial(self.top_products, top_products),
+            'top_categories': partial(self.categories, top_categories),
+            'daily': self.daily,
+        }
+        if self.use_grouping_sets:
+            sections['breakdowns'] = partial(self.breakdowns, top_sellers, top_customers)
+        else:
+            sections['by_payment'] = self.by_payment
+            sections['top_sellers'] = partial(self.top_sellers, top_sellers)
+            sections['top_customers'] = partial(self.top_customers, top_customers)
+        results = ReportEngine(parallel).run(sections)
+        results.update(results.pop('breakdowns', {}))
+        return results
+
+    def kpis(self) -> dict:
+        rollup = self._sale_rollup()
+        if rollup is not None:
+            agg = rollup.aggregate(
+                revenue=Sum('total'), count=Sum('sale_count'), discount=Sum('discount'), iva=Sum('iva'),
+            )
+        else:
+            agg = self.sales.aggregate(
+                revenue=Sum('total'), count=Count('id_sale'), discount=Sum('discount'), iva=Sum('iva'),
+            )
+        return {
+            'revenue': agg['revenue'] or Decimal('0.00'),
+            'count': agg['count'] or 0,
+            'discount': agg['discount'] or Decimal('0.00'),
+            'iva': agg['iva'] or Decimal('0.00'),
+        }
+
+    def daily(self) -> list[dict]:
+        rollup = self._sale_rollup()
+        if rollup is not None:
+            rows = rollup.values('day').annotate(total=Sum('total'), count=Sum('sale_count'))
+        else:
+            rows = (
+                self.sales.annotate(day=TruncDate('sale_date'))
+                .values('day')
+                .annotate(total=Sum('total'), count=Count('id_sale'))
+            )
+        return list(rows.order_by('day'))
+
+    def by_payment(self) -> list[dict]:
+        return self._by_dimension('payment', ('payment__name',))
+
+    def top_sellers(self, limit) -> list[dict]:
+        return self._by_dimension('seller', ('seller__name', 'seller__last_name'), limit)
+
+    def top_customers(self, limit) -> list[dict]:
+        return self._by_dimension('customer', ('customer__name', 'customer__last_name'), limit)
+
+    def _by_dimension(self, dimension, fields, limit=None):
+        rollup = self._sale_rollup(dimension)
+        if rollup is not None:
+            rows = rollup.values(*fields).annotate(count=Sum('sale_count'), total=Sum('total'))
+        else:
+            rows = self.sales.values(*fields).annotate(count=Count('id_sale'), total=Sum('total'))
+        rows = rows.order_by('-total')
+        return list(rows[:limit] if limit else rows)
+
+    @property
+    def use_grouping_sets(self):
+        """GROUPING SETS solo en PostgreSQL y cuando ningún desglose sale de un rollup."""
+        return connection.vendor == 'postgresql' and all(
+            self._sale_rollup(dimension) is None for dimension in DIMENSION_ROLLUPS
+        )
+
+    def breakdowns(self, seller_limit, customer_limit) -> dict:
+        """
+        by_payment, top_sellers y top_customers en una sola consulta:
+
+            SELECT ... FROM (ventas filtradas) GROUP BY GROUPING SETS
+              ((forma de pago), (vendedor), (cliente))
+
+        Mismas claves y agrupación (por nombre) que _by_dimension.
+        GROUPING(col) = 0 indica a qué conjunto pertenece cada fila; hace
+        falta porque los nombres pueden ser NULL (venta sin cliente).
+        """
+        rows = self.sales.annotate(
+            p_name=F('payment__name'),
+            s_name=F('seller__name'), s_last=F('seller__last_name'),
+            c_name=F('customer__name'), c_last=F('customer__last_name'),
+        ).values('p_name', 's_name', 's_last', 'c_name', 'c_last', 'total')
+        inner, params = rows.query.sql_with_params()
+        sql = f"""
+            SELECT GROUPING(p_name), GROUPING(s_name), p_name, s_name, s_last, c_name, c_last,
+                   COUNT(*), SUM(total)
+            FROM ({inner}) AS r
+            GROUP BY GROUPING SETS ((p_name), (s_name, s_last), (c_name, c_last))
+        """
+        result = {'by_payment': [], 'top_sellers': [], 'top_customers': []}
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            for g_payment, g_seller, p_name, s_name, s_last, c_name, c_last, count, total in cursor.fetchall():
+                if g_payment == 0:
+                    result['by_payment'].append({'payment__name': p_name, 'count': count, 'total': total})
+                elif g_seller == 0:
+                    result['top_sellers'].append(
+                        {'seller__name': s_name, 'seller__last_name': s_last, 'count': count, 'total': total}
+                    )
+                else:
+                    result['top_customers'].append(
+                        {'customer__name': c_name, 'customer__last_name': c_last, 'count': count, 'total': total}
+                    )
+        for key, limit in (('by_payment', None), ('top_sellers', seller_limit), ('top_customers', customer_limit)):
+            result[key].sort(key=lambda row: row['total'], reverse=True)
+            result[key] = result[key][:limit] if limit else result[key]
+        return result
+
+    def top_products(self, limit) -> list[dict]:
+        rollup = self._line_rollup(DailyProductRollup)
+        if rollup is not None:
+            rows = rollup.values('product__name', 'product__category__name').annotate(
+                qty=Sum('quantity'), revenue=Sum('revenue'),
+            )
+        else:
+            rows = self.lines.values('product__name', 'product__category__name').annotate(
+                qty=Sum('quantity'), revenue=Sum('subtotal'),
+            )
+        return list(rows.order_by('-qty')[:limit])
+
+    def categories(self, limit=None) -> list[dict]:
+        rollup = self._line_rollup(DailyCategoryRollup)
+        if rollup is not None:
+            rows = rollup.values('category__name').annotate(
+                qty=Sum('quantity'), revenue=Sum('revenue'), items=Sum('line_count'),
+            ).order_by('-revenue')
+            rows = rows[:limit] if limit else rows
+            # Misma clave que la consulta cruda (la plantilla lee product__category__name).
+            return [{'product__category__name': row.pop('category__name'), **row} for row in rows]
+        rows = self.lines.values('product__category__name').annotate(
+            qty=Sum('quantity'), revenue=Sum('subtotal'), items=Count('id_detail'),
+        ).order_by('-revenue')
+        return list(rows[:limit] if limit else rows)
+
+
+def report_filter(request, force_all=False):
+    """
+    SaleFilter de la pantalla de reportes: por defecto los últimos 30 días.
+    Con force_all=True ignora los filtros y toma todo el histórico.
+    """
+    today = timezone.localdate()
+    if force_all:
+        return SaleFilter(ROLLUP_EPOCH, today)
+    return SaleFilter.from_request(request, today - timedelta(days=30), today)
@@ -0,0 +1,71 @@
+"""
+Resultado agregado de un reporte de ventas, calculado una sola vez por filtro.
+
+ReportSnapshot junta todo lo que muestran la pantalla de reportes, la
+exportación a Excel y la API JSON: KPIs, serie diaria, desgloses y tops.
+Guarda los tops con el mayor N que pide alguno de ellos (30 productos,
+todas las categorías, 10 vendedores / clientes); la pantalla muestra un
+corte de esas mismas listas. Los montos quedan como Decimal: pasar a
+float o a texto es tarea de quien lo muestra.
+
+Se guarda en la caché de reportes (ReportCache). SNAPSHOT_VERSION forma
+parte de la clave: si cambia la forma del snapshot, se sube el número y
+las copias viejas dejan de leerse.
+"""
+
+from dataclasses import asdict, dataclass
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.utils import timezone
+
+SNAPSHOT_VERSION = 1
+
+TOP_PRODUCTS = 30
+TOP_PEOPLE = 10
+
+
+@dataclass(frozen=True)
+class ReportSnapshot:
+    params: dict
+    date_from: date
+    date_to: date
+    kpis: dict
+    daily: list
+    by_payment: list
+    top_products: list
+    categories: list
+    top_sellers: list
+    top_customers: list
+    computed_at: datetime
+    version: int = SNAPSHOT_VERSION
+
+    @classmethod
+    def compute(cls, report) -> 'ReportSnapshot':
+        sections = report.collect(
+            top_products=TOP_PRODUCTS, top_categories=None, top_sellers=TOP_PEOPLE, top_customers=TOP_PEOPLE,
+        )
+        return cls(
+            params=report.filter.as_params(),
+            date_from=report.date_from,
+            date_to=report.date_to,
+            kpis=sections['kpis'],
+            daily=sections['daily'],
+            by_payment=sections['by_payment'],
+            top_products=sections['top_products'],
+            categories=sections['top_categories'],
+            top_sellers=sections['top_sellers'],
+            top_customers=sections['top_customers'],
+            computed_at=timezone.now(),
+        )
+
+    @property
+    def avg_ticket(self) -> Decimal:
+        count = self.kpis['count']
+        return (self.kpis['revenue'] / count).quantize(Decimal('0.01')) if count else Decimal('0.00')
+
+    def to_dict(self) -> dict:
+        """Forma para la API: fechas y Decimal los serializa DjangoJSONEncoder (JsonResponse)."""
+        data = asdict(self)
+        data['kpis'] = dict(self.kpis, avg_ticket=self.avg_ticket)
+        return data
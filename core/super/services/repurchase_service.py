@@ -1,35 +1,61 @@
-from django.db.models import Count
+from itertools import groupby
+from operator import itemgetter
+
+from django.db import transaction
 from django.utils import timezone
 from core.super.models import SaleDetail, RepurchasePattern
 
+# Líneas leídas por viaje del cursor y patrones escritos por INSERT.
+STREAM_CHUNK_SIZE = 5000
+UPSERT_CHUNK_SIZE = 1000
+
 
 class RepurchasePredictionService:
     """Calcula patrón de recompra por cliente/producto y predice cuándo avisar."""
     MIN_PURCHASES = 3  # menos de esto, el promedio es ruido
 
-    def recalculate_all(self):
-        today = timezone.localdate()
+    def recalculate_all(self, progress=None):
+        return self.recalculate(progress=progress)
 
-        pairs = (
-            SaleDetail.objects
-            .filter(sale__customer__isnull=False, product__isnull=False)
-            .values('sale__customer', 'product')
-            .annotate(count=Count('id_detail'))
-            .filter(count__gte=self.MIN_PURCHASES)
-        )
+    def recalculate(self, pairs=None, progress=None):
+        """
+        pairs=None recalcula todo; si no, solo esos pares (customer_id, product_id).
 
-        count = 0
-        for pair in pairs:
-            customer_id = pair['sale__customer']
-            product_id = pair['product']
+        Una sola consulta recorre las líneas ordenadas por (cliente,
+        producto, fecha) con un cursor del lado del servidor; cada par se
+        resuelve en una pasada al terminar sus líneas. Los patrones se
+        escriben con bulk_create(update_conflicts=True) en bloques de
+        UPSERT_CHUNK_SIZE y `progress(pares_procesados)` se llama después
+        de cada bloque.
 
-            dates = list(
-                SaleDetail.objects
-                .filter(sale__customer_id=customer_id, product_id=product_id)
-                .order_by('sale__sale_date')
-                .values_list('sale__sale_date', flat=True)
+        Un par que ya no llega a MIN_PURCHASES (ej. se eliminó una venta)
+        pierde su patrón; en el recálculo completo, todos los que sobran.
+        """
+        today = timezone.localdate()
+
+        details = SaleDetail.objects.filter(sale__customer__isnull=False, product__isnull=False)
+        if pairs is not None:
+            pairs = set(pairs)
+            details = details.filter(
+                sale__customer_id__in={c for c, _ in pairs},
+                product_id__in={p for _, p in pairs},
             )
-            if len(dates) < 2:
+        rows = (
+            details
+            .order_by('sale__customer_id', 'product_id', 'sale__sale_date')
+            .values_list('sale__customer_id', 'product_id', 'sale__sale_date')
+            .iterator(chunk_size=STREAM_CHUNK_SIZE)
+        )
+
+        kept = set()
+        batch = []
+        for (customer_id, product_id), lines in groupby(rows, key=itemgetter(0, 1)):
+            if pairs is not None and (customer_id, product_id) not in pairs:
+                continue
+            dates = [sale_date for _, _, sale_date in lines]
+            purchase_count = len(dates)
+            dates = [d for d in dates if d is not None]
+            if purchase_count < self.MIN_PURCHASES or len(dates) < 2:
                 continue
 
             intervals = [(dates[i + 1] - dates[i]).days for i in range(len(dates) - 1)]
@@ -37,14 +63,48 @@ class RepurchasePredictionService:
             last_date = dates[-1].date()
             days_since = (today - last_date).days
 
-            RepurchasePattern.objects.update_or_create(
+            batch.append(RepurchasePattern(
                 customer_id=customer_id, product_id=product_id,
-                defaults={
-                    'avg_interval_days': avg_interval,
-                    'last_purchase_date': last_date,
-                    'purchase_count': pair['count'],
-                    'is_due': days_since >= avg_interval * 0.9,
-                }
+                avg_interval_days=avg_interval,
+                last_purchase_date=last_date,
+                purchase_count=purchase_count,
+                is_due=days_since >= avg_interval * 0.9,
+            ))
+            kept.add((customer_id, product_id))
+            if len(batch) >= UPSERT_CHUNK_SIZE:
+                self._upsert(batch)
+                batch = []
+                if progress:
+                    progress(len(kept))
+        self._upsert(batch)
+        if progress and batch:
+            progress(len(kept))
+
+        self._delete_stale(pairs, kept)
+        return len(kept)
+
+    def _upsert(self, patterns):
+        if patterns:
+            # last_notified no se toca: es de quien envía los recordatorios.
+            RepurchasePattern.objects.bulk_create(
+                patterns,
+                update_conflicts=True,
+                unique_fields=['customer', 'product'],
+                update_fields=['avg_interval_days', 'last_purchase_date', 'purchase_count', 'is_due'],
+            )
+
+    def _delete_stale(self, pairs, kept):
+        """Borra, por bloques de pk, los patrones (de `pairs`, o todos) que no quedaron en `kept`."""
+        existing = RepurchasePattern.objects.all()
+        if pairs is not None:
+            existing = existing.filter(
+                customer_id__in={c for c, _ in pairs},
+                product_id__in={p for _, p in pairs},
             )
-            count += 1
-        return count
+        stale = [
+            pk for pk, customer_id, product_id in existing.values_list('pk', 'customer_id', 'product_id').iterator()
+            if (customer_id, product_id) not in kept and (pairs is None or (customer_id, product_id) in pairs)
+        ]
+        with transaction.atomic():
+            for start in range(0, len(stale), UPSERT_CHUNK_SIZE):
+                RepurchasePattern.objects.filter(pk__in=stale[start:start + UPSERT_CHUNK_SIZE]).delete()
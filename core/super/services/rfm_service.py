@@ -1,38 +1,160 @@
+from bisect import bisect_left
 from datetime import timedelta
 from decimal import Decimal
-from django.db.models import Count, Avg, Max, Q
+from django.db.models import Count, Avg, F, Max, Q
 from django.utils import timezone
-from core.super.models import Customer, CustomerInsight
+from core.super.models import Customer, CustomerInsight, RFMScoreState
+
+# Clientes leídos por viaje del cursor e insights escritos por INSERT.
+STREAM_CHUNK_SIZE = 5000
+UPSERT_CHUNK_SIZE = 1000
+
+
+def quintile_breaks(values, count=None) -> list:
+    """
+    Cuatro cortes ascendentes para puntuar por rango (vacío si no hay valores).
+
+    El corte k es el valor en la posición ceil(n·k/5) del orden ascendente,
+    así un valor sube al quintil k+1 solo si al menos k/5 de la base es
+    estrictamente menor. Con `count`, `values` ya viene ordenado y se
+    recorre una sola vez (sirve para un cursor).
+    """
+    if count is None:
+        values = sorted(values)
+        count = len(values)
+    if not count:
+        return []
+    positions = [-(-count * k // 5) - 1 for k in range(1, 5)]
+    breaks = []
+    for index, value in enumerate(values):
+        while len(breaks) < 4 and positions[len(breaks)] == index:
+            breaks.append(value)
+        if len(breaks) == 4:
+            break
+    return breaks
+
+
+def quintile_score(breaks, value):
+    """
+    1-5 según en qué quintil cae `value` (None sin cortes). Los empates
+    comparten el quintil más bajo: si todos tienen 0, todos puntúan 1.
+    """
+    return 1 + bisect_left(breaks, value) if breaks else None
+
+
+def _recency_days(today, last_sale):
+    return (today - last_sale.date()).days if last_sale else 999
 
 
 class RFMSegmentationService:
-    """Calcula segmentación RFM para todos los clientes."""
-    def recalculate_all(self):
+    """Calcula segmentación RFM para todos los clientes (o solo algunos)."""
+    def recalculate_all(self, progress=None):
+        return self.recalculate(progress=progress)
+
+    def recalculate(self, customer_ids=None, progress=None):
+        """
+        customer_ids=None recalcula todos; si no, solo esos clientes (uso incremental).
+
+        Los clientes anotados se leen en lotes de STREAM_CHUNK_SIZE (solo
+        tuplas, no instancias) y los insights se escriben con
+        bulk_create(update_conflicts=True) en bloques de UPSERT_CHUNK_SIZE;
+        `progress(clientes_escritos)` se llama después de cada bloque.
+
+        El recálculo completo además calcula los cortes de quintil de R, F
+        y M sobre todos los clientes con compras y los guarda en
+        RFMScoreState; el incremental puntúa con los últimos cortes
+        guardados. Los cortes salen de una primera pasada ordenada por
+        métrica, así que en memoria nunca está la base entera.
+        """
         today = timezone.localdate()
         thirty_days_ago = today - timedelta(days=30)
 
-        customers = Customer.objects.annotate(
+        customers = Customer.objects.all()
+        if customer_ids is not None:
+            customers = customers.filter(pk__in=customer_ids)
+        customers = customers.annotate(
             last_sale=Max('sale__sale_date'),
             freq_30d=Count('sale', filter=Q(sale__sale_date__gte=thirty_days_ago)),
             avg_ticket=Avg('sale__total'),
         )
 
-        count = 0
-        for customer in customers:
-            recency = (today - customer.last_sale.date()).days if customer.last_sale else 999
-            segment = self._classify(recency, customer.freq_30d, customer.avg_ticket)
-
-            CustomerInsight.objects.update_or_create(
-                customer=customer,
-                defaults={
-                    'recency_days': recency,
-                    'frequency_30d': customer.freq_30d,
-                    'avg_ticket': customer.avg_ticket or Decimal('0'),
-                    'segment': segment,
-                }
+        if customer_ids is None:
+            breaks = self._save_breaks(customers, today)
+        else:
+            breaks = RFMScoreState.objects.filter(pk=1).values_list('breaks', flat=True).first() or {}
+
+        rows = (
+            customers
+            .order_by('pk')
+            .values_list('pk', 'last_sale', 'freq_30d', 'avg_ticket')
+            .iterator(chunk_size=STREAM_CHUNK_SIZE)
+        )
+        written = 0
+        batch = []
+        for pk, last_sale, freq_30d, avg_ticket in rows:
+            recency = _recency_days(today, last_sale)
+            avg_ticket = avg_ticket or Decimal('0')
+            scores = self._scores(breaks, recency, freq_30d, avg_ticket) if last_sale else (None, None, None)
+            batch.append(CustomerInsight(
+                customer_id=pk,
+                recency_days=recency,
+                frequency_30d=freq_30d,
+                avg_ticket=avg_ticket,
+                segment=self._classify(recency, freq_30d, avg_ticket),
+                r_score=scores[0], f_score=scores[1], m_score=scores[2],
+            ))
+            written += 1
+            if len(batch) >= UPSERT_CHUNK_SIZE:
+                self._upsert(batch)
+                batch = []
+                if progress:
+                    progress(written)
+        if batch:
+            self._upsert(batch)
+            if progress:
+                progress(written)
+        return written
+
+    def _save_breaks(self, customers, today) -> dict:
+        """Cortes de cada métrica recorriendo a los compradores ordenados por ella (una consulta por métrica)."""
+        buyers = customers.filter(last_sale__isnull=False)
+        count = buyers.count()
+
+        def ordered(field):
+            return (
+                buyers.order_by(F(field).asc(nulls_first=True))
+                .values_list(field, flat=True)
+                .iterator(chunk_size=STREAM_CHUNK_SIZE)
+            )
+
+        breaks = {
+            # Más reciente = recencia negada mayor: el orden por fecha ya es el de -recency.
+            'recency': quintile_breaks((-_recency_days(today, last) for last in ordered('last_sale')), count),
+            'frequency': quintile_breaks(ordered('freq_30d'), count),
+            'monetary': quintile_breaks((float(avg or 0) for avg in ordered('avg_ticket')), count),
+        }
+        RFMScoreState.objects.update_or_create(pk=1, defaults={'breaks': breaks, 'customers': count})
+        return breaks
+
+    def _scores(self, breaks, recency, freq_30d, avg_ticket):
+        """(R, F, M); la recencia se compara negada porque menos días es mejor."""
+        return (
+            quintile_score(breaks.get('recency'), -recency),
+            quintile_score(breaks.get('frequency'), freq_30d),
+            quintile_score(breaks.get('monetary'), float(avg_ticket)),
+        )
+
+    def _upsert(self, insights):
+        if insights:
+            CustomerInsight.objects.bulk_create(
+                insights,
+                update_conflicts=True,
+                unique_fields=['customer'],
+                update_fields=[
+                    'recency_days', 'frequency_30d', 'avg_ticket', 'segment',
+                    'r_score', 'f_score', 'm_score', 'updated_at',
+                ],
             )
-            count += 1
-        return count
 
     def _classify(self, recency, freq_30d, avg_ticket):
         if recency >= 999:
@@ -0,0 +1,236 @@
+"""
+Mantenimiento de los rollups diarios de ventas (día × forma de pago,
+vendedor, cliente, producto y categoría).
+
+La unidad de trabajo es el DÍA: reconstruir un día lo recalcula desde
+Sale / SaleDetail para las cinco tablas. Es idempotente (procesar dos
+veces el mismo evento no duplica nada) y un día de ventas se agrega en
+milisegundos. El consumidor del outbox reconstruye solo los días que
+tocan los eventos del lote; rebuild_rollups hace el backfill completo.
+
+Los reportes cacheados (ReportCache, PeriodComparison) salen de estas
+tablas. Las señales de Sale los invalidan al confirmarse la venta, pero
+en ese momento el rollup todavía no cambió: un request en el medio
+cachearía el reporte viejo. Por eso toda reconstrucción vuelve a
+invalidar sus namespaces al confirmarse.
+"""
+
+from datetime import date, timedelta
+
+from django.db import transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from core.super.models import (
+    Sale, SaleDetail, SaleEvent, SalesRollupState,
+    DailyPaymentRollup, DailySellerRollup, DailyCustomerRollup,
+    DailyProductRollup, DailyCategoryRollup,
+)
+from core.super.services.cache_service import TwoTierCache
+from core.super.services.report_cache_service import LIVE_NAMESPACE, REPORT_HISTORY_NAMESPACE
+from core.super.services.sale_filter import SaleFilter
+
+# Inicio del histórico: el mismo que usa la exportación "todo el histórico".
+ROLLUP_EPOCH = date(2000, 1, 1)
+REBUILD_CHUNK_DAYS = 31
+# Nombre del consumidor del outbox que mantiene los rollups (SalesRollupConsumer).
+ROLLUP_CONSUMER = 'sales_rollup'
+# Con más eventos pendientes que esto no se revisan uno por uno: se asume
+# que el worker está atrasado y los reportes leen las tablas crudas.
+PENDING_SCAN_LIMIT = 500
+
+SALE_ROLLUPS = {
+    DailyPaymentRollup: 'payment',
+    DailySellerRollup: 'seller',
+    DailyCustomerRollup: 'customer',
+}
+LINE_ROLLUPS = {
+    DailyProductRollup: ('product', 'product_id'),
+    DailyCategoryRollup: ('category', 'product__category_id'),
+}
+
+
+def event_datetime(raw):
+    """Fecha y hora (aware) guardada en el snapshot de un SaleEvent (None si falta o es solo fecha)."""
+    parsed = parse_datetime(raw) if raw else None
+    if parsed is not None and timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def event_day(raw):
+    """Día local de una fecha guardada en el snapshot de un SaleEvent (o None)."""
+    if not raw:
+        return None
+    parsed = event_datetime(raw)
+    if parsed is None:
+        return parse_date(raw)
+    return timezone.localdate(parsed)
+
+
+def _consecutive(days):
+    """Agrupa días ordenados en tramos [(desde, hasta)] de días seguidos."""
+    spans = []
+    for day in days:
+        if spans and day == spans[-1][1] + timedelta(days=1):
+            spans[-1] = (spans[-1][0], day)
+        else:
+            spans.append((day, day))
+    return spans
+
+
+def _day_ranges(spans, prefix=''):
+    """
+    Q con un rango semiabierto [desde 00:00, hasta + 1 día 00:00) en hora
+    local por tramo, sobre sale_date tal cual: usa el índice, a diferencia
+    de sale_date__date (DATE() por fila).
+    """
+    query = Q()
+    for date_from, date_to in spans:
+        start, end = SaleFilter(date_from, date_to).datetime_range()
+        query |= Q(**{f'{prefix}sale_date__gte': start, f'{prefix}sale_date__lt': end})
+    return query
+
+
+def _invalidate_reports_on_commit(days):
+    """Invalida los reportes cacheados que leen estos días, recién cuando los rollups nuevos son visibles."""
+    namespaces = [LIVE_NAMESPACE]
+    if min(days) < timezone.localdate():
+        namespaces.append(REPORT_HISTORY_NAMESPACE)
+    transaction.on_commit(lambda: TwoTierCache().bump(*namespaces))
+
+
+class SalesRollupService:
+    """Reconstruye rollups por día y lleva el registro de cobertura."""
+
+    def _lock_state(self):
+        SalesRollupState.objects.get_or_create(pk=1)
+        return SalesRollupState.objects.select_for_update().get(pk=1)
+
+    def covered_since(self):
+        return SalesRollupState.objects.filter(pk=1).values_list('covered_since', flat=True).first()
+
+    def has_pending(self, date_from=None, date_to=None) -> bool:
+        """
+        True si hay eventos del outbox que el consumidor de rollups todavía
+        no aplicó y tocan algún día de [date_from, date_to]: esos días del
+        rollup no reflejan todavía las ventas confirmadas.
+        """
+        payloads = list(
+            SaleEvent.objects
+            .filter(processed_at__isnull=True)
+            .exclude(consumed_by__contains=f',{ROLLUP_CONSUMER},')
+            .values_list('payload', flat=True)[:PENDING_SCAN_LIMIT + 1]
+        )
+        if len(payloads) > PENDING_SCAN_LIMIT:
+            return True
+        for payload in payloads:
+            for side in ('before', 'after'):
+                snap = payload.get(side)
+                day = event_day(snap['sale_date']) if snap else None
+                if day and (date_from is None or day >= date_from) and (date_to is None or day <= date_to):
+                    return True
+        return False
+
+    def rebuild_days(self, days):
+        """
+        Recalcula las cinco tablas para `days` (iterable de date).
+
+        No cambia covered_since: reconstruir días sueltos no garantiza los
+        días de alrededor. La cobertura la establece solo rebuild_range.
+        """
+        days = sorted(set(d for d in days if d))
+        if not days:
+            return 0
+        with transaction.atomic():
+            self._lock_state().save()
+            self._rebuild(days)
+            _invalidate_reports_on_commit(days)
+        return len(days)
+
+    def rebuild_range(self, date_from=None, date_to=None, progress=None):
+        """
+        Backfill: reconstruye [date_from, date_to] por bloques de
+        REBUILD_CHUNK_DAYS días, una transacción por bloque. Sin date_from
+        reconstruye todo el histórico.
+        """
+        date_to = date_to or timezone.localdate()
+        date_from = date_from or ROLLUP_EPOCH
+        sale_days = sorted(
+            Sale.objects
+            .filter(_day_ranges([(date_from, date_to)]))
+            .annotate(day=TruncDate('sale_date'))
+            .values_list('day', flat=True)
+            .distinct()
+        )
+
+        start, rebuilt = date_from, 0
+        while start <= date_to:
+            end = min(start + timedelta(days=REBUILD_CHUNK_DAYS - 1), date_to)
+            chunk = [d for d in sale_days if start <= d <= end]
+            with transaction.atomic():
+                self._lock_state()
+                # Días del bloque sin ventas: se borran sus filas viejas.
+                for model in (*SALE_ROLLUPS, *LINE_ROLLUPS):
+                    model.objects.filter(day__gte=start, day__lte=end).delete()
+                self._rebuild(chunk)
+                _invalidate_reports_on_commit([start, end])
+            rebuilt += len(chunk)
+            if progress:
+                progress(end, rebuilt)
+            start = end + timedelta(days=1)
+
+        with transaction.atomic():
+            state = self._lock_state()
+            if state.covered_since is None or date_from < state.covered_since:
+                state.covered_since = date_from
+            state.save()
+        return rebuilt
+
+    def _rebuild(self, days):
+        for model in (*SALE_ROLLUPS, *LINE_ROLLUPS):
+            model.objects.filter(day__in=days).delete()
+        if not days:
+            return
+
+        ranges = _day_ranges(_consecutive(days))
+        sales = Sale.objects.filter(ranges).annotate(day=TruncDate('sale_date'))
+        for model, dim in SALE_ROLLUPS.items():
+            rows = (
+                sales.values('day', f'{dim}_id')
+                .annotate(
+                    sale_count=Count('id_sale'), subtotal_sum=Sum('subtotal'),
+                    iva_sum=Sum('iva'), discount_sum=Sum('discount'), total_sum=Sum('total'),
+                )
+                .order_by()
+            )
+            model.objects.bulk_create([
+                model(
+                    day=row['day'], **{f'{dim}_id': row[f'{dim}_id']},
+                    sale_count=row['sale_count'], subtotal=row['subtotal_sum'] or 0,
+                    iva=row['iva_sum'] or 0, discount=row['discount_sum'] or 0, total=row['total_sum'] or 0,
+                )
+                for row in rows
+            ])
+
+        lines = (
+            SaleDetail.objects
+            .filter(_day_ranges(_consecutive(days), prefix='sale__'))
+            .annotate(day=TruncDate('sale__sale_date'))
+        )
+        for model, (dim, source) in LINE_ROLLUPS.items():
+            rows = (
+                lines.annotate(dim_id=F(source))
+                .values('day', 'dim_id')
+                .annotate(qty=Sum('quantity'), revenue_sum=Sum('subtotal'), lines=Count('id_detail'))
+                .order_by()
+            )
+            model.objects.bulk_create([
+                model(
+                    day=row['day'], **{f'{dim}_id': row['dim_id']},
+                    quantity=row['qty'] or 0, revenue=row['revenue_sum'] or 0, line_count=row['lines'],
+                )
+                for row in rows
+            ])
@@ -0,0 +1,237 @@
+"""
+Outbox de eventos de venta + consumidores incrementales.
+
+Flujo:
+  1. Quien crea / edita / elimina una venta llama a SaleEventService().record()
+     dentro de su transaction.atomic → el evento se confirma junto con la
+     venta, o desaparece con ella en el rollback.
+  2. El comando process_sale_events reclama lotes de eventos pendientes con
+     SELECT ... FOR UPDATE SKIP LOCKED (varios workers en paralelo no se
+     pisan) y los reparte a los consumidores registrados.
+  3. Cada consumidor recalcula SOLO lo que tocan los eventos del lote
+     (los clientes y productos involucrados), no la tabla entera.
+
+Para agregar un consumidor: subclase de SaleEventConsumer + registrarla en
+SALE_EVENT_CONSUMERS (mismo patrón que PAYMENT_PROCESSORS).
+"""
+
+from abc import ABC, abstractmethod
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from core.super.models import SaleDetail, SaleEvent
+from core.super.services.market_basket_service import MarketBasketService
+from core.super.services.repurchase_service import RepurchasePredictionService
+from core.super.services.rfm_service import RFMSegmentationService
+from core.super.services.rollup_service import ROLLUP_CONSUMER, SalesRollupService, event_day
+
+# Pasados estos intentos el evento queda "muerto" (no se reclama más) y
+# se revisa a mano por last_error en el admin.
+MAX_ATTEMPTS = 5
+DEFAULT_BATCH_SIZE = 200
+
+
+def _mark(name) -> str:
+    return f',{name},'
+
+
+def _consumed(event) -> set:
+    """Consumidores que ya aplicaron el evento."""
+    return set(filter(None, event.consumed_by.split(',')))
+
+
+def snapshot_sale(sale, details=None) -> dict:
+    """
+    Foto serializable de la venta y sus líneas.
+
+    Si el llamador ya tiene los SaleDetail en memoria los pasa en
+    `details`; si no, se leen con una sola consulta.
+    """
+    if details is None:
+        lines = SaleDetail.objects.filter(sale=sale).values_list('product_id', 'quantity', 'subtotal')
+    else:
+        lines = [(detail.product_id, detail.quantity, detail.subtotal) for detail in details]
+    return {
+        'customer_id': sale.customer_id,
+        'seller_id': sale.seller_id,
+        'payment_id': sale.payment_id,
+        'sale_date': str(sale.sale_date) if sale.sale_date else None,
+        'total': str(sale.total),
+        'discount': str(sale.discount),
+        'lines': [[product_id, quantity, str(subtotal)] for product_id, quantity, subtotal in lines],
+    }
+
+
+# ── Consumidores ─────────────────────────────────────────────────────────
+
+class SaleEventConsumer(ABC):
+    """Recibe un lote de eventos ya confirmados y actualiza datos derivados."""
+    name = ''
+
+    @abstractmethod
+    def handle(self, events):
+        ...
+
+    @staticmethod
+    def snapshots(events):
+        """Fotos antes/después de cada evento (las que existan)."""
+        for event in events:
+            for side in ('before', 'after'):
+                snap = event.payload.get(side)
+                if snap:
+                    yield snap
+
+
+class CustomerInsightConsumer(SaleEventConsumer):
+    """Recalcula el RFM solo de los clientes que aparecen en el lote."""
+    name = 'customer_insight'
+
+    def handle(self, events):
+        customer_ids = {snap['customer_id'] for snap in self.snapshots(events) if snap['customer_id']}
+        if customer_ids:
+            RFMSegmentationService().recalculate(customer_ids=customer_ids)
+
+
+class RepurchasePatternConsumer(SaleEventConsumer):
+    """Recalcula el patrón de recompra solo de los pares cliente-producto tocados."""
+    name = 'repurchase_pattern'
+
+    def handle(self, events):
+        pairs = {
+            (snap['customer_id'], product_id)
+            for snap in self.snapshots(events) if snap['customer_id']
+            for product_id, _, _ in snap['lines'] if product_id
+        }
+        if pairs:
+            RepurchasePredictionService().recalculate(pairs=pairs)
+
+
+class SalesRollupConsumer(SaleEventConsumer):
+    """Reconstruye los rollups diarios solo de los días que tocan los eventos (antes y después)."""
+    name = ROLLUP_CONSUMER
+
+    def handle(self, events):
+        days = {event_day(snap['sale_date']) for snap in self.snapshots(events)}
+        SalesRollupService().rebuild_days(days)
+
+
+class MarketBasketConsumer(SaleEventConsumer):
+    """
+    Resta la canasta de 'before' y suma la de 'after' en los conteos de
+    co-ocurrencia (salvo eventos que la última reconstrucción ya contó).
+    """
+    name = 'market_basket'
+
+    def handle(self, events):
+        MarketBasketService().apply_events(events)
+
+
+SALE_EVENT_CONSUMERS = {
+    CustomerInsightConsumer.name: CustomerInsightConsumer,
+    RepurchasePatternConsumer.name: RepurchasePatternConsumer,
+    SalesRollupConsumer.name: SalesRollupConsumer,
+    MarketBasketConsumer.name: MarketBasketConsumer,
+}
+
+
+# ── Servicio ─────────────────────────────────────────────────────────────
+
+class SaleEventService:
+    """Escribe eventos en el outbox y los procesa por lotes."""
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+        return cls._instance
+
+    def record(self, sale, event_type, before=None, details=None) -> SaleEvent:
+        """
+        Registra el evento. Debe llamarse dentro de la transacción que
+        modifica la venta y DESPUÉS de escribir sus líneas: la foto
+        'after' se toma en ese momento (de `details` o de la BD).
+
+        `before` es la foto previa (snapshot_sale) para ediciones y
+        eliminaciones.
+        """
+        after = None if event_type == SaleEvent.EventType.DELETED else snapshot_sale(sale, details)
+        return SaleEvent.objects.create(
+            sale_ref=sale.pk,
+            event_type=event_type,
+            payload={'before': before, 'after': after},
+        )
+
+    def process_batch(self, batch_size=DEFAULT_BATCH_SIZE, consumers=None) -> int:
+        """
+        Reclama y procesa un lote. Devuelve cuántos eventos se intentaron
+        (0 = no queda nada pendiente para estos consumidores), hayan
+        salido bien o no: un lote en el que todo falla no corta el bucle.
+
+        Todo el lote se reparte de una vez; si un consumidor falla, se
+        reintenta evento por evento y consumidor por consumidor para
+        aislar al culpable y no frenar al resto. Cada consumidor que
+        termina queda anotado en consumed_by; el evento se marca procesado
+        cuando lo aplicaron todos los registrados. Los que fallan suman un
+        intento y quedan pendientes solo para el consumidor que falló.
+        """
+        consumers = consumers or [cls() for cls in SALE_EVENT_CONSUMERS.values()]
+
+        with transaction.atomic():
+            pending_for_any = Q()
+            for consumer in consumers:
+                pending_for_any |= ~Q(consumed_by__contains=_mark(consumer.name))
+            events = list(
+                SaleEvent.objects
+                .select_for_update(skip_locked=True)
+                .filter(pending_for_any, processed_at__isnull=True, attempts__lt=MAX_ATTEMPTS)
+                .order_by('id')[:batch_size]
+            )
+            if not events:
+                return 0
+
+            consumed_before = {event.pk: event.consumed_by for event in events}
+            try:
+                with transaction.atomic():
+                    for consumer in consumers:
+                        self._dispatch(consumer, events)
+            except Exception:
+                for event in events:
+                    # El rollback deshizo también lo que sí había aplicado el lote.
+                    event.consumed_by = consumed_before[event.pk]
+                    errors = []
+                    for consumer in consumers:
+                        try:
+                            with transaction.atomic():
+                                self._dispatch(consumer, [event])
+                        except Exception as e:
+                            errors.append(f'{consumer.name}: {type(e).__name__}: {e}')
+                    if errors:
+                        event.attempts += 1
+                        event.last_error = '; '.join(errors)[:1000]
+
+            now = timezone.now()
+            registered = set(SALE_EVENT_CONSUMERS)
+            for event in events:
+                if registered <= _consumed(event):
+                    event.processed_at = now
+            SaleEvent.objects.bulk_update(events, ['consumed_by', 'processed_at', 'attempts', 'last_error'])
+        return len(events)
+
+    def _dispatch(self, consumer, events):
+        """Pasa al consumidor los eventos que todavía no aplicó y los anota como aplicados."""
+        todo = [event for event in events if consumer.name not in _consumed(event)]
+        if todo:
+            consumer.handle(todo)
+        for event in todo:
+            event.consumed_by = (event.consumed_by or ',') + f'{consumer.name},'
+
+    def pending_count(self) -> int:
+        return SaleEvent.objects.filter(processed_at__isnull=True, attempts__lt=MAX_ATTEMPTS).count()
+
+    def purge_processed(self, older_than=timedelta(days=7)) -> int:
+        """Borra en un solo DELETE los eventos ya procesados más viejos que `older_than`."""
+        cutoff = timezone.now() - older_than
+        return SaleEvent.objects.filter(processed_at__lt=cutoff).delete()[0]
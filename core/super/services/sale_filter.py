@@ -0,0 +1,169 @@
+"""
+Filtro de ventas compartido por el listado de ventas y los reportes.
+
+Traduce los parámetros GET a predicados que pueden usar los índices de
+Sale en vez de recorrer la tabla:
+
+- Fechas: rango semiabierto [desde 00:00, hasta + 1 día 00:00) en la zona
+  horaria activa, sobre la columna sale_date tal cual. sale_date__date
+  envuelve la columna en DATE() / AT TIME ZONE y el índice no sirve.
+- Forma de pago: por id (payment_id). Un nombre (enlaces viejos del
+  reporte) se resuelve a ids contra la tabla chica de formas de pago, no
+  con un JOIN + LIKE por cada venta.
+- Búsqueda: un número es el N° de venta exacto (búsqueda por pk); el texto
+  busca en cliente / vendedor / forma de pago. id_sale__icontains
+  convertía la pk a texto en cada fila.
+
+Índices compuestos que respaldan las combinaciones comunes (ver Sale.Meta):
+(sale_date, payment), (seller, sale_date) y (customer, sale_date).
+"""
+
+from datetime import datetime, time, timedelta
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Q
+from django.utils import timezone
+
+from core.super.models import Sale, PaymentMethod
+
+
+class SaleFilter:
+    """Filtros de ventas leídos de un request y aplicables a un queryset de Sale."""
+
+    def __init__(self, date_from=None, date_to=None, payment='', seller='', customer='',
+                 min_total='', max_total='', q=''):
+        self.date_from = date_from
+        self.date_to = date_to
+        self.payment = str(payment or '').strip()
+        self.seller_id = _as_id(seller)
+        self.customer_id = _as_id(customer)
+        self.min_total = _as_decimal(min_total)
+        self.max_total = _as_decimal(max_total)
+        self.q = str(q or '').strip()
+        self._payment_ids = None
+
+    @classmethod
+    def from_request(cls, request, default_from=None, default_to=None):
+        """Lee los parámetros GET; las fechas inválidas o ausentes toman los valores por defecto."""
+        params = request.GET
+        return cls(
+            date_from=_parse_date(params.get('date_from'), default_from),
+            date_to=_parse_date(params.get('date_to'), default_to),
+            payment=params.get('payment', ''),
+            seller=params.get('seller', ''),
+            customer=params.get('customer', ''),
+            min_total=params.get('min_total', ''),
+            max_total=params.get('max_total', ''),
+            q=params.get('q', ''),
+        )
+
+    def as_params(self) -> dict:
+        """Forma serializable (JSON) y canónica del filtro: mismos filtros → mismo dict."""
+        return {
+            'date_from': self.date_from.isoformat() if self.date_from else None,
+            'date_to': self.date_to.isoformat() if self.date_to else None,
+            'payment': self.payment,
+            'seller': self.seller_id,
+            'customer': self.customer_id,
+            'min_total': str(self.min_total) if self.min_total is not None else None,
+            'max_total': str(self.max_total) if self.max_total is not None else None,
+            'q': self.q,
+        }
+
+    @classmethod
+    def from_params(cls, params):
+        """Inversa de as_params()."""
+        params = dict(params)
+        for key in ('date_from', 'date_to'):
+            params[key] = _parse_date(params.get(key), None)
+        return cls(**params)
+
+    # ── Predicados ───────────────────────────────────────────────────────
+
+    def datetime_range(self):
+        """(inicio, fin) como datetimes con zona para el rango semiabierto; cualquiera puede ser None."""
+        tz = timezone.get_current_timezone()
+        start = timezone.make_aware(datetime.combine(self.date_from, time.min), tz) if self.date_from else None
+        end = timezone.make_aware(datetime.combine(self.date_to + timedelta(days=1), time.min), tz) if self.date_to else None
+        return start, end
+
+    @property
+    def payment_ids(self):
+        """Ids de forma de pago del filtro (None = sin filtro). Un nombre se resuelve una sola vez."""
+        if not self.payment:
+            return None
+        if self._payment_ids is None:
+            payment_id = _as_id(self.payment)
+            if payment_id is not None:
+                self._payment_ids = [payment_id]
+            else:
+                self._payment_ids = list(
+                    PaymentMethod.objects.filter(name__icontains=self.payment).values_list('pk', flat=True)
+                )
+        return self._payment_ids
+
+    @property
+    def has_amount_filter(self):
+        return self.min_total is not None or self.max_total is not None
+
+    def q_objects(self) -> Q:
+        start, end = self.datetime_range()
+        query = Q()
+        if start is not None:
+            query &= Q(sale_date__gte=start)
+        if end is not None:
+            query &= Q(sale_date__lt=end)
+        if self.payment_ids is not None:
+            query &= Q(payment_id__in=self.payment_ids)
+        if self.seller_id is not None:
+            query &= Q(seller_id=self.seller_id)
+        if self.customer_id is not None:
+            query &= Q(customer_id=self.customer_id)
+        if self.min_total is not None:
+            query &= Q(total__gte=self.min_total)
+        if self.max_total is not None:
+            query &= Q(total__lte=self.max_total)
+        if self.q:
+            query &= self._search()
+        return query
+
+    def _search(self) -> Q:
+        if self.q.isdigit():
+            return Q(pk=int(self.q))
+        return (
+            Q(customer__name__icontains=self.q) |
+            Q(customer__last_name__icontains=self.q) |
+            Q(seller__name__icontains=self.q) |
+            Q(seller__last_name__icontains=self.q) |
+            Q(payment__name__icontains=self.q)
+        )
+
+    def apply(self, qs=None):
+        qs = Sale.objects.all() if qs is None else qs
+        return qs.filter(self.q_objects())
+
+
+def _as_id(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _as_decimal(value):
+    if value in (None, ''):
+        return None
+    try:
+        return Decimal(str(value))
+    except InvalidOperation:
+        return None
+
+
+def _parse_date(value, fallback):
+    """Convierte string YYYY-MM-DD a date, devuelve fallback si falla."""
+    if not value:
+        return fallback
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        return fallback
@@ -0,0 +1,262 @@
+"""
+Sincronización masiva de ventas hechas offline en los terminales POS.
+
+Cada venta trae su propia idempotency_key: reenviar el mismo lote (porque
+se cortó la conexión a mitad de camino) no duplica nada, las ventas ya
+registradas vuelven como 'duplicate'.
+
+Las ventas se procesan por bloques de CHUNK_SIZE, una transacción por
+bloque y un número fijo de queries por bloque:
+
+1. Un SELECT para las claves que ya existen y uno por tabla referenciada
+   (cliente, vendedor, forma de pago) para validar los ids.
+2. Un SELECT ... FOR UPDATE de todos los productos del bloque, en orden
+   de pk (mismo orden que el checkout → no hay deadlocks entre ambos).
+3. Validación en memoria con stock corriente: una venta sin stock se
+   rechaza sola, las demás del bloque siguen. Los productos sharded se
+   descuentan venta por venta en un savepoint: sus shards no quedan
+   bloqueados por el SELECT del paso 2 y un checkout concurrente puede
+   dejarlos sin stock; entonces se rechaza solo esa venta.
+4. bulk_create de ventas, de detalles, de movimientos del ledger y de
+   eventos del outbox, y un solo UPDATE ... CASE para el stock.
+"""
+
+from decimal import Decimal, InvalidOperation
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from core.super.models import Sale, SaleDetail, SaleEvent, Product, InventoryMovement
+from core.super.services.cache_service import TwoTierCache
+from core.super.services.checkout_service import decrement_stock
+from core.super.services.idempotency_service import IdempotencyService
+from core.super.services.inventory_service import InventoryService
+from core.super.services.report_cache_service import REPORT_HISTORY_NAMESPACE, touches_history
+from core.super.services.sale_event_service import snapshot_sale
+from core.super.services.stock_shard_service import StockShardService
+
+CHUNK_SIZE = 200
+MAX_SALES_PER_REQUEST = 5000
+
+CREATED = 'created'
+DUPLICATE = 'duplicate'
+ERROR = 'error'
+
+
+class SaleSyncService:
+    """Registra un arreglo de ventas offline y devuelve un resultado por venta."""
+
+    def sync(self, sales, chunk_size=CHUNK_SIZE) -> list[dict]:
+        results = []
+        seen_keys = set()
+        for start in range(0, len(sales), chunk_size):
+            results.extend(self._sync_chunk(sales[start:start + chunk_size], seen_keys))
+        return results
+
+    def _sync_chunk(self, chunk, seen_keys):
+        try:
+            with transaction.atomic():
+                return self._register_chunk(chunk, seen_keys)
+        except IntegrityError:
+            # Otra sincronización insertó alguna de estas claves entre
+            # nuestro SELECT y el INSERT: se reintenta una vez, ahora esas
+            # claves aparecen como existentes y vuelven como 'duplicate'.
+            with transaction.atomic():
+                return self._register_chunk(chunk, seen_keys)
+
+    def _register_chunk(self, chunk, seen_keys):
+        results = [None] * len(chunk)
+        keys = {}
+        parse_key = IdempotencyService().parse_key
+
+        # ── Claves: inválidas, repetidas dentro del envío o ya registradas
+        for i, data in enumerate(chunk):
+            key = parse_key(str(data.get('idempotency_key') or ''))
+            if key is None:
+                results[i] = self._result(data, ERROR, error='Clave de idempotencia inválida o ausente')
+            elif key in seen_keys or key in keys.values():
+                results[i] = self._result(data, DUPLICATE)
+            else:
+                keys[i] = key
+
+        existing = dict(
+            Sale.objects.filter(idempotency_key__in=keys.values()).values_list('idempotency_key', 'id_sale')
+        )
+        for i, key in list(keys.items()):
+            if key in existing:
+                results[i] = self._result(chunk[i], DUPLICATE, sale_id=existing.pop(key))
+                del keys[i]
+
+        # ── Referencias: una consulta por tabla para todo el bloque
+        refs = {'customer': set(), 'seller': set(), 'payment': set()}
+        product_ids = set()
+        for i in keys:
+            for field, ids in refs.items():
+                ids.add(_as_id(chunk[i].get(field)))
+            for line in chunk[i].get('details') or []:
+                product_ids.add(_as_id(line.get('product')))
+        valid_refs = {
+            field: set(Sale._meta.get_field(field).related_model.objects.filter(pk__in=ids - {None}).values_list('pk', flat=True))
+            for field, ids in refs.items()
+        }
+
+        # ── Lock de productos: una sola vez por bloque
+        products = {
+            product.pk: product
+            for product in Product.objects.select_for_update().filter(pk__in=product_ids).order_by('pk')
+        }
+        available = {pk: product.stock for pk, product in products.items()}
+        sharded = {pk for pk, product in products.items() if product.stock_shards}
+        if sharded:
+            # En modo sharded Product.stock es un total atrasado: se valida contra los shards.
+            available.update(StockShardService().totals(sharded))
+
+        # ── Validación en memoria, en el orden en que se vendió
+        pending = []
+        sold = {}
+        for i, key in keys.items():
+            try:
+                sale, details, quantities = self._build_sale(chunk[i], key, products, available, valid_refs)
+                self._consume_shards({pk: qty for pk, qty in quantities.items() if pk in sharded})
+            except ValueError as e:
+                results[i] = self._result(chunk[i], ERROR, error=str(e))
+                continue
+            for pk, quantity in quantities.items():
+                available[pk] -= quantity
+                sold[pk] = sold.get(pk, 0) + quantity
+            pending.append((i, sale, details, quantities))
+
+        # ── Escritura en lote
+        if pending:
+            Sale.objects.bulk_create([sale for _, sale, _, _ in pending])
+            all_details = []
+            for _, sale, details, _ in pending:
+                for detail in details:
+                    detail.sale = sale
+                all_details.extend(details)
+            SaleDetail.objects.bulk_create(all_details)
+
+            # Los sharded ya se descontaron en _consume_shards.
+            decrement_stock({pk: qty for pk, qty in sold.items() if pk not in sharded}, record=False)
+            inventory = InventoryService()
+            InventoryMovement.objects.bulk_create([
+                movement
+                for _, sale, _, quantities in pending
+                for movement in inventory.movements(
+                    {pk: -qty for pk, qty in quantities.items()}, InventoryMovement.Reason.SALE, sale.pk
+                )
+            ])
+
+            SaleEvent.objects.bulk_create([
+                SaleEvent(
+                    sale_ref=sale.pk,
+                    event_type=SaleEvent.EventType.CREATED,
+                    payload={'before': None, 'after': snapshot_sale(sale, details)},
+                )
+                for _, sale, details, _ in pending
+            ])
+
+            # bulk_create no dispara post_save: se invalida la caché a mano.
+            namespaces = {'sales', 'catalog'}
+            namespaces.update(f'customer:{sale.customer_id}' for _, sale, _, _ in pending if sale.customer_id)
+            if any(touches_history(sale.sale_date) for _, sale, _, _ in pending):
+                # Tickets offline de días anteriores: cambian reportes ya cerrados.
+                namespaces.add(REPORT_HISTORY_NAMESPACE)
+            transaction.on_commit(lambda: TwoTierCache().bump(*namespaces))
+
+            for i, sale, _, _ in pending:
+                results[i] = self._result(chunk[i], CREATED, sale_id=sale.pk)
+
+        seen_keys.update(sale.idempotency_key for _, sale, _, _ in pending)
+        return results
+
+    def _consume_shards(self, quantities):
+        """Descuenta de los shards en un savepoint: si falta stock no queda nada a medias."""
+        if not quantities:
+            return
+        service = StockShardService()
+        with transaction.atomic():
+            for pk in sorted(quantities):
+                service.consume(pk, quantities[pk])
+
+    def _build_sale(self, data, key, products, available, valid_refs):
+        """Arma Sale + SaleDetail sin tocar la BD. ValueError = venta rechazada."""
+        lines = data.get('details') or []
+        if not lines:
+            raise ValueError('La venta no tiene productos')
+
+        ids = {field: _as_id(data.get(field)) for field in valid_refs}
+        for field, pk in ids.items():
+            if pk is not None and pk not in valid_refs[field]:
+                label = Sale._meta.get_field(field).verbose_name
+                raise ValueError(f"{label} {data.get(field)} no existe")
+
+        try:
+            sale = Sale(
+                customer_id=ids['customer'],
+                seller_id=ids['seller'],
+                payment_id=ids['payment'],
+                sale_date=_parse_sale_date(data.get('sale_date')),
+                subtotal=Decimal(str(data.get('subtotal', '0'))),
+                iva=Decimal(str(data.get('iva', '0'))),
+                discount=Decimal(str(data.get('discount', '0'))),
+                total=Decimal(str(data.get('total', '0'))),
+                idempotency_key=key,
+            )
+            details = []
+            quantities = {}
+            for line in lines:
+                product = products.get(_as_id(line.get('product')))
+                if product is None:
+                    raise ValueError(f"El producto {line.get('product')} no existe")
+                quantity = int(line.get('quantity', 1))
+                if quantity <= 0:
+                    raise ValueError(f"Cantidad inválida para '{product.name}'")
+                quantities[product.pk] = quantities.get(product.pk, 0) + quantity
+                details.append(SaleDetail(
+                    product=product,
+                    quantity=quantity,
+                    price=Decimal(str(line.get('price', '0'))),
+                    subtotal=Decimal(str(line.get('subtotal', '0'))),
+                ))
+        except (TypeError, InvalidOperation):
+            raise ValueError('Datos inválidos en la venta')
+
+        for pk, quantity in quantities.items():
+            if available[pk] < quantity:
+                product = products[pk]
+                raise ValueError(
+                    f"Stock insuficiente para '{product.name}'. "
+                    f"Disponible: {available[pk]}, solicitado: {quantity}"
+                )
+        return sale, details, quantities
+
+    def _result(self, data, status, sale_id=None, error=None):
+        result = {'idempotency_key': data.get('idempotency_key'), 'status': status, 'sale_id': sale_id}
+        if error:
+            result['error'] = error
+        return result
+
+
+def _as_id(value):
+    """pk enviado por el terminal (int o string) → int, o None si no es válido."""
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_sale_date(value):
+    """Fecha ISO del ticket; sin fecha se toma la hora actual."""
+    if not value:
+        return timezone.now()
+    try:
+        parsed = parse_datetime(str(value))
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        raise ValueError(f'Fecha de venta inválida: {value}')
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
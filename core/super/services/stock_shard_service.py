@@ -0,0 +1,143 @@
+"""
+Stock repartido en shards para productos "calientes" (promociones).
+
+Un producto con stock_shards = N guarda su stock en N filas de StockShard.
+Cada venta descuenta de UN shard con capacidad y bloquea solo esa fila,
+así que hasta N checkouts del mismo producto avanzan en paralelo en vez de
+hacer cola sobre la fila de Product.
+
+Product.stock sigue existiendo como total: lo mantiene reconcile() (comando
+reconcile_stock_shards, vía cron) y es lo que leen available(), el
+catálogo y los reportes. Entre reconciliaciones puede quedar unos segundos
+atrasado; la verdad para vender son los shards.
+"""
+
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+from core.super.models import Product, StockShard
+
+
+class StockShardService:
+    """Activa / desactiva el modo sharded y mueve stock entre shards."""
+
+    # ── Activación ───────────────────────────────────────────────────────
+
+    @transaction.atomic
+    def enable(self, product, shards):
+        """Reparte el stock actual del producto en `shards` filas (las primeras reciben el resto)."""
+        if shards < 1:
+            raise ValueError('La cantidad de shards debe ser al menos 1')
+        product = Product.objects.select_for_update().get(pk=product.pk)
+        total = self._current_total(product)
+
+        StockShard.objects.filter(product=product).delete()
+        base, remainder = divmod(total, shards)
+        StockShard.objects.bulk_create([
+            StockShard(product=product, shard_index=i, stock=base + (1 if i < remainder else 0))
+            for i in range(shards)
+        ])
+        Product.objects.filter(pk=product.pk).update(stock_shards=shards, stock=total)
+        return product
+
+    @transaction.atomic
+    def disable(self, product):
+        """Vuelve a stock normal: el total de los shards pasa a Product.stock."""
+        product = Product.objects.select_for_update().get(pk=product.pk)
+        total = self._current_total(product)
+        StockShard.objects.filter(product=product).delete()
+        Product.objects.filter(pk=product.pk).update(stock_shards=0, stock=total)
+        return product
+
+    def _current_total(self, product):
+        if not product.stock_shards:
+            return product.stock or 0
+        # Bloquea todos los shards: nadie vende mientras se redistribuye.
+        shards = StockShard.objects.select_for_update().filter(product=product).order_by('shard_index')
+        return sum(shard.stock for shard in shards)
+
+    # ── Movimientos ──────────────────────────────────────────────────────
+
+    def consume(self, product_id, quantity):
+        """
+        Descuenta `quantity` del producto. Debe llamarse dentro de una transacción.
+
+        Camino rápido: toma un shard libre (SKIP LOCKED) que alcance solo
+        y lo descuenta — no espera a ninguna otra venta. Si ninguno libre
+        alcanza, bloquea TODOS los shards en orden de índice (mismo orden
+        para todos → sin deadlocks) y reparte el descuento entre ellos.
+        """
+        shard = (
+            StockShard.objects
+            .select_for_update(skip_locked=True)
+            .filter(product_id=product_id, stock__gte=quantity)
+            .order_by('?')
+            .first()
+        )
+        if shard is not None:
+            StockShard.objects.filter(pk=shard.pk).update(stock=F('stock') - quantity)
+            return
+
+        shards = list(StockShard.objects.select_for_update().filter(product_id=product_id).order_by('shard_index'))
+        available = sum(shard.stock for shard in shards)
+        if available < quantity:
+            name = Product.objects.filter(pk=product_id).values_list('name', flat=True).first()
+            raise ValueError(
+                f"Stock insuficiente para '{name}'. "
+                f"Disponible: {available}, solicitado: {quantity}"
+            )
+        remaining = quantity
+        for shard in shards:
+            take = min(shard.stock, remaining)
+            if take:
+                StockShard.objects.filter(pk=shard.pk).update(stock=F('stock') - take)
+                remaining -= take
+            if not remaining:
+                break
+
+    def restore(self, product_id, quantity):
+        """Devuelve stock (edición / eliminación de ventas) a un shard libre, o al 0 si todos están ocupados."""
+        shard = (
+            StockShard.objects
+            .select_for_update(skip_locked=True)
+            .filter(product_id=product_id)
+            .order_by('stock')
+            .first()
+        )
+        target = StockShard.objects.filter(pk=shard.pk) if shard else StockShard.objects.filter(
+            product_id=product_id, shard_index=0
+        )
+        target.update(stock=F('stock') + quantity)
+
+    # ── Totales ──────────────────────────────────────────────────────────
+
+    def totals(self, product_ids) -> dict:
+        """{product_id: stock total de sus shards} en una sola consulta."""
+        return dict(
+            StockShard.objects
+            .filter(product_id__in=product_ids)
+            .values('product_id')
+            .annotate(total=Sum('stock'))
+            .values_list('product_id', 'total')
+        )
+
+    def reconcile(self, product_ids=None) -> int:
+        """
+        Copia la suma de los shards a Product.stock con un solo UPDATE,
+        sin bloquear los shards.
+        """
+        products = Product.objects.filter(stock_shards__gt=0)
+        if product_ids is not None:
+            products = products.filter(pk__in=product_ids)
+        total = Coalesce(
+            Subquery(
+                StockShard.objects
+                .filter(product=OuterRef('pk'))
+                .values('product')
+                .annotate(total=Sum('stock'))
+                .values('total')
+            ),
+            0,
+        )
+        return products.update(stock=total)
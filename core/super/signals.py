@@ -0,0 +1,109 @@
+"""
+Invalidación de la caché de dos niveles (services/cache_service.py).
+
+Cada cambio en un modelo incrementa la versión de los namespaces que
+dependen de él. La invalidación se difiere al COMMIT: si se hiciera
+dentro de la transacción, otro worker podría volver a cachear el dato
+viejo entre el bump y el commit.
+"""
+
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+
+from core.super.models import Product, Category, Brand, Sale, Customer, Seller, PaymentMethod, Cart, CartItem
+from core.super.services.cache_service import TwoTierCache
+from core.super.services.cart_count_service import cart_namespace
+from core.super.services.chat_context import user_namespace
+from core.super.services.report_cache_service import REPORT_HISTORY_NAMESPACE, touches_history
+
+
+def _bump_on_commit(*namespaces):
+    transaction.on_commit(lambda: TwoTierCache().bump(*namespaces))
+
+
+def _invalidate_catalog(sender, **kwargs):
+    _bump_on_commit('catalog')
+
+
+def _invalidate_sale(sender, instance, created=False, **kwargs):
+    # Toda venta mueve stock con UPDATE ... F('stock'), que no dispara
+    # post_save de Product — por eso una venta también invalida "catalog".
+    namespaces = ['sales', 'catalog']
+    if instance.customer_id:
+        namespaces.append(f'customer:{instance.customer_id}')
+    if instance.user_id:
+        namespaces.append(user_namespace(instance.user_id))
+    # Los reportes de períodos cerrados solo cambian si se edita o elimina
+    # una venta (puede venir de cualquier fecha) o se carga una con fecha pasada.
+    if not created or touches_history(instance.sale_date):
+        namespaces.append(REPORT_HISTORY_NAMESPACE)
+    _bump_on_commit(*namespaces)
+
+
+def _invalidate_customer(sender, instance, **kwargs):
+    _bump_on_commit(f'customer:{instance.pk}', 'autocomplete:customers')
+
+
+def _invalidate_autocomplete(sender, **kwargs):
+    kind = 'sellers' if sender is Seller else 'payments'
+    _bump_on_commit(f'autocomplete:{kind}')
+
+
+class _CartBump:
+    """
+    Callback de on_commit que junta los usuarios cuyo carrito cambió en la
+    transacción. Un checkout o un borrado en cascada borra muchas líneas:
+    así cuesta una consulta por carrito distinto y un bump por commit, no
+    una consulta por línea.
+    """
+
+    def __init__(self):
+        self.cart_ids = set()
+        self.user_ids = set()
+        self.fired = False
+
+    def add(self, cart_id):
+        if cart_id in self.cart_ids:
+            return
+        self.cart_ids.add(cart_id)
+        # En un borrado en cascada el carrito todavía existe cuando se
+        # borran sus líneas; si ya no está, no hay badge que mostrar.
+        user_id = Cart.objects.filter(pk=cart_id).values_list('user_id', flat=True).first()
+        if user_id is not None:
+            self.user_ids.add(user_id)
+
+    def __call__(self):
+        self.fired = True
+        if self.user_ids:
+            TwoTierCache().bump(*(cart_namespace(user_id) for user_id in self.user_ids))
+
+
+def _invalidate_cart(sender, instance, **kwargs):
+    connection = transaction.get_connection()
+    # Solo se reutiliza un callback que todavía no corrió (captureOnCommitCallbacks
+    # ejecuta los callbacks sin sacarlos de la lista).
+    pending = next(
+        (func for _, func, _ in connection.run_on_commit if isinstance(func, _CartBump) and not func.fired),
+        None,
+    )
+    if pending is not None:
+        pending.add(instance.cart_id)
+        return
+    pending = _CartBump()
+    pending.add(instance.cart_id)
+    transaction.on_commit(pending)
+
+
+for _model in (Product, Category, Brand):
+    post_save.connect(_invalidate_catalog, sender=_model, dispatch_uid=f'cache_catalog_{_model.__name__}_save')
+    post_delete.connect(_invalidate_catalog, sender=_model, dispatch_uid=f'cache_catalog_{_model.__name__}_delete')
+
+post_save.connect(_invalidate_sale, sender=Sale, dispatch_uid='cache_sale_save')
+post_delete.connect(_invalidate_sale, sender=Sale, dispatch_uid='cache_sale_delete')
+post_save.connect(_invalidate_customer, sender=Customer, dispatch_uid='cache_customer_save')
+post_delete.connect(_invalidate_customer, sender=Customer, dispatch_uid='cache_customer_delete')
+for _model in (Seller, PaymentMethod):
+    post_save.connect(_invalidate_autocomplete, sender=_model, dispatch_uid=f'cache_autocomplete_{_model.__name__}_save')
+    post_delete.connect(_invalidate_autocomplete, sender=_model, dispatch_uid=f'cache_autocomplete_{_model.__name__}_delete')
+post_save.connect(_invalidate_cart, sender=CartItem, dispatch_uid='cache_cartitem_save')
+post_delete.connect(_invalidate_cart, sender=CartItem, dispatch_uid='cache_cartitem_delete')
@@ -1,9 +1,46 @@
 from decimal import Decimal
+import datetime
+import csv
+import gzip
+import io
+import shutil
+import tempfile
+import threading
 import uuid
-from django.test import TestCase
+from unittest import mock, skipUnless
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import DatabaseError, connection, transaction
+from django.test import TestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from openpyxl import load_workbook
+from core.super.context_processors import cart_count_processor
+from core.super.services import checkout_service
+from core.super.services.cart_count_service import CartCountService
+from core.super.services.cache_service import TwoTierCache, LRUCache, cached
+from core.super.services.chat_context import SalesContextBuilder, get_admin_quick_summary, get_customer_quick_summary, user_namespace
+from core.super.services.checkout_service import CheckoutService
 from core.super.services.payment_processors import get_processor, CashPaymentProcessor, CardPaymentProcessor, TransferPaymentProcessor
 from core.super.services.idempotency_service import IdempotencyService
-from core.super.models import Sale, Customer, Seller, PaymentMethod
+from core.super.services.sale_event_service import SaleEventService, SaleEventConsumer, SALE_EVENT_CONSUMERS, snapshot_sale
+from core.super.services.market_basket_service import MarketBasketService
+from core.super.services.repurchase_service import RepurchasePredictionService
+from core.super.services.rfm_service import RFMSegmentationService, quintile_breaks, quintile_score
+from core.super.services.sale_sync_service import SaleSyncService
+from core.super.services.stock_shard_service import StockShardService
+from core.super.services.inventory_service import InventoryService
+from core.super.services.report_service import SalesReport
+from core.super.services.report_engine import ReportEngine
+from core.super.services.report_comparison_service import PeriodComparison, comparison_periods, delta
+from core.super.services.autocomplete_service import autocomplete, AUTOCOMPLETE_LIMIT
+from core.super.services.report_cache_service import ReportCache, REPORT_HISTORY_NAMESPACE, touches_history
+from core.super.services.rollup_service import SalesRollupService
+from core.super.services.sale_filter import SaleFilter
+from core.super.services.report_job_service import ReportJobService
+from core.super.services.csv_export_service import SalesCsvExporter
+from core.super.models import Sale, SaleDetail, Customer, Seller, PaymentMethod, Product, Cart, CartItem, IdempotencyKey, SaleEvent, CustomerInsight, StockShard, InventoryMovement, InventorySnapshot, Category, DailyPaymentRollup, ReportExportJob, ProductAffinity, ProductBasketCount, ProductPairCount, MarketBasketState, RepurchasePattern, RFMScoreState, ReportComputeLock
 
 
 class PaymentProcessorTestCase(TestCase):
@@ -56,3 +93,1691 @@ class IdempotencyServiceTestCase(TestCase):
         missing = IdempotencyService().find_existing(uuid.uuid4())
         self.assertIsNone(missing)
 
+
+    def test_reserve_is_single_flight(self):
+        key = uuid.uuid4()
+        service = IdempotencyService()
+        self.assertTrue(service.reserve(key))
+        self.assertFalse(service.reserve(key))
+
+        sale = Sale.objects.create(total=Decimal('5.00'), idempotency_key=key)
+        service.attach_sale(key, sale)
+        self.assertEqual(service.wait_for_sale(key, timeout=0).pk, sale.pk)
+
+    def test_release_frees_unattached_reservation(self):
+        key = uuid.uuid4()
+        service = IdempotencyService()
+        service.reserve(key)
+        service.release(key)
+        self.assertIsNone(service.wait_for_sale(key, timeout=0))
+        self.assertTrue(service.reserve(key))
+
+    def test_expired_reservations_are_reclaimed_and_purged(self):
+        key = uuid.uuid4()
+        service = IdempotencyService()
+        service.reserve(key)
+        IdempotencyKey.objects.filter(key=key).update(expires_at=timezone.now() - datetime.timedelta(minutes=1))
+        self.assertTrue(service.reserve(key))
+
+        IdempotencyKey.objects.update(expires_at=timezone.now() - datetime.timedelta(minutes=1))
+        self.assertEqual(service.purge_expired(), 1)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+class CheckoutServiceTestCase(TestCase):
+    def setUp(self):
+        checkout_service.clear_sentinel_cache()
+        self.user = get_user_model().objects.create_user(username='buyer', email='buyer@example.com', password='x')
+        self.payment = PaymentMethod.objects.create(name='Efectivo')
+        self.service = CheckoutService()
+
+    def _fill_cart(self, size):
+        cart = Cart.objects.create(user=self.user)
+        for i in range(size):
+            product = Product.objects.create(name=f'P{size}-{i}', price=Decimal('2.00'), stock=10)
+            CartItem.objects.create(cart=cart, product=product, quantity=2)
+        return cart
+
+    def _checkout(self, cart, totals=None):
+        customer = self.service.resolve_customer(self.user, 'final', '')
+        totals = totals or self.service.calculate_totals(cart, customer, payment_name='Efectivo', dni_type='final')
+        sale = self.service.create_sale(
+            self.user, customer, self.payment.pk, totals,
+            totals['total'], Decimal('0.00'), uuid.uuid4(),
+        )
+        self.service.register_items(sale, CartItem.objects.filter(cart=cart).select_related('product'))
+        return sale
+
+    def test_register_items_decrements_stock_and_creates_details(self):
+        cart = self._fill_cart(3)
+        sale = self._checkout(cart)
+
+        self.assertEqual(SaleDetail.objects.filter(sale=sale).count(), 3)
+        self.assertFalse(CartItem.objects.filter(cart=cart).exists())
+        self.assertEqual(
+            list(Product.objects.filter(saledetail__sale=sale).values_list('stock', flat=True)),
+            [8, 8, 8],
+        )
+
+    def test_query_count_does_not_grow_with_basket_size(self):
+        # Calentar la caché de centinelas para que ambas corridas partan igual.
+        self._checkout(self._fill_cart(1))
+
+        counts = []
+        for size in (1, 30):
+            cart = self._fill_cart(size)
+            totals = self.service.calculate_totals(cart, None, payment_name='Efectivo', dni_type='final')
+            with CaptureQueriesContext(connection) as ctx:
+                self._checkout(cart, totals)
+            counts.append(len(ctx.captured_queries))
+
+        self.assertEqual(counts[0], counts[1])
+
+    def test_insufficient_stock_keeps_error_message(self):
+        cart = self._fill_cart(1)
+        item = CartItem.objects.get(cart=cart)
+        item.quantity = 50
+        item.save()
+
+        with self.assertRaisesMessage(ValueError, "Stock insuficiente para 'P1-0'. Disponible: 10, solicitado: 50"):
+            self._checkout(cart)
+
+    def test_insufficient_stock_reports_aggregated_quantity(self):
+        product = Product.objects.create(name='Arroz', price=Decimal('2.00'), stock=10)
+        other = get_user_model().objects.create_user(username='other', email='other@example.com', password='x')
+        for user in (self.user, other):
+            CartItem.objects.create(cart=Cart.objects.create(user=user), product=product, quantity=6)
+        sale = Sale.objects.create(total=Decimal('0.00'))
+
+        with self.assertRaisesMessage(ValueError, "Disponible: 10, solicitado: 12"):
+            self.service.register_items(sale, CartItem.objects.filter(product=product))
+
+    def test_sentinel_not_cached_when_checkout_rolls_back(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with self.assertRaises(ValueError):
+                with transaction.atomic():
+                    self.service.resolve_customer(self.user, 'final', '')
+                    raise ValueError('sin stock')
+        self.assertEqual(checkout_service._sentinel_ids, {})
+        self.assertFalse(Customer.objects.filter(dni=checkout_service.SENTINEL_DNI).exists())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            customer = self.service.resolve_customer(self.user, 'final', '')
+        self.assertEqual(checkout_service._sentinel_ids[Customer], customer.pk)
+        self.assertTrue(Customer.objects.filter(pk=customer.pk).exists())
+
+    def test_sentinel_seller_resolved_once(self):
+        self._checkout(self._fill_cart(1))
+        self._checkout(self._fill_cart(1))
+        self.assertEqual(Seller.objects.filter(dni=checkout_service.SENTINEL_DNI).count(), 1)
+        self.assertEqual(Sale.objects.values('seller_id').distinct().count(), 1)
+
+
+class CartSummaryTestCase(TestCase):
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='cart', email='cart@example.com', password='x')
+        self.cart = Cart.objects.create(user=self.user)
+
+    def test_summary_aggregates_in_one_query(self):
+        fresh = Product.objects.create(name='Leche', price=Decimal('1.15'), stock=10)
+        expired = Product.objects.create(
+            name='Yogur', price=Decimal('2.30'), stock=10,
+            expiration_date=datetime.date(2000, 1, 1),
+        )
+        CartItem.objects.create(cart=self.cart, product=fresh, quantity=2)
+        CartItem.objects.create(cart=self.cart, product=expired, quantity=1)
+
+        with self.assertNumQueries(1):
+            summary = self.cart.get_summary()
+            self.cart.get_total()
+            self.cart.get_iva()
+
+        self.assertEqual(summary.total, Decimal('4.60'))
+        self.assertEqual(summary.subtotal, Decimal('4.00'))
+        self.assertEqual(summary.iva, Decimal('0.60'))
+        self.assertEqual(summary.line_count, 2)
+        self.assertTrue(summary.has_expired)
+
+    def test_empty_cart_summary(self):
+        summary = self.cart.get_summary()
+        self.assertTrue(summary.is_empty)
+        self.assertEqual(summary.total, Decimal('0.00'))
+
+    def test_calculate_totals_reuses_memoized_summary(self):
+        product = Product.objects.create(name='Pan', price=Decimal('1.00'), stock=10)
+        CartItem.objects.create(cart=self.cart, product=product, quantity=3)
+        self.cart.get_summary()
+
+        with self.assertNumQueries(0):
+            totals = CheckoutService().calculate_totals(self.cart, None, payment_name='Efectivo', dni_type='final')
+        self.assertEqual(totals['total'], Decimal('3.00'))
+
+
+class CartCountServiceTestCase(TestCase):
+    def setUp(self):
+        TwoTierCache().clear()
+        self.user = get_user_model().objects.create_user(username='badge', email='badge@example.com', password='x')
+        self.product = Product.objects.create(name='Arroz', price=Decimal('1.00'), stock=10)
+        self.request = RequestFactory().get('/')
+        self.request.user = self.user
+
+    def test_processor_reads_cache_without_queries(self):
+        CartCountService().refresh(self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(cart_count_processor(self.request), {'cart_count': 0})
+
+    def test_cart_views_keep_counter_in_sync(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('super:add_to_cart', args=[self.product.pk]), secure=True)
+        self.assertEqual(response.json()['cart_count'], 1)
+        self.assertEqual(cart_count_processor(self.request)['cart_count'], 1)
+
+        item = CartItem.objects.get(cart__user=self.user)
+        self.client.get(reverse('super:remove_from_cart', args=[item.pk]), secure=True)
+        self.assertEqual(cart_count_processor(self.request)['cart_count'], 0)
+
+    def test_cascade_delete_invalidates_the_shared_count(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            CartItem.objects.create(cart=Cart.objects.create(user=self.user), product=self.product, quantity=1)
+        self.assertEqual(CartCountService().refresh(self.user), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.delete()
+        # Otro worker: mismo L2, L1 propio (vacío).
+        TwoTierCache()._l1.clear()
+        self.assertEqual(cart_count_processor(self.request)['cart_count'], 0)
+
+
+class TwoTierCacheTestCase(TestCase):
+    def setUp(self):
+        self.cache = TwoTierCache()
+        self.cache.clear()
+        self.cache.reset_stats()
+
+    def test_lru_evicts_oldest_entry(self):
+        lru = LRUCache(max_entries=2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        self.assertEqual(lru.get('a'), 1)
+        self.assertIsNone(lru.get('b', None))
+        self.assertEqual(len(lru), 2)
+
+    def test_hits_are_counted_per_tier(self):
+        self.cache.set('catalog', 'k', 'v')
+        self.assertEqual(self.cache.get('catalog', 'k'), 'v')
+        self.cache._l1.clear()
+        self.assertEqual(self.cache.get('catalog', 'k'), 'v')
+        self.assertIsNone(self.cache.get('catalog', 'missing'))
+
+        stats = self.cache.stats()
+        self.assertEqual((stats['l1_hits'], stats['l2_hits'], stats['misses']), (1, 1, 1))
+
+    def test_model_signal_bumps_namespace(self):
+        calls = []
+
+        @cached('catalog')
+        def product_names():
+            calls.append(1)
+            return list(Product.objects.values_list('name', flat=True))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name='Azúcar', price=Decimal('1.00'), stock=5)
+        self.assertEqual(product_names(), ['Azúcar'])
+        self.assertEqual(product_names(), ['Azúcar'])
+        self.assertEqual(len(calls), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.create(name='Sal', price=Decimal('1.00'), stock=5)
+        self.assertEqual(product_names(), ['Azúcar', 'Sal'])
+        self.assertEqual(len(calls), 2)
+
+    def test_culled_version_counter_does_not_revive_stale_entries(self):
+        self.cache.set('catalog', 'k', 'viejo')
+        self.cache.bump('catalog')
+        stale_version = self.cache.version('catalog')
+        # El cull del L2 descarta el contador; el L1 tampoco lo recuerda.
+        self.cache.l2.delete(self.cache._version_key('catalog'))
+        self.cache._l1.clear()
+
+        self.assertGreater(self.cache.version('catalog'), stale_version)
+        self.assertIsNone(self.cache.get('catalog', 'k'))
+
+    def test_unkeyable_argument_raises(self):
+        @cached('catalog')
+        def echo(value):
+            return value
+
+        with self.assertRaises(TypeError):
+            echo(object())
+
+    def test_method_self_is_not_part_of_key(self):
+        calls = []
+
+        class Builder:
+            @cached('catalog')
+            def build(self):
+                calls.append(1)
+                return 'contexto'
+
+        self.assertEqual(Builder().build(), 'contexto')
+        self.assertEqual(Builder().build(), 'contexto')
+        self.assertEqual(len(calls), 1)
+
+    def test_chat_summary_errors_are_not_cached(self):
+        with mock.patch.object(Sale.objects, 'filter', side_effect=DatabaseError('caída')):
+            self.assertEqual(get_admin_quick_summary(), {})
+            self.assertIn('Error al cargar', SalesContextBuilder().build())
+        self.assertEqual(get_admin_quick_summary()['count_24h'], 0)
+        self.assertIn('RESUMEN DE VENTAS', SalesContextBuilder().build())
+
+    def test_customer_summary_is_invalidated_per_user(self):
+        buyer = get_user_model().objects.create_user(username='buyer', email='buyer@example.com', password='x')
+        other = get_user_model().objects.create_user(username='other', email='other@example.com', password='x')
+        self.assertEqual(get_customer_quick_summary(buyer)['order_count'], 0)
+        self.assertEqual(get_customer_quick_summary(other)['order_count'], 0)
+        other_version = self.cache.version(user_namespace(other.pk))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Sale.objects.create(user=buyer, total=Decimal('5.00'))
+        self.assertEqual(get_customer_quick_summary(buyer)['order_count'], 1)
+        self.assertEqual(self.cache.version(user_namespace(other.pk)), other_version)
+
+
+@override_settings(SECURE_SSL_REDIRECT=False)
+class CheckoutViewIdempotencyTestCase(TestCase):
+    def setUp(self):
+        checkout_service.clear_sentinel_cache()
+        self.user = get_user_model().objects.create_user(username='double', email='double@example.com', password='x')
+        self.client.force_login(self.user)
+        self.payment = PaymentMethod.objects.create(name='Efectivo')
+        self.product = Product.objects.create(name='Café', price=Decimal('3.00'), stock=10)
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=2)
+
+    def _post(self, key):
+        return self.client.post(reverse('super:checkout'), {
+            'idempotency_key': str(key),
+            'dni_type': 'final',
+            'payment_method': self.payment.pk,
+            'amount_received': '10.00',
+        })
+
+    def test_duplicate_post_redirects_to_first_sale(self):
+        key = uuid.uuid4()
+        first = self._post(key)
+        sale = Sale.objects.get(idempotency_key=key)
+        self.assertRedirects(first, reverse('super:order_detail', args=[sale.pk]), fetch_redirect_response=False)
+
+        second = self._post(key)
+        self.assertRedirects(second, reverse('super:order_detail', args=[sale.pk]), fetch_redirect_response=False)
+        self.assertEqual(Sale.objects.count(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 8)
+
+    def test_failed_checkout_rolls_back_and_releases_key(self):
+        key = uuid.uuid4()
+        Product.objects.filter(pk=self.product.pk).update(stock=1)
+        self._post(key)
+        self.assertFalse(Sale.objects.exists())
+        self.assertFalse(SaleEvent.objects.exists())
+        self.assertFalse(IdempotencyKey.objects.filter(key=key).exists())
+
+    def test_admin_sale_with_malformed_body_returns_json_error(self):
+        admin = get_user_model().objects.create_superuser(username='cashier', email='cashier@example.com', password='x')
+        self.client.force_login(admin)
+        url = reverse('super:sale_create')
+        for body in ('null', '[]', '"venta"'):
+            response = self.client.post(url, body, content_type='application/json')
+            self.assertEqual(response.status_code, 400, body)
+            self.assertFalse(response.json()['success'], body)
+        # Una clave null o no textual se trata como ausente.
+        for key in (None, 5):
+            response = self.client.post(url, {'idempotency_key': key, 'details': []}, content_type='application/json')
+            self.assertNotEqual(response.status_code, 500, key)
+            self.assertIn('success', response.json())
+
+
+class _FailingConsumer(SaleEventConsumer):
+    name = 'failing'
+
+    def handle(self, events):
+        if any(event.sale_ref == self.poison for event in events):
+            raise RuntimeError('boom')
+
+
+class SaleEventOutboxTestCase(TestCase):
+    def setUp(self):
+        checkout_service.clear_sentinel_cache()
+        self.admin = get_user_model().objects.create_superuser(username='boss', email='boss@example.com', password='x')
+        self.payment = PaymentMethod.objects.create(name='Efectivo')
+        self.product = Product.objects.create(name='Pan', price=Decimal('1.50'), stock=10)
+        self.service = CheckoutService()
+
+    def _checkout(self, quantity=2):
+        cart = Cart.objects.create(user=self.admin)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=quantity)
+        customer = self.service.resolve_customer(self.admin, 'final', '')
+        totals = self.service.calculate_totals(cart, customer, payment_name='Efectivo', dni_type='final')
+        sale = self.service.create_sale(
+            self.admin, customer, self.payment.pk, totals,
+            totals['total'], Decimal('0.00'), uuid.uuid4(),
+        )
+        self.service.register_items(sale, CartItem.objects.filter(cart=cart).select_related('product'))
+        return sale
+
+    def test_checkout_records_created_event_with_lines(self):
+        sale = self._checkout()
+        event = SaleEvent.objects.get()
+        self.assertEqual(event.sale_ref, sale.pk)
+        self.assertEqual(event.event_type, SaleEvent.EventType.CREATED)
+        self.assertIsNone(event.payload['before'])
+        self.assertEqual(event.payload['after']['lines'], [[self.product.pk, 2, '3.00']])
+
+    def test_process_batch_updates_insight_and_marks_processed(self):
+        sale = self._checkout()
+        self.assertEqual(SaleEventService().process_batch(), 1)
+
+        insight = CustomerInsight.objects.get(customer_id=sale.customer_id)
+        self.assertEqual(insight.frequency_30d, 1)
+        self.assertFalse(SaleEvent.objects.filter(processed_at__isnull=True).exists())
+        self.assertEqual(SaleEventService().process_batch(), 0)
+
+    def test_failing_event_is_isolated_and_retried(self):
+        poisoned = self._checkout(1)
+        self._checkout(1)
+        consumer = _FailingConsumer()
+        consumer.poison = poisoned.pk
+
+        # Se intentan los dos; solo el envenenado suma un intento.
+        self.assertEqual(SaleEventService().process_batch(consumers=[consumer]), 2)
+        pending = SaleEvent.objects.get(attempts=1)
+        self.assertEqual(pending.sale_ref, poisoned.pk)
+        self.assertIn('failing: RuntimeError: boom', pending.last_error)
+        self.assertEqual(pending.consumed_by, '')
+        self.assertEqual(SaleEvent.objects.exclude(pk=pending.pk).get().consumed_by, ',failing,')
+
+    def test_subset_of_consumers_leaves_events_pending_for_the_rest(self):
+        sale = self._checkout()
+        service = SaleEventService()
+        only = [SALE_EVENT_CONSUMERS['customer_insight']()]
+        self.assertEqual(service.process_batch(consumers=only), 1)
+        # Ya aplicado por ese consumidor: no se vuelve a reclamar para él.
+        self.assertEqual(service.process_batch(consumers=only), 0)
+        event = SaleEvent.objects.get()
+        self.assertIsNone(event.processed_at)
+        self.assertEqual(event.consumed_by, ',customer_insight,')
+
+        self.assertEqual(service.process_batch(), 1)
+        event.refresh_from_db()
+        self.assertIsNotNone(event.processed_at)
+        self.assertEqual(DailyPaymentRollup.objects.get(payment=self.payment).sale_count, 1)
+        self.assertEqual(CustomerInsight.objects.get(customer_id=sale.customer_id).frequency_30d, 1)
+
+    def test_delete_view_restores_stock_and_records_event(self):
+        sale = self._checkout(3)
+        self.client.force_login(self.admin)
+
+        self.client.post(reverse('super:sale_delete', args=[sale.pk]))
+
+        self.assertFalse(Sale.objects.filter(pk=sale.pk).exists())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 10)
+        event = SaleEvent.objects.get(event_type=SaleEvent.EventType.DELETED)
+        self.assertEqual(event.sale_ref, sale.pk)
+        self.assertEqual(event.payload['before']['lines'][0][:2], [self.product.pk, 3])
+
+
+class SaleSyncTestCase(TestCase):
+    def setUp(self):
+        self.admin = get_user_model().objects.create_superuser(username='pos', email='pos@example.com', password='x')
+        self.payment = PaymentMethod.objects.create(name='Efectivo')
+        self.milk = Product.objects.create(name='Leche', price=Decimal('1.00'), stock=5)
+        self.rice = Product.objects.create(name='Arroz', price=Decimal('2.00'), stock=100)
+
+    def _ticket(self, product, quantity, key=None):
+        return {
+            'idempotency_key': str(key or uuid.uuid4()),
+            'payment': self.payment.pk,
+            'sale_date': '2026-01-15T10:30:00',
+            'total': str(product.price * quantity),
+            'details': [{'product': product.pk, 'quantity': quantity,
+                         'price': str(product.price), 'subtotal': str(product.price * quantity)}],
+        }
+
+    def test_endpoint_returns_result_per_sale(self):
+        existing_key = uuid.uuid4()
+        Sale.objects.create(idempotency_key=existing_key)
+        repeated = self._ticket(self.rice, 1)
+        sales = [
+            self._ticket(self.milk, 3),
+            self._ticket(self.milk, 3),          # ya no alcanza el stock
+            repeated,
+            repeated,                            # repetida en el mismo envío
+            self._ticket(self.rice, 1, existing_key),
+            self._ticket(self.rice, 1, 'no-es-uuid'),
+        ]
+        self.client.force_login(self.admin)
+
+        response = self.client.post(reverse('super:sale_sync'), {'sales': sales}, content_type='application/json')
+
+        body = response.json()
+        self.assertEqual(
+            [result['status'] for result in body['results']],
+            ['created', 'error', 'created', 'duplicate', 'duplicate', 'error'],
+        )
+        self.assertIn("Stock insuficiente para 'Leche'", body['results'][1]['error'])
+        self.assertEqual(body['summary'], {'created': 2, 'duplicate': 2, 'error': 2})
+        self.milk.refresh_from_db()
+        self.rice.refresh_from_db()
+        self.assertEqual((self.milk.stock, self.rice.stock), (2, 99))
+        self.assertEqual(SaleEvent.objects.count(), 2)
+
+    def test_replaying_the_same_batch_creates_nothing(self):
+        sales = [self._ticket(self.rice, 2) for _ in range(5)]
+        SaleSyncService().sync(sales, chunk_size=2)
+        results = SaleSyncService().sync(sales, chunk_size=2)
+
+        self.assertEqual({result['status'] for result in results}, {'duplicate'})
+        self.assertEqual(Sale.objects.count(), 5)
+        self.rice.refresh_from_db()
+        self.assertEqual(self.rice.stock, 90)
+
+    def test_sharded_product_drained_concurrently_rejects_only_that_sale(self):
+        StockShardService().enable(self.milk, 2)
+        # Un checkout concurrente vació los shards después de leer los totales.
+        with mock.patch.object(StockShardService, 'totals', return_value={self.milk.pk: 5}):
+            StockShard.objects.filter(product=self.milk).update(stock=1)
+            results = SaleSyncService().sync([self._ticket(self.milk, 1), self._ticket(self.milk, 3), self._ticket(self.rice, 1)])
+
+        self.assertEqual([result['status'] for result in results], ['created', 'error', 'created'])
+        self.assertIn("Stock insuficiente para 'Leche'", results[1]['error'])
+        self.assertEqual(StockShardService().totals([self.milk.pk]), {self.milk.pk: 1})
+        self.assertEqual(Sale.objects.count(), 2)
+
+    def test_query_count_per_chunk_does_not_grow_with_sales(self):
+        counts = []
+        for size in (1, 40):
+            sales = [self._ticket(self.rice, 1) for _ in range(size)]
+            with CaptureQueriesContext(connection) as ctx:
+                SaleSyncService().sync(sales)
+            counts.append(len(ctx.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+class SaleUpdateDeltaTestCase(TestCase):
+    def setUp(self):
+        self.admin = get_user_model().objects.create_superuser(username='editor', email='editor@example.com', password='x')
+        self.client.force_login(self.admin)
+        self.payment = PaymentMethod.objects.create(name='Efectivo')
+
+    def _sale(self, size, quantity=2):
+        sale = Sale.objects.create(payment=self.payment)
+        products = []
+        for i in range(size):
+            product = Product.objects.create(name=f'E{size}-{i}', price=Decimal('1.00'), stock=10)
+            SaleDetail.objects.create(sale=sale, product=product, quantity=quantity,
+                                      price=Decimal('1.00'), subtotal=Decimal(quantity))
+            products.append(product)
+        return sale, products
+
+    def _post(self, sale, lines):
+        payload = {
+            'payment': self.payment.pk, 'sale_date': '2026-01-15T10:30:00', 'total': '0',
+            'details': [{'product': p.pk, 'quantity': q, 'price': '1.00', 'subtotal': str(q)} for p, q in lines],
+        }
+        return self.client.post(reverse('super:sale_update', args=[sale.pk]), payload, content_type='application/json')
+
+    def test_applies_only_the_net_delta(self):
+        sale, (kept, changed, removed) = self._sale(3)
+        added = Product.objects.create(name='Nuevo', price=Decimal('1.00'), stock=10)
+
+        response = self._post(sale, [(kept, 2), (changed, 5), (added, 4)])
+
+        self.assertEqual(response.status_code, 200)
+        stocks = dict(Product.objects.values_list('name', 'stock'))
+        self.assertEqual(stocks, {'E3-0': 10, 'E3-1': 7, 'E3-2': 12, 'Nuevo': 6})
+        self.assertEqual(
+            dict(SaleDetail.objects.filter(sale=sale).values_list('product_id', 'quantity')),
+            {kept.pk: 2, changed.pk: 5, added.pk: 4},
+        )
+        event = SaleEvent.objects.get(event_type=SaleEvent.EventType.UPDATED)
+        self.assertEqual(len(event.payload['before']['lines']), 3)
+        self.assertEqual(len(event.payload['after']['lines']), 3)
+
+    def test_insufficient_stock_rolls_back_everything(self):
+        sale, (first, second) = self._sale(2)
+
+        response = self._post(sale, [(first, 1), (second, 50)])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("Stock insuficiente para 'E2-1'", response.json()['error'])
+        self.assertEqual(set(Product.objects.values_list('stock', flat=True)), {10})
+        self.assertEqual(set(SaleDetail.objects.filter(sale=sale).values_list('quantity', flat=True)), {2})
+        self.assertFalse(SaleEvent.objects.exists())
+
+    def test_returned_stock_reactivates_sold_out_products(self):
+        sale, (product,) = self._sale(1)
+        Product.objects.filter(pk=product.pk).update(stock=0, state=False)
+
+        self.assertEqual(self._post(sale, [(product, 1)]).status_code, 200)
+        product.refresh_from_db()
+        self.assertEqual((product.stock, product.state), (1, True))
+
+    def test_query_count_does_not_grow_with_ticket_size(self):
+        counts = []
+        for size in (1, 25):
+            sale, products = self._sale(size)
+            lines = [(p, 3) for p in products]
+            with CaptureQueriesContext(connection) as ctx:
+                self._post(sale, lines)
+            counts.append(len(ctx.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+
+
+class StockShardTestCase(TestCase):
+    def setUp(self):
+        checkout_service.clear_sentinel_cache()
+        self.product = Product.objects.create(name='Promo', price=Decimal('1.00'), stock=10)
+        self.service = StockShardService()
+        self.service.enable(self.product, 4)
+
+    def _shards(self):
+        return list(StockShard.objects.filter(product=self.product).values_list('stock', flat=True))
+
+    def test_enable_splits_stock_and_disable_merges_it_back(self):
+        self.assertEqual(self._shards(), [3, 3, 2, 2])
+        self.service.disable(self.product)
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock_shards, self.product.stock), (0, 10))
+        self.assertFalse(StockShard.objects.exists())
+
+    def test_consume_spills_across_shards_and_never_goes_negative(self):
+        with transaction.atomic():
+            checkout_service.decrement_stock({self.product.pk: 7})
+        self.assertEqual(sum(self._shards()), 3)
+        self.assertTrue(all(stock >= 0 for stock in self._shards()))
+
+        with self.assertRaisesMessage(ValueError, "Stock insuficiente para 'Promo'. Disponible: 3, solicitado: 4"):
+            with transaction.atomic():
+                checkout_service.decrement_stock({self.product.pk: 4})
+        self.assertEqual(sum(self._shards()), 3)
+
+    def test_checkout_uses_shards_and_reconcile_updates_total(self):
+        user = get_user_model().objects.create_user(username='promo', email='promo@example.com', password='x')
+        payment = PaymentMethod.objects.create(name='Efectivo')
+        cart = Cart.objects.create(user=user)
+        CartItem.objects.create(cart=cart, product=self.product, quantity=2)
+        service = CheckoutService()
+        customer = service.resolve_customer(user, 'final', '')
+        totals = service.calculate_totals(cart, customer, payment_name='Efectivo', dni_type='final')
+        sale = service.create_sale(user, customer, payment.pk, totals, totals['total'], Decimal('0'), uuid.uuid4())
+
+        with transaction.atomic():
+            service.register_items(sale, CartItem.objects.filter(cart=cart).select_related('product'))
+
+        self.assertEqual(sum(self._shards()), 8)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 10)  # total todavía sin reconciliar
+        self.assertEqual(self.service.reconcile(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 8)
+
+    def test_manual_stock_edit_goes_through_shards(self):
+        with transaction.atomic():
+            checkout_service.decrement_stock({self.product.pk: 2})
+        product = Product.objects.get(pk=self.product.pk)
+        product.stock = 14  # el formulario muestra 10 (sin reconciliar): +4
+        product.save()
+        self.assertEqual(sum(self._shards()), 12)
+
+        self.service.reconcile()
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 12)
+
+        product.stock = 5
+        product.save()
+        self.service.reconcile()
+        product.refresh_from_db()
+        self.assertEqual((product.stock, sum(self._shards())), (5, 5))
+        self.assertEqual(
+            list(InventoryMovement.objects.filter(reason='adjustment').values_list('delta', flat=True)),
+            [4, -7],
+        )
+
+    def test_negative_delta_restores_into_a_shard(self):
+        with transaction.atomic():
+            checkout_service.decrement_stock({self.product.pk: -5})
+        self.assertEqual(sum(self._shards()), 15)
+
+
+class InventoryLedgerTestCase(TestCase):
+    def setUp(self):
+        checkout_service.clear_sentinel_cache()
+        self.product = Product.objects.create(name='Aceite', price=Decimal('4.00'), stock=10)
+        self.service = InventoryService()
+
+    def _move(self, delta, when):
+        with transaction.atomic():
+            checkout_service.decrement_stock({self.product.pk: -delta}, sale_ref=99)
+        InventoryMovement.objects.filter(pk=InventoryMovement.objects.latest('id').pk).update(created_at=when)
+
+    def test_stock_changes_write_the_ledger(self):
+        product = Product.objects.get(pk=self.product.pk)
+        product.stock = 15
+        product.save()
+        with transaction.atomic():
+            checkout_service.decrement_stock({product.pk: 3}, sale_ref=7)
+
+        self.assertEqual(
+            list(InventoryMovement.objects.values_list('delta', 'reason', 'sale_ref')),
+            [(10, 'initial', None), (5, 'adjustment', None), (-3, 'sale', 7)],
+        )
+        self.assertEqual(list(self.service.discrepancies()), [])
+
+    def test_manual_edit_applies_on_top_of_concurrent_sales(self):
+        product = Product.objects.get(pk=self.product.pk)
+        # Otra venta descuenta mientras el formulario está abierto.
+        with transaction.atomic():
+            checkout_service.decrement_stock({product.pk: 3}, sale_ref=7)
+        product.stock = 15
+        product.save()
+
+        product.refresh_from_db()
+        self.assertEqual(product.stock, 12)
+        self.assertEqual(InventoryMovement.objects.latest('id').delta, 5)
+        self.assertEqual(list(self.service.discrepancies()), [])
+
+        # Después de refresh_from_db el ajuste se mide contra lo recién leído.
+        with transaction.atomic():
+            checkout_service.decrement_stock({product.pk: 2}, sale_ref=8)
+        product.refresh_from_db()
+        product.stock = 20
+        product.save()
+        self.assertEqual(InventoryMovement.objects.latest('id').delta, 10)
+        self.assertEqual(list(self.service.discrepancies()), [])
+
+    def test_as_of_reads_snapshot_plus_later_movements(self):
+        now = timezone.now()
+        day = datetime.timedelta(days=1)
+        InventoryMovement.objects.update(created_at=now - 10 * day)
+        self._move(-4, now - 8 * day)      # 6
+        self._move(5, now - 6 * day)       # 11
+
+        self.assertEqual(self.service.take_snapshots(), 1)
+        InventorySnapshot.objects.update(taken_at=now - 5 * day)
+        self._move(-1, now - 2 * day)      # 10
+
+        self.assertEqual(self.service.as_of(self.product.pk, now - 9 * day), 10)
+        self.assertEqual(self.service.as_of(self.product.pk, now - 7 * day), 6)
+        self.assertEqual(self.service.as_of(self.product.pk, now - 3 * day), 11)
+        self.assertEqual(self.service.as_of(self.product.pk, now), 10)
+        # Después de la foto solo se suman los movimientos posteriores a ella.
+        with CaptureQueriesContext(connection) as ctx:
+            self.service.as_of(self.product.pk, now)
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+    def test_discrepancies_detect_untracked_updates(self):
+        Product.objects.filter(pk=self.product.pk).update(stock=7)
+        self.assertEqual(list(self.service.discrepancies()), [(self.product.pk, 'Aceite', 10, 7)])
+
+    def test_save_without_stock_change_keeps_concurrent_sales(self):
+        product = Product.objects.get(pk=self.product.pk)
+        with transaction.atomic():
+            checkout_service.decrement_stock({product.pk: 3}, sale_ref=7)
+        product.name = 'Aceite de oliva'
+        with CaptureQueriesContext(connection) as ctx:
+            product.save()
+        self.assertFalse(any('SAVEPOINT' in q['sql'] or 'FOR UPDATE' in q['sql'] for q in ctx.captured_queries))
+
+        product.refresh_from_db()
+        self.assertEqual((product.name, product.stock), ('Aceite de oliva', 7))
+        self.assertEqual(list(self.service.discrepancies()), [])
+
+    def test_migration_seeds_initial_balance_for_products_without_ledger(self):
+        from importlib import import_module
+        from django.apps import apps
+        seed = import_module('core.super.migrations.0024_seed_initial_inventory').seed_initial_balances
+
+        legacy = Product.objects.create(name='Harina', price=Decimal('2.00'), stock=0)
+        Product.objects.filter(pk=legacy.pk).update(stock=8)
+        Product.objects.filter(pk=self.product.pk).update(stock=13)
+        seed(apps, None)
+
+        self.assertEqual(list(self.service.discrepancies()), [])
+        self.assertEqual(self.service.as_of(legacy.pk, timezone.now()), 8)
+        self.assertEqual(
+            list(InventoryMovement.objects.filter(product=legacy).values_list('delta', 'reason')), [(8, 'initial')],
+        )
+
+    def test_as_of_view_rejects_out_of_range_dates(self):
+        admin = get_user_model().objects.create_superuser(username='stock', email='stock@example.com', password='x')
+        self.client.force_login(admin)
+        url = reverse('super:product_stock_as_of', args=[self.product.pk])
+        for raw in ('2026-13-45', '2026-02-30T10:00', 'ayer'):
+            response = self.client.get(url, {'at': raw}, secure=True)
+            self.assertEqual(response.status_code, 400, raw)
+        response = self.client.get(url, {'at': timezone.localdate().isoformat()}, secure=True)
+        self.assertEqual(response.json()['stock'], 10, response.json())
+
+
+class SalesRollupTestCase(TestCase):
+    def setUp(self):
+        self.today = timezone.localdate()
+        self.cash = PaymentMethod.objects.create(name='Efectivo')
+        self.card = PaymentMethod.objects.create(name='Tarjeta')
+        self.seller = Seller.objects.create(name='Ana', last_name='Paz', dni='0901')
+        self.customer = Customer.objects.create(name='Luis', last_name='Mora', dni='0902')
+        dairy = Category.objects.create(name='Lácteos')
+        self.milk = Product.objects.create(name='Leche', price=Decimal('1.00'), stock=100, category=dairy)
+        self.bread = Product.objects.create(name='Pan', price=Decimal('0.50'), stock=100)
+        self._sale(self.cash, 2, self.milk, 3, Decimal('3.00'))
+        self._sale(self.card, 1, self.bread, 4, Decimal('2.00'), seller=self.seller, customer=self.customer)
+        self._sale(self.card, 0, self.milk, 10, Decimal('10.00'), customer=self.customer)
+
+    def _sale(self, payment, days_ago, product, quantity, total, seller=None, customer=None):
+        when = timezone.now() - datetime.timedelta(days=days_ago)
+        sale = Sale.objects.create(
+            payment=payment, seller=seller, customer=customer, sale_date=when,
+            subtotal=total, total=total, discount=Decimal('0.50'),
+        )
+        SaleDetail.objects.create(sale=sale, product=product, quantity=quantity, price=product.price, subtotal=total)
+        return sale
+
+    def _report(self, **filters):
+        return SalesReport(SaleFilter(self.today - datetime.timedelta(days=7), self.today, **filters))
+
+    def _sections(self, report):
+        return [
+            report.kpis(), report.daily(), report.by_payment(), report.top_sellers(5),
+            report.top_customers(5), report.top_products(15), report.categories(),
+        ]
+
+    def test_rollups_match_raw_tables(self):
+        for filters in ({}, {'payment': 'tarj'}, {'payment': self.cash.pk}, {'seller': self.seller.pk}, {'customer': self.customer.pk}):
+            raw = self._sections(self._report(**filters))
+            SalesRollupService().rebuild_range(self.today - datetime.timedelta(days=30))
+            report = self._report(**filters)
+            self.assertTrue(report.use_rollups)
+            self.assertEqual(self._sections(report), raw, filters)
+
+    def test_unfiltered_report_reads_only_rollups(self):
+        SalesRollupService().rebuild_range(self.today - datetime.timedelta(days=30))
+        with CaptureQueriesContext(connection) as ctx:
+            self._sections(self._report())
+        self.assertFalse(any('"super_sale"' in q['sql'] for q in ctx.captured_queries))
+
+    def test_amount_filter_and_uncovered_period_fall_back_to_raw(self):
+        self.assertFalse(self._report().use_rollups)
+        SalesRollupService().rebuild_range(self.today - datetime.timedelta(days=1))
+        self.assertFalse(self._report().use_rollups)
+        report = SalesReport(SaleFilter(self.today, self.today, min_total='5'))
+        self.assertFalse(report.use_rollups)
+        self.assertEqual(report.kpis()['count'], 1)
+
+    def test_day_rebuild_filters_by_datetime_range(self):
+        with CaptureQueriesContext(connection) as ctx:
+            SalesRollupService().rebuild_days([self.today, self.today - datetime.timedelta(days=1)])
+        reads = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('SELECT') and 'WHERE' in q['sql']]
+        self.assertTrue(reads)
+        for sql in reads:
+            where = sql.split('WHERE', 1)[1].split('GROUP BY')[0]
+            self.assertNotIn('cast_date', where)
+        self.assertEqual(DailyPaymentRollup.objects.filter(day__gte=self.today - datetime.timedelta(days=1)).count(), 2)
+
+    def test_pending_events_in_the_period_fall_back_to_raw_tables(self):
+        SalesRollupService().rebuild_range(self.today - datetime.timedelta(days=30))
+        old = self._sale(self.cash, 20, self.bread, 1, Decimal('0.50'))
+        SaleEventService().record(old, SaleEvent.EventType.CREATED)
+        # El evento pendiente es de hace 20 días: el reporte de la última semana sigue en rollups.
+        self.assertTrue(self._report().use_rollups)
+
+        sale = self._sale(self.cash, 0, self.bread, 1, Decimal('0.50'))
+        SaleEventService().record(sale, SaleEvent.EventType.CREATED)
+        report = self._report()
+        self.assertFalse(report.use_rollups)
+        self.assertEqual(report.kpis()['count'], 4)
+
+    def test_outbox_consumer_rebuilds_touched_days(self):
+        SalesRollupService().rebuild_range(self.today - datetime.timedelta(days=30))
+        sale = self._sale(self.cash, 0, self.bread, 1, Decimal('0.50'))
+        SaleEventService().record(sale, SaleEvent.EventType.CREATED)
+        SaleEventService().process_batch()
+
+        row = DailyPaymentRollup.objects.get(day=self.today, payment=self.cash)
+        self.assertEqual((row.sale_count, row.total), (1, Decimal('0.50')))
+        self.assertEqual(self._report().kpis()['count'], 4)
+
+
+@override_settings(TIME_ZONE='America/Guayaquil')
+class SaleFilterTestCase(TestCase):
+    def setUp(self):
+        self.cash = PaymentMethod.objects.create(name='Efectivo')
+        self.card = PaymentMethod.objects.create(name='Tarjeta de crédito')
+        self.day = datetime.date(2026, 3, 10)
+        tz = timezone.get_current_timezone()
+        # 23:30 hora local = 04:30 UTC del día siguiente: cuenta para el día local.
+        self.late = Sale.objects.create(payment=self.cash, sale_date=datetime.datetime(2026, 3, 10, 23, 30, tzinfo=tz))
+        self.next = Sale.objects.create(payment=self.card, sale_date=datetime.datetime(2026, 3, 11, 0, 0, tzinfo=tz))
+
+    def test_half_open_local_day_range(self):
+        sales = SaleFilter(self.day, self.day).apply()
+        self.assertEqual(list(sales), [self.late])
+        sql = str(sales.query).lower()
+        self.assertNotIn('django_datetime_cast_date', sql)
+        self.assertNotIn('::date', sql)
+
+    def test_payment_by_id_or_name_filters_on_the_column(self):
+        self.assertEqual(list(SaleFilter(payment=self.card.pk).apply()), [self.next])
+        by_name = SaleFilter(payment='tarjeta').apply()
+        self.assertEqual(list(by_name), [self.next])
+        self.assertNotIn('super_paymentmethod', str(by_name.query).lower())
+
+    def test_numeric_search_is_an_exact_id_lookup(self):
+        sales = SaleFilter(q=str(self.late.pk)).apply()
+        self.assertEqual(list(sales), [self.late])
+        self.assertNotIn('like', str(sales.query).lower())
+
+    def test_sale_list_view_uses_the_filter(self):
+        admin = get_user_model().objects.create_superuser(username='boss', email='boss@example.com', password='x')
+        self.client.force_login(admin)
+        response = self.client.get(reverse('super:sale_list'), {'date_from': '2026-03-11', 'payment': self.card.pk})
+        self.assertEqual(list(response.context['sales']), [self.next])
+
+    @skipUnless(connection.vendor == 'postgresql', 'El plan depende de las estadísticas de PostgreSQL')
+    def test_explain_uses_composite_indexes(self):
+        cases = [
+            (SaleFilter(self.day, self.day), 'sale_date_payment_idx'),
+            (SaleFilter(self.day, self.day, payment=self.cash.pk), 'sale_date_payment_idx'),
+            (SaleFilter(self.day, self.day, seller=1), 'sale_seller_date_idx'),
+            (SaleFilter(self.day, self.day, customer=1), 'sale_customer_date_idx'),
+        ]
+        with connection.cursor() as cursor:
+            # Con pocas filas el planner prefiere el seq scan: se lo
+            # desactiva para ver qué índice elige entre los disponibles.
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        for sale_filter, index in cases:
+            self.assertIn(index, sale_filter.apply().explain(), index)
+
+
+class ReportExportTestCase(TestCase):
+    def setUp(self):
+        TwoTierCache().clear()
+        self.admin = get_user_model().objects.create_superuser(username='boss', email='boss@example.com', password='x')
+        self.client.force_login(self.admin)
+        cash = PaymentMethod.objects.create(name='Efectivo')
+        customer = Customer.objects.create(name='Luis', last_name='Mora', dni='0903')
+        bread = Product.objects.create(name='Pan', price=Decimal('0.50'), stock=100)
+        for i in range(5):
+            sale = Sale.objects.create(payment=cash, customer=customer if i % 2 else None, total=Decimal('2.00'))
+            SaleDetail.objects.create(sale=sale, product=bread, quantity=4, price=bread.price, subtotal=Decimal('2.00'))
+
+    def test_export_streams_a_complete_workbook(self):
+        response = self.client.get(reverse('super:export_reports_excel'), {'all': '1'})
+
+        self.assertTrue(response.streaming)
+        self.assertIn('attachment; filename="reporte_ventas_20000101_', response['Content-Disposition'])
+        wb = load_workbook(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(wb.sheetnames, [
+            'Resumen Ejecutivo', 'Detalle de Ventas', 'Productos Más Vendidos', 'Por Categoría', 'Vendedores y Clientes',
+        ])
+        detail = wb['Detalle de Ventas']
+        self.assertEqual(detail.max_row, 2 + 5 + 1)
+        self.assertEqual(detail['C4'].value, 'Luis Mora')
+        self.assertEqual(detail['I8'].value, '=SUM(I3:I7)')
+        self.assertEqual(detail['I3'].number_format, '"$"#,##0.00')
+        self.assertEqual(wb['Resumen Ejecutivo']['C6'].value, '5')
+        self.assertEqual(wb['Productos Más Vendidos']['D3'].value, 20)
+
+    def test_reports_view_renders(self):
+        response = self.client.get(reverse('super:reports'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_sales'], 5)
+
+
+class ReportExportJobTestCase(TestCase):
+    def setUp(self):
+        self.media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media, ignore_errors=True)
+        storage = override_settings(
+            MEDIA_ROOT=self.media,
+            STORAGES={
+                'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+                'staticfiles': {'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'},
+            },
+        )
+        storage.enable()
+        self.addCleanup(storage.disable)
+
+        self.admin = get_user_model().objects.create_superuser(username='boss', email='boss@example.com', password='x')
+        self.client.force_login(self.admin)
+        cash = PaymentMethod.objects.create(name='Efectivo')
+        for _ in range(3):
+            Sale.objects.create(payment=cash, total=Decimal('2.00'))
+
+    def _enqueue(self, **params):
+        response = self.client.get(reverse('super:export_reports_excel'), {'async': '1', **params})
+        self.assertEqual(response.status_code, 202)
+        return response.json()
+
+    def test_same_filters_attach_to_the_running_job(self):
+        first = self._enqueue(all='1')
+        second = self._enqueue(all='1')
+        other = self._enqueue(date_from='2026-01-01', date_to='2026-01-31')
+
+        self.assertTrue(first['created'])
+        self.assertFalse(second['created'])
+        self.assertEqual(first['job']['id'], second['job']['id'])
+        self.assertNotEqual(first['job']['id'], other['job']['id'])
+        self.assertEqual(ReportExportJob.objects.count(), 2)
+
+    def test_worker_generates_file_and_page_can_download_it(self):
+        job_id = self._enqueue(all='1')['job']['id']
+        service = ReportJobService()
+        job = service.claim()
+        service.run(job)
+        self.assertIsNone(service.run_next())
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.progress), (ReportExportJob.Status.DONE, 100))
+        status = self.client.get(reverse('super:report_export_status', args=[job_id])).json()['job']
+        self.assertEqual(status['download_url'], reverse('super:report_export_download', args=[job_id]))
+
+        response = self.client.get(status['download_url'])
+        wb = load_workbook(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(wb['Detalle de Ventas'].max_row, 2 + 3 + 1)
+
+        # Terminado el trabajo, los mismos filtros encolan uno nuevo.
+        self.assertTrue(self._enqueue(all='1')['created'])
+
+    def test_only_jobs_with_a_stale_heartbeat_are_requeued(self):
+        self._enqueue(all='1')
+        self._enqueue(date_from='2026-01-01', date_to='2026-01-31')
+        service = ReportJobService()
+        alive, dead = service.claim(), service.claim()
+        long_ago = timezone.now() - datetime.timedelta(hours=2)
+        # Los dos arrancaron hace horas, pero solo `alive` sigue latiendo.
+        ReportExportJob.objects.update(started_at=long_ago)
+        ReportExportJob.objects.filter(pk=dead.pk).update(heartbeat_at=long_ago)
+
+        self.assertEqual(service.requeue_stale(), 1)
+        alive.refresh_from_db()
+        dead.refresh_from_db()
+        self.assertEqual(alive.status, ReportExportJob.Status.RUNNING)
+        self.assertEqual(dead.status, ReportExportJob.Status.PENDING)
+
+    def test_job_that_keeps_killing_the_worker_is_failed(self):
+        self._enqueue(all='1')
+        service = ReportJobService()
+        long_ago = timezone.now() - datetime.timedelta(hours=2)
+        for attempt in range(1, 4):
+            job = service.claim()
+            self.assertEqual(job.attempts, attempt)
+            ReportExportJob.objects.filter(pk=job.pk).update(heartbeat_at=long_ago)
+
+        self.assertEqual(service.requeue_stale(), 0)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ReportExportJob.Status.FAILED)
+        self.assertIsNone(service.claim())
+
+    def test_heartbeat_thread_stops_with_the_job(self):
+        self._enqueue(all='1')
+        service = ReportJobService()
+        service.run(service.claim())
+        self.assertFalse([t for t in threading.enumerate() if t.name.startswith('report-job-')])
+
+
+class SalesCsvExportTestCase(TestCase):
+    def setUp(self):
+        self.admin = get_user_model().objects.create_superuser(username='boss', email='boss@example.com', password='x')
+        self.client.force_login(self.admin)
+        self.cash = PaymentMethod.objects.create(name='Efectivo')
+        customer = Customer.objects.create(name='Luis', last_name='Mora', dni='0904')
+        bread = Product.objects.create(name='Pan', price=Decimal('0.50'), stock=100)
+        for i in range(7):
+            sale = Sale.objects.create(payment=self.cash, customer=customer, total=Decimal(i + 1))
+            SaleDetail.objects.create(sale=sale, product=bread, quantity=2, price=bread.price, subtotal=Decimal('1.00'))
+
+    def _rows(self, content):
+        return list(csv.reader(io.StringIO(gzip.decompress(content).decode('utf-8'))))
+
+    def test_endpoint_streams_gzipped_lines_with_report_filters(self):
+        response = self.client.get(reverse('super:export_sales_csv'), {'all': '1', 'kind': 'lines'})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        rows = self._rows(b''.join(response.streaming_content))
+        self.assertEqual(rows[0][:3], ['id_detalle', 'id_venta', 'fecha'])
+        self.assertEqual(len(rows), 1 + 7)
+        self.assertEqual(rows[1][4], 'Luis')
+        self.assertEqual(rows[1][11], 'Pan')
+
+        today = timezone.localdate().isoformat()
+        response = self.client.get(reverse('super:export_sales_csv'), {'date_from': today, 'min_total': '5'})
+        self.assertEqual(len(self._rows(b''.join(response.streaming_content))), 1 + 3)
+
+    def test_one_query_regardless_of_chunking(self):
+        exporter = SalesCsvExporter(SaleFilter(), chunk_size=2)
+        with CaptureQueriesContext(connection) as ctx:
+            content = b''.join(exporter.stream())
+        self.assertEqual(len(ctx.captured_queries), 1)
+        rows = self._rows(content)
+        self.assertEqual(len(rows), 1 + 7)
+        self.assertEqual(rows[1][9], 'Efectivo')
+
+
+class ReportCacheTestCase(TestCase):
+    def setUp(self):
+        TwoTierCache().clear()
+        self.cash = PaymentMethod.objects.create(name='Efectivo')
+        bread = Product.objects.create(name='Pan', price=Decimal('0.50'), stock=100)
+        for _ in range(3):
+            sale = Sale.objects.create(payment=self.cash, total=Decimal('2.00'))
+            SaleDetail.objects.create(sale=sale, product=bread, quantity=4, price=bread.price, subtotal=Decimal('2.00'))
+        self.today = timezone.localdate()
+
+    def _report(self, **kwargs):
+        return SalesReport(SaleFilter(date_from=self.today, date_to=self.today, **kwargs))
+
+    def test_second_lookup_is_a_hit_without_queries(self):
+        report_cache = ReportCache()
+        report_cache.reset_stats()
+        snapshot, meta = report_cache.get(self._report(payment=self.cash.pk))
+        self.assertEqual(meta['source'], 'miss')
+        self.assertEqual(snapshot.kpis['count'], 3)
+
+        report = self._report(payment=self.cash.pk)
+        with self.assertNumQueries(0):
+            cached_snapshot, meta = report_cache.get(report)
+        self.assertEqual(meta['source'], 'hit')
+        self.assertEqual(cached_snapshot, snapshot)
+        stats = report_cache.stats()
+        self.assertEqual((stats['hits'], stats['computes']), (1, 1))
+        self.assertEqual(stats['hit_ratio'], 0.5)
+
+    def test_key_is_normalized(self):
+        report_cache = ReportCache()
+        # Forma de pago por nombre o por id → misma entrada.
+        self.assertEqual(
+            report_cache.key(self._report(payment='efectivo')),
+            report_cache.key(self._report(payment=str(self.cash.pk))),
+        )
+        self.assertNotEqual(report_cache.key(self._report()), report_cache.key(self._report(seller='1')))
+
+    def test_concurrent_request_gets_stale_copy_while_recomputing(self):
+        report_cache = ReportCache()
+        report = self._report()
+        report_cache.get(report)
+        TwoTierCache().bump('sales')
+
+        key = report_cache.key(report)
+        self.assertTrue(report_cache.acquire(key))  # otro request está recalculando
+        # Solo el intento de tomar el lock (INSERT + limpieza de vencidos): nada de agregados.
+        with self.assertNumQueries(2):
+            snapshot, meta = report_cache.get(report)
+        self.assertEqual(meta['source'], 'stale')
+        self.assertEqual(snapshot.kpis['count'], 3)
+
+        report_cache.release(key)
+        self.assertEqual(report_cache.get(report)[1]['source'], 'miss')
+        self.assertFalse(ReportComputeLock.objects.exists())
+
+    def test_lock_is_exclusive_until_released_or_expired(self):
+        report_cache = ReportCache()
+        self.assertTrue(report_cache.acquire('k'))
+        self.assertFalse(report_cache.acquire('k'))
+        self.assertTrue(report_cache.acquire('otra'))
+
+        # El dueño murió sin liberarlo: vencido, el siguiente lo toma.
+        ReportComputeLock.objects.filter(key='k').update(expires_at=timezone.now() - datetime.timedelta(seconds=1))
+        self.assertTrue(report_cache.acquire('k'))
+        self.assertFalse(report_cache.acquire('k'))
+
+    def test_rollup_rebuild_invalidates_report_cached_before_it(self):
+        SalesRollupService().rebuild_range(self.today - datetime.timedelta(days=30))
+        report_cache = ReportCache()
+        self.assertEqual(report_cache.get(self._report())[0].kpis['count'], 3)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            sale = Sale.objects.create(payment=self.cash, total=Decimal('5.00'))
+            SaleEventService().record(sale, SaleEvent.EventType.CREATED)
+        # Entre el commit de la venta y el consumidor, el rollup todavía es
+        # el viejo: con el evento pendiente el reporte lee las tablas crudas.
+        self.assertFalse(self._report().use_rollups)
+        self.assertEqual(report_cache.get(self._report())[0].kpis['count'], 4)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            SaleEventService().process_batch()
+        # La reconstrucción del rollup vuelve a invalidar la entrada.
+        report = self._report()
+        self.assertTrue(report.use_rollups)
+        snapshot, meta = report_cache.get(report)
+        self.assertEqual((meta['source'], snapshot.kpis['count']), ('miss', 4))
+
+    def test_new_sale_today_keeps_history_cached(self):
+        report_cache = ReportCache()
+        yesterday = self.today - datetime.timedelta(days=1)
+        history = SalesReport(SaleFilter(date_from=yesterday - datetime.timedelta(days=6), date_to=yesterday))
+        live = self._report()
+        self.assertEqual(report_cache.policy(history)[0], REPORT_HISTORY_NAMESPACE)
+        self.assertEqual(report_cache.policy(live)[0], 'sales')
+        report_cache.get(history)
+        report_cache.get(live)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            Sale.objects.create(payment=self.cash, total=Decimal('1.00'))
+        self.assertEqual(report_cache.get(history)[1]['source'], 'hit')
+        snapshot, meta = report_cache.get(live)
+        self.assertEqual((meta['source'], snapshot.kpis['count']), ('miss', 4))
+
+        # Editar una venta (de cualquier fecha) sí invalida los períodos cerrados.
+        sale = Sale.objects.first()
+        with self.captureOnCommitCallbacks(execute=True):
+            sale.save()
+        self.assertEqual(report_cache.get(history)[1]['source'], 'miss')
+
+    def test_touches_history(self):
+        self.assertFalse(touches_history(timezone.now()))
+        self.assertTrue(touches_history(timezone.now() - datetime.timedelta(days=2)))
+        self.assertFalse(touches_history(None))
+
+
+class ReportEngineTestCase(TestCase):
+    def setUp(self):
+        cash = PaymentMethod.objects.create(name='Efectivo')
+        card = PaymentMethod.objects.create(name='Tarjeta')
+        seller = Seller.objects.create(name='Ana', last_name='Paz', dni='0905')
+        customer = Customer.objects.create(name='Luis', last_name='Mora', dni='0906')
+        bread = Product.objects.create(name='Pan', price=Decimal('0.50'), stock=100)
+        for i in range(6):
+            sale = Sale.objects.create(
+                payment=cash if i % 3 else card, seller=seller if i % 2 else None,
+                customer=customer if i < 4 else None, total=Decimal(i + 1),
+            )
+            SaleDetail.objects.create(sale=sale, product=bread, quantity=2, price=bread.price, subtotal=Decimal('1.00'))
+        today = timezone.localdate()
+        self.report = SalesReport(SaleFilter(today, today))
+
+    def test_runs_sections_on_the_pool(self):
+        results = ReportEngine(parallel=True).run({
+            'a': lambda: threading.current_thread().name,
+            'b': lambda: threading.current_thread().name,
+        })
+        self.assertTrue(all(name.startswith('report') for name in results.values()))
+
+    def test_serial_inside_a_transaction(self):
+        # TestCase envuelve cada test en atomic: otras conexiones no verían los datos.
+        self.assertFalse(ReportEngine().can_parallelize())
+
+    def test_collect_matches_individual_sections(self):
+        payload = self.report.collect(top_products=15, top_categories=10, top_sellers=5, top_customers=5)
+        self.assertEqual(payload['kpis'], self.report.kpis())
+        self.assertEqual(payload['by_payment'], self.report.by_payment())
+        self.assertEqual(payload['top_sellers'], self.report.top_sellers(5))
+
+    def test_benchmark_seed_removes_everything_it_created(self):
+        from core.super.management.commands.benchmark_reports import Command
+        Sale.objects.all().delete()
+        Product.objects.all().delete()
+        PaymentMethod.objects.all().delete()
+
+        # El comando mide en paralelo (otras conexiones): aquí solo se siembra y se limpia.
+        command, created = Command(stdout=io.StringIO()), []
+        command._seed(30, 7, created)
+        self.assertEqual(Sale.objects.count(), 30)
+        command._cleanup(created)
+
+        self.assertFalse(Sale.objects.exists())
+        self.assertFalse(Product.objects.exists())
+        self.assertFalse(PaymentMethod.objects.exists())
+
+    @skipUnless(connection.vendor == 'postgresql', 'GROUPING SETS: solo PostgreSQL')
+    def test_grouping_sets_match_per_dimension_queries(self):
+        breakdowns = self.report.breakdowns(5, 5)
+        key = lambda rows: sorted(rows, key=lambda row: (row['total'], str(row)))
+        self.assertEqual(key(breakdowns['by_payment']), key(self.report.by_payment()))
+        self.assertEqual(key(breakdowns['top_sellers']), key(self.report.top_sellers(5)))
+        self.assertEqual(key(breakdowns['top_customers']), key(self.report.top_customers(5)))
+
+
+class AutocompleteTestCase(TestCase):
+    def setUp(self):
+        TwoTierCache().clear()
+        self.admin = get_user_model().objects.create_superuser(username='boss', email='boss@example.com', password='x')
+        self.client.force_login(self.admin)
+        self.luis = Customer.objects.create(name='Luis', last_name='Mora', dni='0911')
+        Customer.objects.create(name='Lucía', last_name='Andrade', dni='0912')
+        Customer.objects.create(name='Ana', last_name='Luna', dni='1713')
+        Customer.objects.bulk_create(
+            Customer(name=f'Zoe {i:02d}', last_name='Vera', dni=f'2{i:03d}') for i in range(AUTOCOMPLETE_LIMIT + 5)
+        )
+
+    def _texts(self, kind, q, page=1):
+        return [row['text'] for row in autocomplete(kind, q, page)['results']]
+
+    def test_prefix_matches_name_last_name_and_dni(self):
+        self.assertEqual(self._texts('customers', 'LU'), ['Ana Luna · 1713', 'Lucía Andrade · 0912', 'Luis Mora · 0911'])
+        self.assertEqual(self._texts('customers', '091'), ['Lucía Andrade · 0912', 'Luis Mora · 0911'])
+        self.assertEqual(self._texts('customers', 'luis mo'), ['Luis Mora · 0911'])
+        self.assertEqual(self._texts('customers', 'uis'), [])
+
+    def test_results_are_paginated(self):
+        first = autocomplete('customers', 'zoe')
+        self.assertEqual(len(first['results']), AUTOCOMPLETE_LIMIT)
+        self.assertTrue(first['more'])
+        second = autocomplete('customers', 'zoe', 2)
+        self.assertEqual(len(second['results']), 5)
+        self.assertFalse(second['more'])
+
+    def test_endpoint_is_cached_and_invalidated(self):
+        url = reverse('super:autocomplete', args=['customers'])
+        self.assertEqual(len(self.client.get(url, {'q': 'lu'}).json()['results']), 3)
+        with self.assertNumQueries(2):  # sesión + usuario, ninguna sobre clientes
+            self.client.get(url, {'q': 'lu'})
+        with self.captureOnCommitCallbacks(execute=True):
+            Customer.objects.create(name='Lupe', last_name='Ríos', dni='0914')
+        self.assertEqual(len(self.client.get(url, {'q': 'lu'}).json()['results']), 4)
+        self.assertEqual(self.client.get(reverse('super:autocomplete', args=['nope'])).status_code, 404)
+
+    def test_filter_pages_only_load_the_selected_rows(self):
+        response = self.client.get(reverse('super:sale_list'), {'customer': self.luis.pk})
+        self.assertEqual(response.context['sel_customer_label'], 'Luis Mora · 0911')
+        self.assertNotIn('customers', response.context)
+        response = self.client.get(reverse('super:reports'), {'customer': self.luis.pk})
+        self.assertContains(response, 'value="Luis Mora · 0911"')
+
+
+class ReportSnapshotTestCase(TestCase):
+    def setUp(self):
+        TwoTierCache().clear()
+        self.admin = get_user_model().objects.create_superuser(username='boss', email='boss@example.com', password='x')
+        self.client.force_login(self.admin)
+        cash = PaymentMethod.objects.create(name='Efectivo')
+        bread = Product.objects.create(name='Pan', price=Decimal('0.50'), stock=100)
+        for i in range(3):
+            sale = Sale.objects.create(payment=cash, total=Decimal('2.50'))
+            SaleDetail.objects.create(sale=sale, product=bread, quantity=5, price=bread.price, subtotal=Decimal('2.50'))
+
+    def test_export_after_page_view_reuses_the_snapshot(self):
+        self.client.get(reverse('super:reports'))
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('super:export_reports_excel'))
+            b''.join(response.streaming_content)
+        # Solo la hoja de detalle lee ventas; ningún agregado se recalcula.
+        aggregates = [q['sql'] for q in ctx.captured_queries if 'SUM(' in q['sql'].upper()]
+        self.assertEqual(aggregates, [])
+
+    def test_json_api_serializes_the_snapshot(self):
+        data = self.client.get(reverse('super:reports_api')).json()
+        report = data['report']
+        self.assertEqual(report['version'], 1)
+        self.assertEqual(report['kpis']['count'], 3)
+        self.assertEqual(Decimal(report['kpis']['revenue']), Decimal('7.50'))
+        self.assertEqual(report['kpis']['avg_ticket'], '2.50')
+        self.assertEqual(report['top_products'][0]['qty'], 15)
+        self.assertEqual(report['date_to'], timezone.localdate().isoformat())
+        self.assertEqual(data['cache']['source'], 'miss')
+        self.assertEqual(self.client.get(reverse('super:reports_api')).json()['cache']['source'], 'hit')
+
+
+class PeriodComparisonTestCase(TestCase):
+    def setUp(self):
+        TwoTierCache().clear()
+        self.admin = get_user_model().objects.create_superuser(username='boss', email='boss@example.com', password='x')
+        self.client.force_login(self.admin)
+        cash = PaymentMethod.objects.create(name='Efectivo')
+        self.ana = Seller.objects.create(name='Ana', last_name='Paz', dni='0921')
+        bread = Product.objects.create(name='Pan', price=Decimal('1.00'), stock=100)
+        self.today = timezone.localdate()
+
+        def sale(days_ago, total):
+            moment = timezone.now() - datetime.timedelta(days=days_ago)
+            sale = Sale.objects.create(payment=cash, seller=self.ana, total=Decimal(total), sale_date=moment)
+            SaleDetail.objects.create(sale=sale, product=bread, quantity=1, price=bread.price, subtotal=Decimal(total))
+
+        sale(0, '30.00')
+        sale(1, '10.00')
+        sale(3, '20.00')  # período anterior de un rango de 3 días
+        sale(365, '40.00')  # mismo día del año pasado
+
+    def _comparison(self):
+        return PeriodComparison(SalesReport(SaleFilter(self.today - datetime.timedelta(days=2), self.today))).compute()
+
+    def test_periods(self):
+        periods = comparison_periods(datetime.date(2024, 2, 27), datetime.date(2024, 2, 29))
+        self.assertEqual(periods['previous'], (datetime.date(2024, 2, 24), datetime.date(2024, 2, 26)))
+        self.assertEqual(periods['yoy'], (datetime.date(2023, 2, 27), datetime.date(2023, 2, 28)))
+        self.assertIsNone(delta(Decimal('5'), 0))
+        self.assertEqual(delta(Decimal('30'), Decimal('20')), 50.0)
+
+    def test_cached_comparison_follows_rollup_rebuild(self):
+        SalesRollupService().rebuild_range(self.today - datetime.timedelta(days=400))
+        comparison = PeriodComparison(SalesReport(SaleFilter(self.today - datetime.timedelta(days=2), self.today)))
+        self.assertEqual(comparison.get()['kpis']['revenue']['previous'], Decimal('20'))
+
+        # Se edita una venta del período anterior; el consumidor todavía no corrió.
+        sale = Sale.objects.get(total=Decimal('20.00'))
+        before = snapshot_sale(sale)
+        with self.captureOnCommitCallbacks(execute=True):
+            sale.total = Decimal('50.00')
+            sale.save()
+            SaleDetail.objects.filter(sale=sale).update(subtotal=Decimal('50.00'))
+            SaleEventService().record(sale, SaleEvent.EventType.UPDATED, before=before)
+        # Evento pendiente: el período anterior se lee de las tablas crudas.
+        self.assertEqual(comparison.get()['kpis']['revenue']['previous'], Decimal('50'))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            SaleEventService().process_batch()
+        self.assertEqual(comparison.get()['kpis']['revenue']['previous'], Decimal('50'))
+        self.assertTrue(comparison._report_for('previous').use_rollups)
+
+    def test_kpis_daily_and_entity_deltas(self):
+        comparison = self._comparison()
+        revenue = comparison['kpis']['revenue']
+        self.assertEqual((revenue['current'], revenue['previous'], revenue['yoy']), (Decimal('40'), Decimal('20'), Decimal('40')))
+        self.assertEqual((revenue['previous_delta'], revenue['yoy_delta']), (100.0, 0.0))
+        self.assertEqual(comparison['kpis']['count']['previous_delta'], 100.0)  # 2 ventas contra 1
+
+        self.assertEqual(len(comparison['daily']), 3)
+        self.assertEqual(comparison['daily'][-1]['day'], self.today)
+        self.assertEqual(comparison['daily'][-1]['current'], Decimal('30'))
+        self.assertEqual(comparison['daily'][-1]['yoy'], Decimal('40'))
+
+        seller = comparison['sellers'][0]
+        self.assertEqual((seller['label'], seller['previous_delta']), ('Ana Paz', 100.0))
+        self.assertEqual(comparison['products'][0]['label'], 'Pan')
+
+    def test_page_and_json_endpoint(self):
+        response = self.client.get(reverse('super:reports'))
+        self.assertContains(response, 'Comparación de períodos')
+        data = self.client.get(reverse('super:reports_comparison_api'), {
+            'date_from': (self.today - datetime.timedelta(days=2)).isoformat(), 'date_to': self.today.isoformat(),
+        }).json()
+        self.assertEqual(data['comparison']['kpis']['revenue']['previous_delta'], 100.0)
+        self.assertEqual(data['comparison']['periods']['yoy']['date_to'], comparison_periods(self.today, self.today)['yoy'][1].isoformat())
+
+
+class MarketBasketIncrementalTestCase(TestCase):
+    def setUp(self):
+        self.milk = Product.objects.create(name='Leche', price=Decimal('1.00'), stock=100)
+        self.bread = Product.objects.create(name='Pan', price=Decimal('0.50'), stock=100)
+        self.rice = Product.objects.create(name='Arroz', price=Decimal('2.00'), stock=100)
+        self.soap = Product.objects.create(name='Jabón', price=Decimal('1.50'), stock=100)
+        self.sales = [self._sale(self.milk, self.bread) for _ in range(3)]
+        self.sales.append(self._sale(self.milk, self.bread, self.rice))
+        self._sale(self.soap)
+
+    def _sale(self, *products):
+        sale = Sale.objects.create(total=Decimal('5.00'))
+        for product in products:
+            SaleDetail.objects.create(sale=sale, product=product, quantity=1, price=product.price, subtotal=product.price)
+        SaleEventService().record(sale, SaleEvent.EventType.CREATED)
+        return sale
+
+    def _affinities(self):
+        return set(ProductAffinity.objects.values_list('product_a_id', 'product_b_id', 'co_occurrence_count'))
+
+    def _assert_matches_full_rebuild(self):
+        service = MarketBasketService()
+        self.assertEqual(service.verify(), {'products': 0, 'pairs': 0})
+        incremental = self._affinities()
+        service.recalculate_all()
+        self.assertEqual(self._affinities(), incremental)
+
+    def test_created_events_update_counts_and_affinities(self):
+        SaleEventService().process_batch()
+
+        self.assertEqual(ProductBasketCount.objects.get(product=self.milk).basket_count, 4)
+        self.assertFalse(ProductBasketCount.objects.filter(product=self.soap).exists())
+        low, high = sorted((self.milk.pk, self.bread.pk))
+        self.assertEqual(ProductPairCount.objects.get(product_low_id=low, product_high_id=high).co_occurrence_count, 4)
+        self.assertIn((self.milk.pk, self.bread.pk, 4), self._affinities())
+        self._assert_matches_full_rebuild()
+
+    def test_edit_and_delete_subtract_previous_basket(self):
+        SaleEventService().process_batch()
+
+        edited = self.sales[0]
+        before = snapshot_sale(edited)
+        SaleDetail.objects.filter(sale=edited, product=self.bread).update(product=self.rice)
+        SaleEventService().record(edited, SaleEvent.EventType.UPDATED, before=before)
+        deleted = self.sales[1]
+        before = snapshot_sale(deleted)
+        SaleEventService().record(deleted, SaleEvent.EventType.DELETED, before=before)
+        deleted.delete()
+        SaleEventService().process_batch()
+
+        low, high = sorted((self.milk.pk, self.bread.pk))
+        self.assertEqual(ProductPairCount.objects.get(product_low_id=low, product_high_id=high).co_occurrence_count, 2)
+        # Con 2 co-ocurrencias ya no llega al mínimo: la sugerencia desaparece.
+        self.assertNotIn(self.bread.pk, ProductAffinity.objects.filter(product_a=self.milk).values_list('product_b_id', flat=True))
+        self._assert_matches_full_rebuild()
+
+    def test_rebuild_with_pending_events_does_not_double_count(self):
+        # Las ventas de setUp siguen con su evento pendiente.
+        MarketBasketService().recalculate_all()
+        self.assertEqual(ProductBasketCount.objects.get(product=self.milk).basket_count, 4)
+
+        SaleEventService().process_batch()
+        self.assertEqual(ProductBasketCount.objects.get(product=self.milk).basket_count, 4)
+        self.assertEqual(MarketBasketService().verify(), {'products': 0, 'pairs': 0})
+
+        # Los eventos posteriores a la reconstrucción sí se aplican.
+        self._sale(self.milk, self.rice)
+        SaleEventService().process_batch()
+        self.assertEqual(ProductBasketCount.objects.get(product=self.milk).basket_count, 5)
+        self.assertEqual(MarketBasketService().verify(), {'products': 0, 'pairs': 0})
+
+    def test_only_touched_products_are_refreshed(self):
+        SaleEventService().process_batch()
+        untouched = ProductAffinity.objects.get(product_a=self.bread, product_b=self.milk)
+
+        touched = MarketBasketService().apply_changes(added=[(timezone.now(), [self.rice.pk, self.soap.pk])])
+
+        self.assertEqual(touched, {self.rice.pk, self.soap.pk})
+        self.assertTrue(ProductAffinity.objects.filter(pk=untouched.pk).exists())
+
+    def test_unchanged_edit_is_a_no_op(self):
+        when = timezone.now()
+        with CaptureQueriesContext(connection) as ctx:
+            touched = MarketBasketService().apply_changes(
+                removed=[(when, [self.milk.pk, self.bread.pk])], added=[(when, [self.bread.pk, self.milk.pk])],
+            )
+        self.assertEqual(touched, set())
+        self.assertFalse(any(q['sql'].startswith(('INSERT', 'DELETE')) for q in ctx.captured_queries))
+
+    def test_sql_and_python_engines_match(self):
+        self._sale(*Product.objects.bulk_create([
+            Product(name=f'Mayorista {i}', price=Decimal('1.00'), stock=0) for i in range(MarketBasketService.MAX_BASKET_SIZE)
+        ]), self.milk)
+        service = MarketBasketService()
+        results = {}
+        for engine in ('python', 'sql'):
+            count = service.recalculate_all(engine=engine)
+            results[engine] = {
+                (a, b, co, round(confidence, 9))
+                for a, b, co, confidence in ProductAffinity.objects.values_list('product_a_id', 'product_b_id', 'co_occurrence_count', 'confidence')
+            }
+            self.assertEqual(count, len(results[engine]))
+        self.assertEqual(results['sql'], results['python'])
+        # La canasta mayorista no cuenta: Leche sigue en 4 ventas.
+        self.assertEqual(ProductBasketCount.objects.get(product=self.milk).basket_count, 4)
+        self.assertEqual(service.verify(), {'products': 0, 'pairs': 0})
+
+    def _old_sale(self, days_ago, *products):
+        sale = self._sale(*products)
+        Sale.objects.filter(pk=sale.pk).update(sale_date=timezone.now() - datetime.timedelta(days=days_ago))
+        sale.refresh_from_db()
+        return sale
+
+    def test_window_and_decay_favour_recent_baskets(self):
+        for _ in range(4):
+            self._old_sale(120, self.milk, self.rice)
+            self._old_sale(400, self.milk, self.soap)
+
+        for engine in ('python', 'sql'):
+            # Sin decaimiento: Leche→Arroz = 4 / 8 ventas con Leche (las de hace 400 días quedan fuera).
+            MarketBasketService(window_days=180, half_life_days=None).recalculate_all(engine=engine)
+            targets = set(ProductAffinity.objects.filter(product_a=self.milk).values_list('product_b_id', flat=True))
+            self.assertEqual(targets, {self.bread.pk, self.rice.pk}, engine)
+
+            # Vida media de 30 días: las ventas de hace 120 pesan 1/16 → Leche→Arroz ≈ 0.06.
+            MarketBasketService(window_days=180, half_life_days=30).recalculate_all(engine=engine)
+            affinity = ProductAffinity.objects.get(product_a=self.milk, product_b=self.bread)
+            self.assertAlmostEqual(affinity.confidence, 4 / (4 + 4 / 16), places=3)
+            self.assertFalse(ProductAffinity.objects.filter(product_a=self.milk, product_b=self.rice).exists())
+            self.assertFalse(ProductBasketCount.objects.filter(product=self.soap).exists())
+
+        state = MarketBasketState.objects.get(pk=1)
+        self.assertEqual((state.window_days, state.half_life_days), (180, 30))
+        self.assertAlmostEqual((state.epoch - state.window_start).days, 180)
+
+    def test_incremental_keeps_recorded_window(self):
+        old = self._old_sale(400, self.milk, self.bread)
+        MarketBasketService(window_days=180, half_life_days=30).recalculate_all()
+        SaleEvent.objects.all().delete()
+
+        # Una venta nueva suma con la misma fórmula de peso; una anterior a la ventana no resta nada.
+        self._sale(self.milk, self.rice)
+        SaleEventService().record(old, SaleEvent.EventType.DELETED, before=snapshot_sale(old))
+        old.delete()
+        SaleEventService().process_batch()
+
+        self.assertEqual(ProductBasketCount.objects.get(product=self.milk).basket_count, 5)
+        self.assertEqual(MarketBasketService().verify(), {'products': 0, 'pairs': 0})
+
+
+class RepurchasePredictionTestCase(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        self.ana = Customer.objects.create(name='Ana', last_name='Paz', dni='0911')
+        self.milk = Product.objects.create(name='Leche', price=Decimal('1.00'), stock=100)
+        self.bread = Product.objects.create(name='Pan', price=Decimal('0.50'), stock=100)
+        for days_ago in (31, 21, 11):
+            self._sale(self.ana, days_ago, self.milk)
+        self.bread_sales = [self._sale(self.ana, days_ago, self.bread) for days_ago in (40, 20, 1)]
+
+    def _sale(self, customer, days_ago, *products):
+        sale = Sale.objects.create(customer=customer, sale_date=self.now - datetime.timedelta(days=days_ago))
+        for product in products:
+            SaleDetail.objects.create(sale=sale, product=product, quantity=1, price=product.price, subtotal=product.price)
+        return sale
+
+    def test_patterns_from_purchase_intervals(self):
+        stale = Product.objects.create(name='Arroz', price=Decimal('2.00'), stock=100)
+        RepurchasePattern.objects.create(
+            customer=self.ana, product=stale, avg_interval_days=5, last_purchase_date=self.now.date(), purchase_count=3,
+        )
+        RepurchasePattern.objects.create(
+            customer=self.ana, product=self.milk, avg_interval_days=1, last_purchase_date=self.now.date(),
+            purchase_count=1, last_notified=self.now.date(),
+        )
+
+        self.assertEqual(RepurchasePredictionService().recalculate_all(), 2)
+
+        milk = RepurchasePattern.objects.get(customer=self.ana, product=self.milk)
+        self.assertEqual(
+            (milk.avg_interval_days, milk.purchase_count, milk.is_due, milk.last_notified),
+            (10.0, 3, True, self.now.date()),
+        )
+        self.assertEqual(milk.last_purchase_date, (self.now - datetime.timedelta(days=11)).date())
+        bread = RepurchasePattern.objects.get(customer=self.ana, product=self.bread)
+        self.assertEqual((bread.avg_interval_days, bread.is_due), (19.5, False))
+        self.assertFalse(RepurchasePattern.objects.filter(product=stale).exists())
+
+    def test_query_count_does_not_grow_with_pairs(self):
+        counts = []
+        for extra_customers in (0, 30):
+            for i in range(extra_customers):
+                customer = Customer.objects.create(name=f'Cliente {i}', dni=f'1{i:04d}')
+                for days_ago in (9, 6, 3):
+                    self._sale(customer, days_ago, self.milk, self.bread)
+            with CaptureQueriesContext(connection) as ctx:
+                RepurchasePredictionService().recalculate_all()
+            counts.append(len(ctx.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(RepurchasePattern.objects.count(), 62)
+
+    def test_incremental_drops_pairs_below_minimum(self):
+        service = RepurchasePredictionService()
+        service.recalculate_all()
+        self.bread_sales[0].delete()
+
+        self.assertEqual(service.recalculate(pairs={(self.ana.pk, self.bread.pk)}), 0)
+        self.assertFalse(RepurchasePattern.objects.filter(product=self.bread).exists())
+        self.assertTrue(RepurchasePattern.objects.filter(product=self.milk).exists())
+
+
+class RFMSegmentationTestCase(TestCase):
+    def setUp(self):
+        self.now = timezone.now()
+        # Diez clientes: el i-ésimo compró hace 2*i días, i+1 veces, con ticket de 10*(i+1).
+        self.customers = []
+        for i in range(10):
+            customer = Customer.objects.create(name=f'Cliente {i}', dni=f'08{i:02d}')
+            for _ in range(i + 1):
+                Sale.objects.create(
+                    customer=customer, sale_date=self.now - datetime.timedelta(days=2 * i), total=Decimal(10 * (i + 1)),
+                )
+            self.customers.append(customer)
+        self.newcomer = Customer.objects.create(name='Sin compras', dni='0899')
+
+    def test_quintile_helpers(self):
+        breaks = quintile_breaks(range(1, 11))
+        self.assertEqual(breaks, [2, 4, 6, 8])
+        self.assertEqual([quintile_score(breaks, v) for v in range(1, 11)], [1, 1, 2, 2, 3, 3, 4, 4, 5, 5])
+        self.assertEqual(quintile_breaks(iter(range(1, 11)), count=10), breaks)
+        self.assertIsNone(quintile_score([], 4))
+
+    def test_ties_share_the_lowest_quintile(self):
+        # La mayoría no compró en 30 días: los 0 no pueden subir de quintil.
+        values = [0] * 16 + [1, 1, 2, 5]
+        breaks = quintile_breaks(values)
+        self.assertEqual([quintile_score(breaks, v) for v in (0, 1, 2, 5)], [1, 5, 5, 5])
+        self.assertEqual(quintile_score(quintile_breaks([0] * 10), 0), 1)
+        values = [0] * 10 + [3] * 10
+        self.assertEqual([quintile_score(quintile_breaks(values), v) for v in (0, 3)], [1, 3])
+        self.assertEqual(quintile_breaks([7]), [7, 7, 7, 7])
+
+    def test_tied_base_scores_everyone_in_the_lowest_quintile(self):
+        Sale.objects.update(sale_date=self.now - datetime.timedelta(days=60), total=Decimal('10.00'))
+        RFMSegmentationService().recalculate_all()
+        scores = set(CustomerInsight.objects.exclude(customer=self.newcomer).values_list('r_score', 'f_score', 'm_score'))
+        self.assertEqual(scores, {(1, 1, 1)})
+
+    def test_full_recalculation_scores_against_whole_base(self):
+        self.assertEqual(RFMSegmentationService().recalculate_all(), 11)
+
+        scores = {
+            insight.customer_id: (insight.r_score, insight.f_score, insight.m_score)
+            for insight in CustomerInsight.objects.all()
+        }
+        # El más reciente tiene la peor frecuencia y el menor ticket, y al revés.
+        self.assertEqual(scores[self.customers[0].pk], (5, 1, 1))
+        self.assertEqual(scores[self.customers[9].pk], (1, 5, 5))
+        self.assertEqual(scores[self.newcomer.pk], (None, None, None))
+        self.assertEqual(sorted(r for r, _, _ in scores.values() if r), [1, 1, 2, 2, 3, 3, 4, 4, 5, 5])
+
+        insight = CustomerInsight.objects.get(customer=self.customers[9])
+        self.assertEqual((insight.recency_days, insight.frequency_30d, insight.avg_ticket, insight.segment), (18, 10, Decimal('100.00'), 'leal'))
+        self.assertEqual(CustomerInsight.objects.get(customer=self.newcomer).segment, 'nuevo')
+        self.assertEqual(RFMScoreState.objects.get(pk=1).customers, 10)
+
+    def test_incremental_uses_stored_breaks(self):
+        service = RFMSegmentationService()
+        service.recalculate_all()
+        for _ in range(10):
+            Sale.objects.create(customer=self.newcomer, sale_date=self.now, total=Decimal('500.00'))
+
+        self.assertEqual(service.recalculate(customer_ids=[self.newcomer.pk]), 1)
+        insight = CustomerInsight.objects.get(customer=self.newcomer)
+        self.assertEqual((insight.r_score, insight.f_score, insight.m_score, insight.segment), (5, 5, 5, 'campeon'))
+
+    def test_query_count_does_not_grow_with_customers(self):
+        RFMSegmentationService().recalculate_all()  # crea RFMScoreState
+        counts = []
+        for extra in (0, 40):
+            Customer.objects.bulk_create([Customer(name=f'Extra {i}', dni=f'07{extra}{i:03d}') for i in range(extra)])
+            with CaptureQueriesContext(connection) as ctx:
+                RFMSegmentationService().recalculate_all()
+            counts.append(len(ctx.captured_queries))
+        self.assertEqual(counts[0], counts[1])
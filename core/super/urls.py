@@ -1,5 +1,5 @@
 from django.urls import path 
-from core.super.views import customer, product, seller, sale, scan_barcode, shop, cart, chatbot, reports, legal
+from core.super.views import customer, product, seller, sale, scan_barcode, shop, cart, chatbot, reports, legal, autocomplete
 from core.super.views.whatsapp_webhook import whatsapp_webhook
 from core.super.views import home, user, profile
 
@@ -50,10 +50,12 @@ urlpatterns = [
     path('admin/productos/editar/<int:pk>/', product.ProductUpdateView.as_view(), name='product_update'),
     path('admin/productos/eliminar/<int:pk>/', product.ProductDeleteView.as_view(), name='product_delete'),
     path('productos/<int:pk>/', product.ProductDetailView.as_view(), name='product_detail'),
+    path('api/productos/<int:pk>/stock/', product.ProductStockAsOfView.as_view(), name='product_stock_as_of'),
 
     # VENTAS (ADMIN)
     path('admin/ventas/', sale.SaleListView.as_view(), name='sale_list'),
     path('admin/ventas/crear/', sale.SaleCreateView.as_view(), name='sale_create'),
+    path('admin/ventas/sincronizar/', sale.SaleSyncView.as_view(), name='sale_sync'),
     path('admin/ventas/editar/<int:pk>/', sale.SaleUpdateView.as_view(), name='sale_update'),
     path('admin/ventas/eliminar/<int:pk>/', sale.SaleDeleteView.as_view(), name='sale_delete'),
     path('admin/ventas/<int:pk>', sale.SaleDetailView.as_view(), name='sale_detail'),
@@ -69,7 +71,13 @@ urlpatterns = [
     
     # REPORTES (ADMIN)
     path('admin/reportes/', reports.ReportsView.as_view(), name='reports'),
+    path('api/reportes/', reports.ReportsApiView.as_view(), name='reports_api'),
+    path('api/reportes/comparacion/', reports.ReportsComparisonApiView.as_view(), name='reports_comparison_api'),
     path('admin/reportes/exportar/', reports.ExportReportsExcelView.as_view(), name='export_reports_excel'),
+    path('admin/reportes/exportar/csv/', reports.ExportSalesCsvView.as_view(), name='export_sales_csv'),
+    path('admin/reportes/exportar/<int:pk>/', reports.ReportExportStatusView.as_view(), name='report_export_status'),
+    path('admin/reportes/exportar/<int:pk>/descargar/', reports.ReportExportDownloadView.as_view(), name='report_export_download'),
+    path('api/autocompletar/<str:kind>/', autocomplete.AutocompleteView.as_view(), name='autocomplete'),
     
     # USUARIOS (ADMIN)
     path('admin/usuarios/', user.UserListView.as_view(), name='user_list'),
@@ -0,0 +1,30 @@
+"""
+Endpoints JSON de autocompletado para los filtros de reportes y ventas.
+"""
+
+from django.http import Http404, JsonResponse
+from django.views import View
+
+from core.super.mixins.auth import AdminRequiredMixin
+from core.super.services.autocomplete_service import autocomplete, SOURCES
+
+
+class AutocompleteView(AdminRequiredMixin, View):
+    """
+    GET ?q=<prefijo>&page=<n> → {"results": [{"id", "text"}], "more": bool}
+    para clientes, vendedores o formas de pago (según `kind` en la URL).
+    """
+
+    login_url = "/security/login/"
+
+    def get(self, request, kind, *args, **kwargs):
+        if kind not in SOURCES:
+            raise Http404
+        try:
+            page = int(request.GET.get("page", 1))
+        except ValueError:
+            page = 1
+        data = autocomplete(kind, request.GET.get("q", ""), page)
+        response = JsonResponse(data)
+        response["Cache-Control"] = "private, max-age=60"
+        return response
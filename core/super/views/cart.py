@@ -15,6 +15,7 @@ import uuid
 from decimal import Decimal
 from core.super.models import Cart, CartItem, Product, Customer, PaymentMethod, ProductAffinity
 from core.super.services.checkout_service import CheckoutService
+from core.super.services.cart_count_service import CartCountService
 from core.super.services.payment_processors import get_processor
 from core.super.services.idempotency_service import IdempotencyService
 from django.db import transaction
@@ -45,8 +46,7 @@ def add_to_cart(request, product_id):
             CartItem.objects.filter(pk=cart_item.pk).update(quantity=F('quantity') + 1)
 
     messages.success(request, f'{product.name} agregado al carrito')
-    cart.refresh_from_db()
-    return JsonResponse({'success': True, 'cart_count': cart.get_item_count()})
+    return JsonResponse({'success': True, 'cart_count': CartCountService().refresh(request.user)})
 
 
 @login_required
@@ -57,9 +57,11 @@ def update_cart_item(request, item_id):
         quantity = int(request.POST.get('quantity', 1))
         if quantity <= 0:
             cart_item.delete()
+            CartCountService().refresh(request.user)
             messages.info(request, 'Producto eliminado del carrito')
         elif cart_item.product.is_expired:
             cart_item.delete()
+            CartCountService().refresh(request.user)
             messages.error(request, f'{cart_item.product.name} caducó y fue eliminado del carrito')
         elif quantity > cart_item.product.stock:
             messages.error(request, f'Solo hay {cart_item.product.stock} unidades disponibles')
@@ -76,6 +78,7 @@ def remove_from_cart(request, item_id):
     cart_item = get_object_or_404(CartItem, pk=item_id, cart__user=request.user)
     product_name = cart_item.product.name
     cart_item.delete()
+    CartCountService().refresh(request.user)
     messages.success(request, f'{product_name} eliminado del carrito')
     return redirect('super:cart')
 
@@ -83,12 +86,7 @@ def remove_from_cart(request, item_id):
 @login_required
 def cart_count(request):
     """Devuelve el número de productos en el carrito del usuario."""
-    try:
-        cart = Cart.objects.get(user=request.user)
-        count = cart.get_item_count()
-    except Cart.DoesNotExist:
-        count = 0
-    return JsonResponse({'count': count})
+    return JsonResponse({'count': CartCountService().get(request.user)})
 
 
 class CartView(LoginRequiredMixin, TemplateView):
@@ -101,11 +99,12 @@ class CartView(LoginRequiredMixin, TemplateView):
         try:
             cart = Cart.objects.get(user=self.request.user)
             items = CartItem.objects.filter(cart=cart).select_related('product')
+            summary = cart.get_summary()
             context['cart'] = cart
             context['items'] = items
-            context['subtotal'] = cart.get_subtotal()
-            context['iva'] = cart.get_iva()
-            context['total'] = cart.get_total()
+            context['subtotal'] = summary.subtotal
+            context['iva'] = summary.iva
+            context['total'] = summary.total
             context['suggestions'] = self._get_combo_suggestions(items)
         except Cart.DoesNotExist:
             context['cart'] = None
@@ -178,7 +177,10 @@ class CheckoutView(LoginRequiredMixin, TemplateView):
                 discount_active = True
                 discount_expiry = customer.discount_expiry
 
-            cart_total = cart.get_total()
+            # Un único CartSummary alimenta subtotal, IVA, total y la vista
+            # previa del descuento (antes eran tres recorridos del carrito).
+            summary = cart.get_summary()
+            cart_total = summary.total
             # En el GET asumimos pago elegible (Efectivo/Tarjeta) para mostrar
             # el descuento potencial. Si el usuario elige Consumidor Final o
             # Transferencia, el JS ocultará la sección y el POST recalculará.
@@ -186,8 +188,8 @@ class CheckoutView(LoginRequiredMixin, TemplateView):
             final_total_preview = cart_total - discount_amount_preview
 
             context['items'] = items
-            context['subtotal'] = cart.get_subtotal()
-            context['iva'] = cart.get_iva()
+            context['subtotal'] = summary.subtotal
+            context['iva'] = summary.iva
             context['discount'] = discount_amount_preview
             context['discount_pct'] = discount_pct
             context['discount_active'] = discount_active
@@ -199,7 +201,9 @@ class CheckoutView(LoginRequiredMixin, TemplateView):
             context['idempotency_key'] = str(uuid.uuid4())
             # Aviso preventivo en la página de checkout, por si algo caducó
             # mientras estaba en el carrito (el bloqueo real ocurre en el POST).
-            context['expired_items'] = [item for item in items if item.product.is_expired]
+            context['expired_items'] = (
+                [item for item in items if item.product.is_expired] if summary.has_expired else []
+            )
 
         except Cart.DoesNotExist:
             pass
@@ -207,7 +211,6 @@ class CheckoutView(LoginRequiredMixin, TemplateView):
         context['title'] = 'Finalizar Compra'
         return context
 
-    @transaction.atomic
     def post(self, request, *args, **kwargs):
         idempotency_service = IdempotencyService()
         raw_key = request.POST.get('idempotency_key', '').strip()
@@ -215,62 +218,33 @@ class CheckoutView(LoginRequiredMixin, TemplateView):
 
         if idempotency_key:
             existing_sale = idempotency_service.find_existing(idempotency_key)
+            # ── Reserva single-flight ─────────────────────────────────────
+            # Se reclama la clave en autocommit, ANTES de bloquear stock.
+            # Si otra request (doble clic) ya la tiene, esta no procesa
+            # nada: espera a que la otra confirme y redirige a esa venta.
+            if existing_sale is None and not idempotency_service.reserve(idempotency_key):
+                existing_sale = idempotency_service.wait_for_sale(idempotency_key)
+                if existing_sale is None:
+                    messages.info(request, 'Tu compra se está procesando. Revisa "Mis Compras" en unos segundos.')
+                    return redirect('super:my_orders')
             if existing_sale:
                 messages.info(request, 'Esta compra ya fue procesada.')
                 return redirect('super:order_detail', pk=existing_sale.pk)
 
         try:
-            service = CheckoutService()
-            cart = Cart.objects.get(user=request.user)
-            items = CartItem.objects.filter(cart=cart).select_related('product')
-
-            if not items.exists():
-                return redirect('super:cart')
-
-            dni_type = request.POST.get('dni_type', 'personal')
-
-            customer = service.resolve_customer(
-                request.user,
-                dni_type,
-                request.POST.get('dni')
-            )
-
-            # Obtener el nombre del método de pago para validar descuento
-            payment_method_id = request.POST.get('payment_method')
-            payment_method = PaymentMethod.objects.get(id_payment_method=payment_method_id)
-
-            totals = service.calculate_totals(
-                cart,
-                customer,
-                payment_name=payment_method.name,
-                dni_type=dni_type,
-            )
-
-            processor = get_processor(payment_method.name)
-            amount_received, change = processor.calculate_received_and_change(totals['total'], request.POST)
-
-            if amount_received < totals['total']:
-                messages.error(request, 'Monto recibido insuficiente')
-                return redirect('super:checkout')
-
-            sale = service.create_sale(
-                request.user,
-                customer,
-                payment_method_id,
-                totals,
-                amount_received,
-                change,
-                idempotency_key,
-                card_number_masked=request.POST.get('card_number_masked'),
-                transfer_account_masked=request.POST.get('transfer_account_masked'),
-            )
-
-            service.register_items(sale, items)
-            cart.delete()
-
-            messages.success(request, '¡Compra finalizada!')
-            return redirect('super:order_detail', pk=sale.pk)
-
+            return self._checkout(request, idempotency_key)
+        finally:
+            # No-op si la venta se confirmó (la reserva ya tiene sale asociada).
+            if idempotency_key:
+                idempotency_service.release(idempotency_key)
+
+    def _checkout(self, request, idempotency_key):
+        # La transacción envuelve solo el procesamiento: si algo falla, el
+        # rollback ocurre ANTES de convertir el error en mensaje, así no
+        # queda una venta a medias confirmada.
+        try:
+            with transaction.atomic():
+                return self._create_order(request, idempotency_key)
         except Customer.DoesNotExist:
             messages.error(request, 'Error al procesar el cliente')
             return redirect('super:checkout')
@@ -282,4 +256,62 @@ class CheckoutView(LoginRequiredMixin, TemplateView):
             return redirect('super:checkout')
         except Exception as e:
             messages.error(request, f'Error al procesar la compra: {str(e)}')
-            return redirect('super:checkout')
\ No newline at end of file
+            return redirect('super:checkout')
+
+    def _create_order(self, request, idempotency_key):
+        service = CheckoutService()
+        cart = Cart.objects.get(user=request.user)
+        items = CartItem.objects.filter(cart=cart).select_related('product')
+
+        # El summary queda memoizado en `cart` y calculate_totals lo reutiliza.
+        if cart.get_summary().is_empty:
+            return redirect('super:cart')
+
+        dni_type = request.POST.get('dni_type', 'personal')
+
+        customer = service.resolve_customer(
+            request.user,
+            dni_type,
+            request.POST.get('dni')
+        )
+
+        # Obtener el nombre del método de pago para validar descuento
+        payment_method_id = request.POST.get('payment_method')
+        payment_method = PaymentMethod.objects.get(id_payment_method=payment_method_id)
+
+        totals = service.calculate_totals(
+            cart,
+            customer,
+            payment_name=payment_method.name,
+            dni_type=dni_type,
+        )
+
+        processor = get_processor(payment_method.name)
+        amount_received, change = processor.calculate_received_and_change(totals['total'], request.POST)
+
+        if amount_received < totals['total']:
+            messages.error(request, 'Monto recibido insuficiente')
+            return redirect('super:checkout')
+
+        sale = service.create_sale(
+            request.user,
+            customer,
+            payment_method_id,
+            totals,
+            amount_received,
+            change,
+            idempotency_key,
+            card_number_masked=request.POST.get('card_number_masked'),
+            transfer_account_masked=request.POST.get('transfer_account_masked'),
+        )
+        if idempotency_key:
+            IdempotencyService().attach_sale(idempotency_key, sale)
+
+        service.register_items(sale, items)
+        cart.delete()
+        # Solo después del COMMIT: si la transacción revierte, el
+        # carrito sigue lleno y el badge no debe mostrar 0.
+        transaction.on_commit(lambda: CartCountService().clear(request.user))
+
+        messages.success(request, '¡Compra finalizada!')
+        return redirect('super:order_detail', pk=sale.pk)
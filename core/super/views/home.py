@@ -4,7 +4,7 @@ Vistas de componentes base o principales.
 
 from django.shortcuts import render, redirect
 from django.views.generic import TemplateView, ListView, View
-from core.super.models import Product, Category, Brand, Sale
+from core.super.models import Product, Sale
 from django.db.models import Q
 from django.contrib import messages
 from django.core.mail import EmailMultiAlternatives
@@ -12,6 +12,7 @@ from django.conf import settings
 from django.utils import timezone
 from datetime import timedelta
 from core.super.mixins.auth import AdminRequiredMixin
+from core.super.services.catalog_service import get_categories, get_brands
 
 class HomeView(TemplateView):
     """ Vista principal de la página principal o HomePage. """
@@ -277,8 +278,8 @@ class ProductCatalogView(ListView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['title'] = 'Catálogo de productos'	
-        context['categories'] = Category.objects.all()
-        context['brands'] = Brand.objects.all()
+        context['categories'] = get_categories()
+        context['brands'] = get_brands()
         context['selected_brand'] = self.request.GET.get('brand')
         context['selected_category'] = self.request.GET.get('category') 
         context['search_query'] = self.request.GET.get('search', '') 
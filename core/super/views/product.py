@@ -2,10 +2,17 @@
 Vistas para que el admin gestione los productos
 """
 
+import datetime
+from django.views import View
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView, DetailView
 from django.urls import reverse_lazy
 from django.db.models import Q
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from core.super.models import Product, Category, Brand
+from core.super.services.inventory_service import InventoryService
 from core.super.form.product import ProductForm
 from django.contrib.auth.mixins import LoginRequiredMixin
 from core.super.mixins.auth import AdminRequiredMixin
@@ -91,6 +98,15 @@ class ProductUpdateView(AdminRequiredMixin, UpdateView):
         context['back_url'] = self.success_url
         return context
 
+    def form_valid(self, form):
+        # El ajuste de stock se aplica sobre el stock actual: si entre tanto
+        # se vendió lo suficiente, puede no alcanzar.
+        try:
+            return super().form_valid(form)
+        except ValueError as e:
+            form.add_error('stock', str(e))
+            return self.form_invalid(form)
+
 class ProductDeleteView(AdminRequiredMixin, DeleteView):
     """Vista para eliminar un producto"""
     
@@ -117,4 +133,42 @@ class ProductDetailView(DetailView, LoginRequiredMixin):
         context = super().get_context_data(**kwargs)
         context['title'] = f'Producto: {self.object.name}'
         context['back_url'] = reverse_lazy('super:product_list')
-        return context
\ No newline at end of file
+        return context
+
+
+class ProductStockAsOfView(AdminRequiredMixin, View):
+    """
+    Stock de un producto a una fecha según el ledger de inventario.
+
+    ?at=2026-01-31 (fin de ese día) o ?at=2026-01-31T15:00. Sin `at`
+    devuelve el stock actual según el ledger.
+    """
+
+    def get(self, request, pk):
+        product = get_object_or_404(Product, pk=pk)
+        raw = request.GET.get('at', '').strip()
+        when = timezone.now()
+        if raw:
+            # parse_date/parse_datetime devuelven None si el formato no
+            # coincide, pero lanzan ValueError con valores fuera de rango
+            # (2026-13-45): ambos casos son un 400. La fecha sola va
+            # primero: parse_datetime también la acepta, como medianoche.
+            try:
+                day = parse_date(raw)
+                if day is not None:
+                    parsed = datetime.datetime.combine(day, datetime.time.max)
+                else:
+                    parsed = parse_datetime(raw)
+            except ValueError:
+                parsed = None
+            if parsed is None:
+                return JsonResponse({'error': f'Fecha inválida: {raw}'}, status=400)
+            when = timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+        return JsonResponse({
+            'product': product.pk,
+            'name': product.name,
+            'at': when.isoformat(),
+            'stock': InventoryService().as_of(product.pk, when),
+            'current_stock': product.stock,
+        })
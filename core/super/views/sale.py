@@ -12,11 +12,16 @@ from django.views import View
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView, DetailView
 from django.http import JsonResponse
 from django.db import transaction
-from django.db.models import Q, F, Sum
+from django.db.models import Sum
 from decimal import Decimal
-from core.super.models import Sale, SaleDetail, Product, PaymentMethod
+from core.super.models import Sale, SaleDetail, SaleEvent, Product, InventoryMovement
 from core.super.form.sale import SaleForm
+from core.super.services.checkout_service import decrement_stock
 from core.super.services.idempotency_service import IdempotencyService
+from core.super.services.sale_event_service import SaleEventService, snapshot_sale
+from core.super.services.autocomplete_service import filter_labels
+from core.super.services.sale_filter import SaleFilter
+from core.super.services.sale_sync_service import SaleSyncService, MAX_SALES_PER_REQUEST, CREATED, DUPLICATE, ERROR
 from django.http import HttpResponse
 from django.template.loader import get_template
 from django.shortcuts import render
@@ -33,32 +38,8 @@ class SaleListView(AdminRequiredMixin, ListView):
     paginate_by = 12
 
     def get_queryset(self):
-        q = self.request.GET.get('q')
-        payment_id = self.request.GET.get('payment')
-        date_from = self.request.GET.get('date_from')
-        date_to = self.request.GET.get('date_to')
-
-        query = Q()
-        if q:
-            query &= (
-                Q(id_sale__icontains=q) |
-                Q(customer__name__icontains=q) |
-                Q(customer__last_name__icontains=q) |
-                Q(seller__name__icontains=q) |
-                Q(seller__last_name__icontains=q) |
-                Q(payment__name__icontains=q)
-            )
-
-        qs = self.model.objects.filter(query).select_related('customer', 'seller', 'payment')
-
-        if payment_id:
-            qs = qs.filter(payment_id=payment_id)
-        if date_from:
-            qs = qs.filter(sale_date__date__gte=date_from)
-        if date_to:
-            qs = qs.filter(sale_date__date__lte=date_to)
-
-        return qs.order_by('-sale_date')
+        sale_filter = SaleFilter.from_request(self.request)
+        return sale_filter.apply().select_related('customer', 'seller', 'payment').order_by('-sale_date')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -68,11 +49,11 @@ class SaleListView(AdminRequiredMixin, ListView):
         # actual de 12), y se hace en la BD con Sum() — nunca en el
         # template, que no puede acumular sumas de forma confiable.
         context['total_recaudado'] = (
-            self.get_queryset().aggregate(t=Sum('total'))['t'] or Decimal('0')
+            self.object_list.order_by().aggregate(t=Sum('total'))['t'] or Decimal('0')
         )
-        context['payment_methods'] = PaymentMethod.objects.order_by('name')
         context['search_query'] = self.request.GET.get('q', '')
-        context['selected_payment'] = self.request.GET.get('payment', '')
+        # Forma de pago / vendedor / cliente: autocompletado, solo el valor elegido
+        context.update(filter_labels(self.request))
         context['date_from'] = self.request.GET.get('date_from', '')
         context['date_to'] = self.request.GET.get('date_to', '')
         return context
@@ -103,76 +84,139 @@ class SaleCreateView(AdminRequiredMixin, CreateView):
             return self.handle_ajax(request)
         return super().post(request, *args, **kwargs)
 
-    @transaction.atomic
     def handle_ajax(self, request):
+        idempotency_service = IdempotencyService()
         try:
             data = json.loads(request.body)
+            if not isinstance(data, dict):
+                raise ValueError("Datos inválidos enviados en la solicitud")
 
             # ── Guardia de idempotencia ───────────────────────────────────
-            idempotency_service = IdempotencyService()
-            raw_key = data.get('idempotency_key', '').strip()
+            # La clave se reserva en autocommit antes de bloquear productos:
+            # un doble envío no llega a tocar el stock, espera a la request
+            # que ganó la reserva y responde como idempotente.
+            raw_key = str(data.get('idempotency_key') or '').strip()
             idempotency_key = idempotency_service.parse_key(raw_key)
+        except json.JSONDecodeError as e:
+            return JsonResponse({'success': False, 'error': f'Error al procesar la venta: {str(e)}'}, status=500)
+        except ValueError as e:
+            return JsonResponse({'success': False, 'error': str(e)}, status=400)
 
-            if idempotency_key:
-                existing = idempotency_service.find_existing(idempotency_key)
-                if existing:
+        if idempotency_key:
+            existing = idempotency_service.find_existing(idempotency_key)
+            if existing is None and not idempotency_service.reserve(idempotency_key):
+                existing = idempotency_service.wait_for_sale(idempotency_key)
+                if existing is None:
                     return JsonResponse({
-                        'success': True,
-                        'redirect_url': str(self.success_url),
-                        'idempotent': True,
-                    })
-
-            sale = Sale(
-                customer_id=data.get('customer'),
-                seller_id=data.get('seller'),
-                payment_id=data.get('payment'),
-                sale_date=data.get('sale_date'),
-                subtotal=Decimal(data.get('subtotal', '0')),
-                iva=Decimal(data.get('iva', '0')),
-                discount=Decimal(data.get('discount', '0')),
-                total=Decimal(data.get('total', '0')),
-                idempotency_key=idempotency_key,   # ← guardada en BD
-            )
-            sale.save()
-
-            for detail in data.get('details', []):
-                # ── Concurrencia: bloqueo a nivel de fila ─────────────────
-                # select_for_update() bloquea el registro del producto
-                # hasta que termine esta transacción. Si dos requests
-                # intentan descontar stock del mismo producto al mismo
-                # tiempo, el segundo espera al primero — evitando que
-                # ambos lean el mismo valor y sobreescriban el resultado.
-                product = Product.objects.select_for_update().get(
-                    pk=detail.get('product')
-                )
-                quantity = int(detail.get('quantity', 1))
-
-                if product.stock < quantity:
-                    raise ValueError(
-                        f"Stock insuficiente para '{product.name}'. "
-                        f"Disponible: {product.stock}, solicitado: {quantity}"
-                    )
-
-                SaleDetail.objects.create(
-                    sale=sale,
-                    product=product,
-                    quantity=quantity,
-                    price=Decimal(detail.get('price', '0')),
-                    subtotal=Decimal(detail.get('subtotal', '0'))
-                )
-                
-                # Descuento atómico: usa F() para que la operación
-                # ocurra en la BD, no en Python → inmune a race conditions.
-                Product.objects.filter(pk=product.pk).update(
-                    stock=F('stock') - quantity
-                )
+                        'success': False,
+                        'error': 'La venta ya se está procesando, espera unos segundos.',
+                    }, status=409)
+            if existing:
+                return JsonResponse({
+                    'success': True,
+                    'redirect_url': str(self.success_url),
+                    'idempotent': True,
+                })
 
+        try:
+            with transaction.atomic():
+                self._register_sale(data, idempotency_key)
             return JsonResponse({'success': True, 'redirect_url': str(self.success_url)})
 
         except ValueError as e:
             return JsonResponse({'success': False, 'error': str(e)}, status=400)
         except Exception as e:
             return JsonResponse({'success': False, 'error': f'Error al procesar la venta: {str(e)}'}, status=500)
+        finally:
+            if idempotency_key:
+                idempotency_service.release(idempotency_key)
+
+    def _register_sale(self, data, idempotency_key):
+        sale = Sale(
+            customer_id=data.get('customer'),
+            seller_id=data.get('seller'),
+            payment_id=data.get('payment'),
+            sale_date=data.get('sale_date'),
+            subtotal=Decimal(data.get('subtotal', '0')),
+            iva=Decimal(data.get('iva', '0')),
+            discount=Decimal(data.get('discount', '0')),
+            total=Decimal(data.get('total', '0')),
+            idempotency_key=idempotency_key,   # ← guardada en BD
+        )
+        sale.save()
+        if idempotency_key:
+            IdempotencyService().attach_sale(idempotency_key, sale)
+
+        for detail in data.get('details', []):
+            # ── Concurrencia: bloqueo a nivel de fila ─────────────────
+            # select_for_update() bloquea el registro del producto
+            # hasta que termine esta transacción. Si dos requests
+            # intentan descontar stock del mismo producto al mismo
+            # tiempo, el segundo espera al primero — evitando que
+            # ambos lean el mismo valor y sobreescriban el resultado.
+            product = Product.objects.select_for_update().get(
+                pk=detail.get('product')
+            )
+            quantity = int(detail.get('quantity', 1))
+
+            if not product.stock_shards and product.stock < quantity:
+                raise ValueError(
+                    f"Stock insuficiente para '{product.name}'. "
+                    f"Disponible: {product.stock}, solicitado: {quantity}"
+                )
+
+            SaleDetail.objects.create(
+                sale=sale,
+                product=product,
+                quantity=quantity,
+                price=Decimal(detail.get('price', '0')),
+                subtotal=Decimal(detail.get('subtotal', '0'))
+            )
+
+            # Descuento atómico: usa F() para que la operación
+            # ocurra en la BD, no en Python → inmune a race conditions.
+            # (Productos sharded: descuenta de sus shards y valida ahí.)
+            decrement_stock({product.pk: quantity}, sale_ref=sale.pk)
+
+        SaleEventService().record(sale, SaleEvent.EventType.CREATED)
+        return sale
+
+
+@method_decorator(require_http_methods(["POST"]), name='dispatch')
+class SaleSyncView(AdminRequiredMixin, View):
+    """
+    Sincronización masiva de ventas hechas offline en los terminales POS.
+
+    Recibe {"sales": [...]} donde cada venta tiene el mismo formato que el
+    JSON de SaleCreateView más su propia idempotency_key. Responde un
+    resultado por venta, en el mismo orden: created / duplicate / error.
+    Reenviar el mismo lote es seguro.
+    """
+
+    def post(self, request, *args, **kwargs):
+        try:
+            data = json.loads(request.body)
+        except json.JSONDecodeError as e:
+            return JsonResponse({'success': False, 'error': f'Error al decodificar JSON: {str(e)}'}, status=400)
+
+        sales = data.get('sales') if isinstance(data, dict) else None
+        if not isinstance(sales, list) or not all(isinstance(sale, dict) for sale in sales):
+            return JsonResponse({'success': False, 'error': "Se esperaba una lista de ventas en 'sales'"}, status=400)
+        if len(sales) > MAX_SALES_PER_REQUEST:
+            return JsonResponse({
+                'success': False,
+                'error': f'Máximo {MAX_SALES_PER_REQUEST} ventas por envío, recibidas {len(sales)}',
+            }, status=400)
+
+        try:
+            results = SaleSyncService().sync(sales)
+        except Exception as e:
+            return JsonResponse({'success': False, 'error': f'Error al sincronizar las ventas: {str(e)}'}, status=500)
+
+        summary = {status: 0 for status in (CREATED, DUPLICATE, ERROR)}
+        for result in results:
+            summary[result['status']] += 1
+        return JsonResponse({'success': True, 'summary': summary, 'results': results})
 
 
 class SaleUpdateView(AdminRequiredMixin, UpdateView):
@@ -217,86 +261,15 @@ class SaleUpdateView(AdminRequiredMixin, UpdateView):
             return self.handle_ajax(request)
         return super().post(request, *args, **kwargs)
 
-    @transaction.atomic
     def handle_ajax(self, request):
         try:
-            sale = self.get_object()
             data = json.loads(request.body)
 
             if not data or 'details' not in data:
                 raise ValueError("Datos inválidos enviados en la solicitud")
 
-            sale.customer_id = data.get('customer')
-            sale.seller_id = data.get('seller')
-            sale.payment_id = data.get('payment')
-            sale.sale_date = data.get('sale_date')
-            sale.subtotal = Decimal(data.get('subtotal', '0'))
-            sale.iva = Decimal(data.get('iva', '0'))
-            sale.discount = Decimal(data.get('discount', '0'))
-            sale.total = Decimal(data.get('total', '0'))
-            sale.save()
-
-            old_details = SaleDetail.objects.filter(sale=sale)
-            old_details_dict = {str(detail.product.id_product): detail for detail in old_details}
-            new_details_dict = {str(detail.get('product')): detail for detail in data.get('details', [])}
-            
-            # Bloque 1: productos eliminados (restaurar stock)
-            for product_id, old_detail in old_details_dict.items():
-                if product_id not in new_details_dict:
-                    # select_for_update: bloquear antes de restaurar
-                    product = Product.objects.select_for_update().get(
-                        pk=old_detail.product.pk
-                    )
-                    Product.objects.filter(pk=product.pk).update(
-                        stock=F('stock') + old_detail.quantity
-                    )
-                    old_detail.delete()  # ← eliminar antes de restaurar
-                else:
-                    new_quantity = int(new_details_dict[product_id].get('quantity', 1))
-                    if new_quantity != old_detail.quantity:
-                        product = Product.objects.select_for_update().get(
-                            pk=old_detail.product.pk
-                        )
-                        stock_difference = old_detail.quantity - new_quantity
-                        # Verificar que el nuevo stock no quedaría negativo
-                        current_stock = Product.objects.get(pk=product.pk).stock
-                        if current_stock + stock_difference < 0:
-                            raise ValueError(
-                                f"Stock insuficiente para '{product.name}'"
-                            )
-                        Product.objects.filter(pk=product.pk).update(
-                            stock=F('stock') + stock_difference
-                        )
-                        old_detail.quantity = new_quantity
-                        old_detail.price = Decimal(
-                            new_details_dict[product_id].get('price', '0')
-                        )
-                        old_detail.subtotal = Decimal(
-                            new_details_dict[product_id].get('subtotal', '0')
-                        )
-                        old_detail.save()
-                        
-            # Bloque 2: productos nuevos en edición            
-            for product_id, new_detail in new_details_dict.items():
-                if product_id not in old_details_dict:
-                    product = Product.objects.select_for_update().get(
-                        pk=int(product_id)
-                    )
-                    quantity = int(new_detail.get('quantity', 1))
-                    if product.stock < quantity:
-                        raise ValueError(
-                            f"Stock insuficiente para '{product.name}'. "
-                            f"Disponible: {product.stock}"
-                        )
-                    SaleDetail.objects.create(
-                        sale=sale, product=product, quantity=quantity,
-                        price=Decimal(new_detail.get('price', '0')),
-                        subtotal=Decimal(new_detail.get('subtotal', '0')),
-                    )
-                    Product.objects.filter(pk=product.pk).update(
-                        stock=F('stock') - quantity
-                    )
-
+            with transaction.atomic():
+                self._update_sale(self.get_object(), data)
             return JsonResponse({'success': True, 'redirect_url': str(self.success_url)})
 
         except ValueError as e:
@@ -306,6 +279,110 @@ class SaleUpdateView(AdminRequiredMixin, UpdateView):
         except Exception as e:
             return JsonResponse({'success': False, 'error': f'Error al procesar la venta: {str(e)}'}, status=500)
 
+    def _update_sale(self, sale, data):
+        """
+        Aplica la edición por diferencias (delta) en vez de devolver todo
+        el stock y volver a descontarlo:
+
+        1. Se compara, por producto, la cantidad vieja con la nueva.
+        2. Solo los productos cuya cantidad cambió se bloquean, una sola
+           vez cada uno y en orden de pk (mismo orden que el checkout).
+        3. El delta neto de todos va en un único UPDATE ... CASE.
+        4. Solo se tocan los SaleDetail que cambiaron: un DELETE, un
+           bulk_update y un bulk_create como máximo.
+
+        La cantidad de queries no depende del tamaño del ticket.
+        """
+        old_rows = {}
+        for detail in SaleDetail.objects.filter(sale=sale):
+            old_rows.setdefault(detail.product_id, []).append(detail)
+        # Foto previa para el outbox: los consumidores necesitan saber
+        # qué cliente / productos tenía la venta ANTES de editarla.
+        before = snapshot_sale(sale, [d for rows in old_rows.values() for d in rows])
+
+        new_lines = {}
+        for line in data.get('details', []):
+            quantity = int(line.get('quantity', 1))
+            if quantity <= 0:
+                raise ValueError("La cantidad de cada producto debe ser mayor a cero")
+            new_lines[int(line.get('product'))] = {
+                'quantity': quantity,
+                'price': Decimal(line.get('price', '0')),
+                'subtotal': Decimal(line.get('subtotal', '0')),
+            }
+
+        # Consumo neto por producto: positivo descuenta stock, negativo lo devuelve.
+        deltas = {}
+        for product_id in old_rows.keys() | new_lines.keys():
+            old_quantity = sum(d.quantity for d in old_rows.get(product_id, []))
+            new_quantity = new_lines[product_id]['quantity'] if product_id in new_lines else 0
+            if new_quantity != old_quantity:
+                deltas[product_id] = new_quantity - old_quantity
+
+        products = {
+            product.pk: product
+            for product in Product.objects.select_for_update().filter(pk__in=deltas).order_by('pk')
+        }
+        for product_id, delta in deltas.items():
+            product = products.get(product_id)
+            if product is None:
+                if delta > 0:
+                    raise Product.DoesNotExist('Product matching query does not exist.')
+                continue  # producto borrado del catálogo: no hay stock que devolver
+            # Sharded: Product.stock es un total atrasado; valida StockShardService.consume.
+            if not product.stock_shards and product.stock < delta:
+                raise ValueError(
+                    f"Stock insuficiente para '{product.name}'. "
+                    f"Disponible: {product.stock}"
+                )
+
+        sale.customer_id = data.get('customer')
+        sale.seller_id = data.get('seller')
+        sale.payment_id = data.get('payment')
+        sale.sale_date = data.get('sale_date')
+        sale.subtotal = Decimal(data.get('subtotal', '0'))
+        sale.iva = Decimal(data.get('iva', '0'))
+        sale.discount = Decimal(data.get('discount', '0'))
+        sale.total = Decimal(data.get('total', '0'))
+        sale.save()
+
+        decrement_stock(
+            {pk: delta for pk, delta in deltas.items() if pk in products},
+            reason=InventoryMovement.Reason.SALE_EDIT, sale_ref=sale.pk,
+        )
+        # Igual que al eliminar: un producto agotado que recupera unidades
+        # por la edición vuelve a estar activo.
+        returned = [pk for pk, delta in deltas.items() if delta < 0 and pk in products]
+        if returned:
+            Product.objects.filter(pk__in=returned, stock__gt=0, state=False).update(state=True)
+
+        to_delete, to_update, to_create, kept = [], [], [], []
+        for product_id, rows in old_rows.items():
+            line = new_lines.get(product_id)
+            if line is None:
+                to_delete.extend(rows)
+                continue
+            # Una sola fila por producto; si había repetidas se consolidan.
+            first, *extra = rows
+            to_delete.extend(extra)
+            if extra or (first.quantity, first.price, first.subtotal) != (line['quantity'], line['price'], line['subtotal']):
+                first.quantity, first.price, first.subtotal = line['quantity'], line['price'], line['subtotal']
+                to_update.append(first)
+            kept.append(first)
+        for product_id, line in new_lines.items():
+            if product_id not in old_rows:
+                to_create.append(SaleDetail(sale=sale, product_id=product_id, **line))
+
+        if to_delete:
+            SaleDetail.objects.filter(pk__in=[d.pk for d in to_delete]).delete()
+        if to_update:
+            SaleDetail.objects.bulk_update(to_update, ['quantity', 'price', 'subtotal'])
+        if to_create:
+            SaleDetail.objects.bulk_create(to_create)
+
+        SaleEventService().record(sale, SaleEvent.EventType.UPDATED, before=before, details=kept + to_create)
+        return sale
+
 
 class SaleDeleteView(AdminRequiredMixin, DeleteView):
     """Vista para eliminar una venta. Antes de eliminar, restaura el stock de los productos involucrados."""
@@ -323,22 +400,33 @@ class SaleDeleteView(AdminRequiredMixin, DeleteView):
         return context
 
     @transaction.atomic
-    def delete(self, request, *args, **kwargs):
+    def form_valid(self, form):
         """
         Restaura el stock antes de eliminar la venta.
 
-        El bloque @transaction.atomic garantiza que la restauración de stock
-        y la eliminación de la venta ocurren juntas: si falla cualquiera de
-        los dos pasos, toda la operación hace rollback y el estado queda
-        consistente (no queda stock fantasma ni venta huérfana).
+        Desde Django 4, DeleteView.post() pasa por form_valid() y no por
+        delete(): la restauración tiene que vivir aquí para que el
+        formulario de confirmación la ejecute.
+
+        El bloque @transaction.atomic garantiza que la restauración de stock,
+        el evento del outbox y la eliminación de la venta ocurren juntos: si
+        falla cualquiera de los pasos, toda la operación hace rollback y el
+        estado queda consistente (no queda stock fantasma ni venta huérfana).
         """
-        sale = self.get_object()
-        details = SaleDetail.objects.filter(sale=sale)
-        for detail in details:
-            product = detail.product
-            product.stock += detail.quantity
-            product.save()
-        return super().delete(request, *args, **kwargs)
+        sale = self.object
+        before = snapshot_sale(sale)
+        # Devolución en un solo UPDATE (cantidades negativas); respeta
+        # los productos en modo sharded.
+        returned = {}
+        for product_id, quantity, _ in before['lines']:
+            if product_id:
+                returned[product_id] = returned.get(product_id, 0) - quantity
+        decrement_stock(returned, reason=InventoryMovement.Reason.SALE_DELETE, sale_ref=sale.pk)
+        # Product.save() derivaba state del stock: un producto agotado que
+        # recupera unidades vuelve a estar activo.
+        Product.objects.filter(pk__in=returned, stock__gt=0, state=False).update(state=True)
+        SaleEventService().record(sale, SaleEvent.EventType.DELETED, before=before)
+        return super().form_valid(form)
 
 
 @method_decorator(require_http_methods(["GET"]), name='dispatch')
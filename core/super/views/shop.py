@@ -5,7 +5,8 @@ Vistas para la tienda, detalles de productos y gestión de órdenes.
 from django.views.generic import ListView, DetailView
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.db.models import Q
-from core.super.models import Product, Category, Brand, Sale, SaleDetail
+from core.super.models import Product, Sale, SaleDetail
+from core.super.services.catalog_service import get_categories, get_brands
 
 class ShopView(LoginRequiredMixin, ListView):
     """Vista de la tienda con listado de productos."""
@@ -39,8 +40,8 @@ class ShopView(LoginRequiredMixin, ListView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context['title'] = 'Tienda'
-        context['categories'] = Category.objects.all()
-        context['brands'] = Brand.objects.all()
+        context['categories'] = get_categories()
+        context['brands'] = get_brands()
         context['selected_brand'] = self.request.GET.get('brand')
         context['selected_category'] = self.request.GET.get('category')
         context['search_query'] = self.request.GET.get('search', '')
@@ -0,0 +1,100 @@
+/*
+ * Autocompletado para filtros (clientes, vendedores, formas de pago).
+ *
+ * Marcado esperado:
+ *   <div class="autocomplete" data-autocomplete-url="/api/autocompletar/customers/">
+ *     <input type="hidden" name="customer" value="...">      ← lo que se envía
+ *     <input type="text" data-autocomplete-input value="...">  ← lo que se ve
+ *     <ul class="autocomplete-list" hidden></ul>
+ *   </div>
+ *
+ * Pide GET ?q=&page= al endpoint (services/autocomplete_service.py) con
+ * un pequeño retardo mientras se escribe; "Ver más" trae la página
+ * siguiente. Borrar el texto vacía el valor (= "Todos").
+ */
+
+const AUTOCOMPLETE_DELAY_MS = 250;
+
+function initAutocomplete(root) {
+    const url = root.dataset.autocompleteUrl;
+    const hidden = root.querySelector('input[type="hidden"]');
+    const input = root.querySelector('[data-autocomplete-input]');
+    const list = root.querySelector('.autocomplete-list');
+    let timer = null;
+    let term = '';
+    let page = 1;
+    let request = 0;
+
+    function close() {
+        list.hidden = true;
+        list.innerHTML = '';
+    }
+
+    function item(text, className, onSelect) {
+        const li = document.createElement('li');
+        li.textContent = text;
+        if (className) li.className = className;
+        if (onSelect) {
+            // mousedown: se dispara antes del blur del input
+            li.addEventListener('mousedown', (event) => {
+                event.preventDefault();
+                onSelect();
+            });
+        }
+        list.appendChild(li);
+    }
+
+    function load(append) {
+        const current = ++request;
+        const params = new URLSearchParams({ q: term, page: page });
+        fetch(`${url}?${params}`, { headers: { 'X-Requested-With': 'XMLHttpRequest' } })
+            .then((response) => response.json())
+            .then((data) => {
+                if (current !== request) return;  // llegó una respuesta vieja
+                if (!append) list.innerHTML = '';
+                const more = list.querySelector('.autocomplete-more');
+                if (more) more.remove();
+
+                data.results.forEach((result) => item(result.text, '', () => {
+                    hidden.value = result.id;
+                    input.value = result.text;
+                    close();
+                }));
+                if (data.more) {
+                    item('Ver más…', 'autocomplete-more', () => {
+                        page += 1;
+                        load(true);
+                    });
+                }
+                if (!list.children.length) item('Sin resultados', 'autocomplete-empty');
+                list.hidden = false;
+            })
+            .catch(close);
+    }
+
+    function search() {
+        term = input.value.trim();
+        page = 1;
+        load(false);
+    }
+
+    input.addEventListener('input', () => {
+        hidden.value = '';
+        clearTimeout(timer);
+        timer = setTimeout(search, AUTOCOMPLETE_DELAY_MS);
+    });
+    input.addEventListener('focus', () => {
+        if (!input.value) search();
+    });
+    input.addEventListener('blur', () => {
+        if (!hidden.value) input.value = '';
+        close();
+    });
+    input.addEventListener('keydown', (event) => {
+        if (event.key === 'Escape') close();
+    });
+}
+
+document.addEventListener('DOMContentLoaded', () => {
+    document.querySelectorAll('[data-autocomplete-url]').forEach(initAutocomplete);
+});